@@ -4,63 +4,321 @@ import json
 
 from pprint import pprint
 from atexit import register
+from signal import (
+    signal,
+    SIGUSR1,
+)
 from datetime import datetime
 from time import (
     sleep,
     perf_counter,
 )
-from concurrent.futures import ThreadPoolExecutor
 
 from src.interface import parser
-from src.api.rpc import alert_arbitrage
+from src.api.engine import (
+    ScanEngine,
+    admit_batch,
+    record_batch,
+)
+from src.api.rpc import (
+    quote_cache,
+    quote_history,
+    bridge_client,
+    alert_deduplicator,
+)
 from src.api.exceptions import exit_handler
+from src.api.endpoints import (
+    endpoint_urls,
+    pool_size,
+)
+from src.api.shard import ShardCoordinator
+from src.api.cycles import (
+    QuoteGraph,
+    report_cycles,
+)
+from src.api.discovery import (
+    discover_routes,
+    prune_args,
+)
 from src.api.helpers import (
     parse_args,
     print_start_message,
 )
 
+from src.common.logger import (
+    log_error,
+    setup_loggers,
+)
 from src.common.message import telegram_send_msg
-from src.variables import time_format
+from src.common.scheduler import RouteScheduler
+from src.common.reload import (
+    ConfigWatcher,
+    BackgroundReload,
+    apply_routes,
+    warn_restart_settings,
+)
+from src.common.profiler import LoopProfiler
+from src.common.metrics import (
+    loop_duration,
+    loop_routes,
+    start_metrics_server,
+)
+from src.common.breaker import (
+    BreakerRegistry,
+    report_breaker_change,
+)
+from src.common.transport import (
+    configure_transport,
+    transport_stats,
+    warm_up,
+)
+from src.variables import (
+    time_format,
+    telegram_api,
+    project_root_dir,
+)
 
 
-# Parse arguments
-args = parser.parse_args()
+# Shard workers run in child processes that import this file, so only run it as a script
+if __name__ == "__main__":
+    # Parse arguments
+    args = parser.parse_args()
 
+    # Fetch variables
+    with open(args.file, 'r') as file:
+        configs = json.loads(file.read())
 
-# Send telegram debug message if program terminates
-program_name = os.path.abspath(os.path.basename(__file__))
-register(exit_handler, program_name)
+    # Write logs from a background thread, set up before exit handlers so it is stopped after them
+    setup_loggers(**configs['settings'].get('logging', {}))
 
-# Fetch variables
-with open(args.file, 'r') as file:
-    configs = json.loads(file.read())
+    # Send telegram debug message if program terminates
+    program_name = os.path.abspath(os.path.basename(__file__))
+    register(exit_handler, program_name)
 
-timestamp = datetime.now().astimezone().strftime(time_format)
-print(f"{timestamp} - Started Synapse API({configs['settings']['bridge_api']}) Bot")
-pprint(configs)
+    timestamp = datetime.now().astimezone().strftime(time_format)
+    print(f"{timestamp} - Started Synapse API({configs['settings']['bridge_api']}) Bot")
+    pprint(configs)
 
-sleep_time = configs['settings']['sleep_time']
-bridge_api = configs['settings']['bridge_api']
+    bridge_api = endpoint_urls(configs['settings']['bridge_api'])
+    max_in_flight = configs['settings'].get('max_in_flight', 32)
+    cache_settings = configs['settings'].get('quote_cache', {})
+    endpoint_settings = configs['settings'].get('endpoints', {})
+    rate_limit_settings = configs['settings'].get('rate_limit', {})
+    alert_settings = configs['settings'].get('alerts', {})
+    scheduler_settings = configs['settings'].get('scheduler', {})
+    breaker_settings = configs['settings'].get('breaker', {})
+    discovery_settings = configs['settings'].get('discovery', {})
+    history_settings = configs['settings'].get('history', {})
+    metrics_settings = configs['settings'].get('metrics', {})
+    profiling_settings = configs['settings'].get('profiling', {})
+    shard_settings = configs['settings'].get('shards', {})
+    cycle_settings = configs['settings'].get('cycles', {})
+    reload_settings = configs['settings'].get('reload', {})
 
-arguments = parse_args(configs)
-network_configs = len(arguments)
+    arguments = parse_args(configs)
 
-print(f"\nQuerying {bridge_api}\n"
-      f"Screening {network_configs} different network configurations...\n")
-print_start_message(arguments)
+    # Size per-host pools for the requests in flight, and hedged ones, before discovery and the first loop
+    in_flight = min(len(arguments), max_in_flight)
+    configure_transport(pool_size(bridge_api, len(arguments), max_in_flight, endpoint_settings.get('hedge', True)))
 
-telegram_send_msg(f"✅ SYNAPSE_API has started.")
+    quote_cache.configure(ttl=cache_settings.get('ttl', 3), max_size=cache_settings.get('max_size', 4096))
+    # Spread quotes over equivalent bridge apis by latency, hedge slow requests and eject failing endpoints
+    bridge_client.configure(hedge=endpoint_settings.get('hedge', True),
+                            min_samples=endpoint_settings.get('min_samples', 20),
+                            failures=endpoint_settings.get('failures', 5),
+                            eject_time=endpoint_settings.get('eject_time', 30),
+                            max_eject_time=endpoint_settings.get('max_eject_time', 300),
+                            max_workers=2 * max_in_flight,
+                            rate_limit={'max_rate': rate_limit_settings.get('max_rps', 100),
+                                        'min_rate': rate_limit_settings.get('min_rps', 1),
+                                        'burst': rate_limit_settings.get('burst', 0.1),
+                                        'increase': rate_limit_settings.get('increase', 1),
+                                        'decrease': rate_limit_settings.get('decrease', 0.5)})
+    register(bridge_client.close)
 
-loop_counter = 1
-while True:
-    start = perf_counter()
+    # Drop routes Synapse does not support, known ones are read from disk instead of being probed again
+    route_index = discover_routes(arguments, ttl=discovery_settings.get('ttl', 86400), max_workers=in_flight)
+    arguments, unsupported = prune_args(arguments, route_index)
+    network_configs = len(arguments)
 
-    with ThreadPoolExecutor(max_workers=network_configs) as pool:
-        results = pool.map(lambda p: alert_arbitrage(*p), arguments, timeout=20)
+    # Stop polling routes, and chains, that keep failing until a periodic probe succeeds
+    route_breakers = BreakerRegistry(failures=breaker_settings.get('failures', 3),
+                                     backoff=breaker_settings.get('backoff', 30),
+                                     max_backoff=breaker_settings.get('max_backoff', 3600),
+                                     on_change=report_breaker_change("SYNAPSE_API"))
+    chain_breakers = BreakerRegistry(failures=breaker_settings.get('chain_failures', 20),
+                                     backoff=breaker_settings.get('backoff', 30),
+                                     max_backoff=breaker_settings.get('max_backoff', 3600),
+                                     on_change=report_breaker_change("SYNAPSE_API"))
 
-    sleep(sleep_time)
+    print(f"\nQuerying {', '.join(bridge_api)}\n"
+          f"Screening {network_configs} different network configurations, "
+          f"skipping {len(unsupported)} unsupported by Synapse...\n")
+    print_start_message(arguments, route_breakers)
 
-    timestamp = datetime.now().astimezone().strftime(time_format)
-    terminal_mesg = f"{timestamp}: Loop {loop_counter} executed in {(perf_counter() - start):,.2f} secs."
-    print(terminal_mesg)
-    loop_counter += 1
+    # Open connections before the first loop
+    warm_up(list(bridge_api), connections=in_flight)
+    warm_up([telegram_api])
+
+    # Serve latency histograms, error counts and loop timing for Prometheus to scrape
+    if metrics_settings.get('enabled', False):
+        start_metrics_server(port=metrics_settings.get('port', 9101), host=metrics_settings.get('host', '127.0.0.1'))
+
+    alert_deduplicator.configure(cooldown=alert_settings.get('cooldown', 300),
+                                 materiality=alert_settings.get('materiality', 0.2))
+
+    routes = {route.key: route for route in arguments}
+
+    # Apply changes to the config file's routes and alert settings between loops, without restarting
+    watcher = None
+    if reload_settings.get('enabled', True):
+        watcher = ConfigWatcher(args.file, interval=reload_settings.get('interval', 2))
+
+    # Routes missing from the route index are probed on a worker thread, scanning goes on meanwhile
+    reload = BackgroundReload()
+    register(reload.close)
+
+    def discover_new_routes(new_arguments: list) -> dict:
+        new_index = discover_routes(new_arguments, ttl=discovery_settings.get('ttl', 86400), max_workers=in_flight)
+        supported, _ = prune_args(new_arguments, new_index)
+
+        return {route.key: route for route in supported}
+
+    def load_routes() -> dict or None:
+        """
+        Returns the routes of the config file once their discovery finished, if it changed since last checked,
+        and applies its alert settings. Other changed settings are only warned about, they are read at start.
+
+        :return: Dictionary where key-route key, value-route, None if the file did not change or is invalid
+        """
+        # A change made while routes are discovered is read once they are
+        if reload.busy():
+            return None
+        new_routes = reload.result()
+
+        new_configs = watcher.poll() if watcher is not None else None
+        if new_configs is None:
+            return new_routes
+
+        try:
+            new_arguments = parse_args(new_configs)
+        except (KeyError, TypeError, AttributeError) as e:
+            log_error.warning(f"'ConfigError' - {args.file} is not a valid config, keeping the running config: {e}")
+            return new_routes
+
+        new_alert_settings = new_configs['settings'].get('alerts', {})
+        alert_deduplicator.configure(cooldown=new_alert_settings.get('cooldown', 300),
+                                     materiality=new_alert_settings.get('materiality', 0.2))
+        # Routes are built from bridge_api and special_chat, so they apply with the routes
+        warn_restart_settings(args.file, configs['settings'], new_configs['settings'],
+                              reloaded=('alerts', 'bridge_api', 'special_chat'))
+        reload.submit(discover_new_routes, new_arguments)
+
+        return new_routes
+
+    # Look for profitable cycles across routes in the quotes every loop already fetched
+    graph = None
+    if cycle_settings.get('enabled', True):
+        graph = QuoteGraph(max_age=cycle_settings.get('max_age', 60), max_cycles=cycle_settings.get('max_cycles', 5))
+
+    # Split routes across worker processes, this process only evaluates their quotes and sends alerts.
+    # Workers record the quotes they request and profile their loops, SIGUSR1 toggles profiling in all of them
+    if shard_settings.get('workers', 1) > 1:
+        coordinator = ShardCoordinator(routes, configs['settings'], workers=shard_settings['workers'],
+                                       timeout=shard_settings.get('timeout', 60),
+                                       max_backoff=shard_settings.get('max_backoff', 300), graph=graph,
+                                       profile=args.profile or profiling_settings.get('enabled', False))
+        signal(SIGUSR1, coordinator.toggle_profiling)
+        telegram_send_msg(f"✅ SYNAPSE_API has started with {shard_settings['workers']} workers.")
+        # Registered after the Telegram dispatcher starts, so workers are stopped before it is drained
+        register(coordinator.stop)
+        coordinator.run(load_routes)
+
+    # Record every quote requested, written to disk in batches from a background thread
+    if history_settings.get('enabled', True):
+        quote_history.open(f"{project_root_dir}/{history_settings.get('path', 'logs/quotes.db')}",
+                           batch_size=history_settings.get('batch_size', 500),
+                           flush_interval=history_settings.get('flush_interval', 1),
+                           busy_timeout=history_settings.get('busy_timeout', 5))
+        register(quote_history.close)
+
+    engine = ScanEngine(max_in_flight=max_in_flight)
+    register(engine.close)
+
+    # Save stacks and route timings of loops over budget, when started with --profile or sent SIGUSR1
+    profiler = LoopProfiler(budget=profiling_settings.get('budget', 10),
+                            interval=profiling_settings.get('interval', 0.01),
+                            enabled=args.profile or profiling_settings.get('enabled', False))
+    signal(SIGUSR1, profiler.toggle)
+
+    # Poll each route at an interval adapted to its recent arbitrage, within a global request budget
+    scheduler = RouteScheduler(min_interval=scheduler_settings.get('min_interval', 1),
+                               max_interval=scheduler_settings.get('max_interval', 60),
+                               max_rps=scheduler_settings.get('max_rps', 100))
+    for key, route in routes.items():
+        scheduler.add(key, min_arb=route.min_arb, cost=route.cost)
+
+    telegram_send_msg(f"✅ SYNAPSE_API has started.")
+
+    loop_counter = 1
+    while True:
+        # Between loops, so quotes in flight are never interrupted
+        new_routes = load_routes()
+        if new_routes is not None:
+            added, removed, changed = apply_routes(routes, new_routes, scheduler)
+            timestamp = datetime.now().astimezone().strftime(time_format)
+            print(f"{timestamp}: Reloaded {args.file} - {len(added)} routes added, {len(removed)} removed, "
+                  f"{len(changed)} changed.")
+
+        batch = scheduler.next_batch()
+        if not batch:
+            # Wake up in time to check the config file
+            sleep(min(scheduler.wait_time(), watcher.interval) if watcher is not None else scheduler.wait_time())
+            continue
+
+        start = perf_counter()
+
+        # Defer routes whose own or chains' circuit is open until they may be probed
+        allowed = admit_batch(batch, routes, scheduler, route_breakers, chain_breakers)
+        if not allowed:
+            continue
+
+        profiler.start_loop()
+        timings = {} if profiler.enabled else None
+        outputs = engine.run([routes[key] for key in allowed], timings)
+        record_batch(allowed, outputs, routes, scheduler, route_breakers, chain_breakers)
+        results = [report for _, report in outputs]
+        cycles = []
+        if graph is not None:
+            for key, (data, _) in zip(allowed, outputs):
+                graph.update(routes[key], data)
+            cycles = report_cycles(graph, graph.detect())
+        duration = perf_counter() - start
+        loop_duration.observe(duration)
+        loop_routes.set(len(allowed))
+
+        if timings is not None:
+            for index, secs in timings.items():
+                profiler.record_route(allowed[index], secs)
+            profile = profiler.end_loop(loop_counter, duration)
+            if profile:
+                print(f"Loop {loop_counter} took {duration:,.2f} secs, over its {profiler.budget:,} secs budget. "
+                      f"Profile saved to {profile}")
+
+        timestamp = datetime.now().astimezone().strftime(time_format)
+        stats = transport_stats.snapshot()
+        cache_stats = quote_cache.stats()
+        terminal_mesg = f"{timestamp}: Loop {loop_counter} scanned {len(allowed)} routes " \
+                        f"in {duration:,.2f} secs. " \
+                        f"Pool waits: {stats['pool_waits']} ({stats['pool_wait_time']:,.2f} secs), " \
+                        f"connects: {stats['connects']} ({stats['connect_time']:,.2f} secs). " \
+                        f"Cache hits: {cache_stats['hits']}, misses: {cache_stats['misses']}, " \
+                        f"coalesced: {cache_stats['coalesced']}. " \
+                        f"Alerts sent: {sum(1 for r in results if r and r['alerted'])}, " \
+                        f"suppressed: {sum(1 for r in results if r and not r['alerted'])}. " \
+                        f"Cycles: {len(cycles)}. " \
+                        f"Allowed rate: {sum(bridge_client.rates().values()):,.1f} requests per sec. " \
+                        f"Open circuits: {len(route_breakers.tripped())} routes, " \
+                        f"{len(chain_breakers.tripped())} chains."
+        print(terminal_mesg)
+        loop_counter += 1
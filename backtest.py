@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+import sys
+import json
+
+from time import (
+    time,
+    perf_counter,
+)
+from argparse import ArgumentParser
+
+from tabulate import tabulate
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("backtest.py requires numpy, install it with 'poetry install -E backtest'.")
+
+from src.api.helpers import parse_args
+from src.api.backtest import (
+    is_stablecoin,
+    load_polls,
+    replay,
+)
+from src.variables import project_root_dir
+
+
+# Create CLI interface
+parser = ArgumentParser(
+    usage="python3 %(prog)s [-f api.json] [--coin USDC] [--days 7] [--thresholds 10,25] [--ladder 9000,50000]\n",
+    description="Replays quotes recorded by api.py through the same arbitrage selection, threshold and alert "
+                "suppression as the bot. Reports, for a grid of thresholds and amount ladders, how many alerts "
+                "would have fired and how much opportunity was missed.",
+)
+parser.add_argument("-f", "--file", action="store", default="api.json", type=str,
+                    help="Path to 'api.json' file with coins and settings. Default is 'api.json'.")
+parser.add_argument("--db", action="store", default=None, type=str,
+                    help="Path to quote history database. Default is settings.history.path of the file.")
+parser.add_argument("--coin", action="append", default=None, type=str,
+                    help="Coin to replay, can be repeated. Default is all coins of the file.")
+parser.add_argument("--days", action="store", default=None, type=float,
+                    help="Replay only the last number of days. Default is all recorded quotes.")
+parser.add_argument("--thresholds", action="store", default=None, type=str,
+                    help="Comma separated min arbitrages to test. "
+                         "Default is 0.5, 0.75, 1, 1.5 and 2 times each coin's arbitrage.")
+parser.add_argument("--ladder", action="append", default=None, type=str,
+                    help="Comma separated swap amounts to test, can be repeated. "
+                         "Default is all recorded amounts and each coin's swap_amount.")
+parser.add_argument("--profit", action="store", default=0, type=float,
+                    help="Arbitrage a poll's best quote must exceed to count as an opportunity. Default is 0.")
+parser.add_argument("--gap", action="store", default=1, type=float,
+                    help="Max secs between quotes of the same poll. Default is 1.")
+
+
+def ladder_label(ladder: list | None) -> str:
+    if ladder is None:
+        return "recorded"
+
+    return ", ".join(f"{amount / 1000:g}k" if amount >= 1000 else f"{amount:g}" for amount in ladder)
+
+
+args = parser.parse_args()
+
+with open(args.file, 'r') as file:
+    configs = json.loads(file.read())
+
+settings = configs['settings']
+db_path = args.db or f"{project_root_dir}/{settings.get('history', {}).get('path', 'logs/quotes.db')}"
+alert_settings = settings.get('alerts', {})
+start = time() - args.days * 86400 if args.days else None
+
+arguments = parse_args(configs)
+for coin in args.coin or configs['coins']:
+    coin_args = [route for route in arguments if route.coin == coin]
+    if not coin_args:
+        print(f"{coin} is not in {args.file}, skipping.")
+        continue
+
+    min_arb = configs['coins'][coin]['arbitrage']
+    if args.thresholds:
+        thresholds = [float(threshold) for threshold in args.thresholds.split(",")]
+    else:
+        thresholds = [min_arb * scale for scale in (0.5, 0.75, 1, 1.5, 2)]
+
+    if args.ladder:
+        ladders = [[float(amount) for amount in ladder.split(",")] for ladder in args.ladder]
+    else:
+        ladders = [None, [float(amount) for amount in configs['coins'][coin]['swap_amount']]]
+
+    routes = [route.name for route in coin_args]
+    timer = perf_counter()
+    polls = load_polls(db_path, routes, start=start, gap=args.gap)
+    loaded = perf_counter() - timer
+
+    if len(polls['ts']) == 0:
+        print(f"No recorded quotes for {coin} in {db_path}.\n")
+        continue
+
+    timer = perf_counter()
+    results = replay(polls, np.array([is_stablecoin(route) for route in routes]), thresholds, ladders,
+                     cooldown=alert_settings.get('cooldown', 300),
+                     materiality=alert_settings.get('materiality', 0.2), profit=args.profit,
+                     routes_search=np.array([bool(route.search) for route in coin_args]))
+    replayed = perf_counter() - timer
+
+    table = [[f"{result['threshold']:g}", ladder_label(result['ladder']), f"{result['signals']:,}",
+              f"{result['alerts']:,}", f"{result['captured']:,.2f}", f"{result['missed']:,}",
+              f"{result['missed_arb']:,.2f}"]
+             for result in results]
+    columns = ["MinArb", "Ladder", "Signals", "Alerts", "AlertedArb", "Missed", "MissedArb"]
+
+    print(f"\n{coin}: {polls['quotes']:,} quotes in {len(polls['ts']):,} polls "
+          f"over {len(set(polls['route']))} routes, "
+          f"loaded in {loaded:,.2f} secs, replayed in {replayed:,.2f} secs. Configured min arb: {min_arb}.")
+    print(tabulate(table, headers=columns, tablefmt="fancy_grid", stralign="left", disable_numparse=True))
@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+import os
+import json
+import platform
+
+from subprocess import run
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+
+import requests
+from tabulate import tabulate
+
+from src.bench.mock import (
+    MockSettings,
+    start_mock_servers,
+)
+from src.bench.runner import (
+    run_scales,
+    bench_decimals,
+)
+from src.variables import project_root_dir
+
+
+# Create CLI interface
+parser = ArgumentParser(
+    usage="python3 %(prog)s [--routes 10,100,1000] [--loops 5] [--latency 0.05] [--compare logs/bench/old.json]\n",
+    description="Benchmarks the API bot's scan loop against a local mock of the Synapse bridge output api and "
+                "a Telegram stub. Reports loop time, request latency, requests per sec and peak threads and memory "
+                "per number of routes, and saves them to compare across commits.",
+)
+parser.add_argument("--routes", action="store", default="10,100,1000", type=str,
+                    help="Comma separated numbers of routes to scan. Default is 10,100,1000.")
+parser.add_argument("--loops", action="store", default=5, type=int,
+                    help="Number of measured scan loops per number of routes. Default is 5.")
+parser.add_argument("--warmup", action="store", default=1, type=int,
+                    help="Number of scan loops run before measuring. Default is 1.")
+parser.add_argument("--amounts", action="store", default=4, type=int,
+                    help="Number of swap amounts per route. Default is 4.")
+parser.add_argument("--max-in-flight", action="store", default=32, type=int,
+                    help="Max number of quote requests in flight, as settings.max_in_flight. Default is 32.")
+parser.add_argument("--latency", action="store", default=0.05, type=float,
+                    help="Median secs the mock api takes to answer a quote. Default is 0.05.")
+parser.add_argument("--jitter", action="store", default=0.5, type=float,
+                    help="Sigma of the mock api's lognormal latency. Default is 0.5.")
+parser.add_argument("--error-rate", action="store", default=0, type=float,
+                    help="Fraction of quotes the mock api answers with 500. Default is 0.")
+parser.add_argument("--max-rps", action="store", default=0, type=float,
+                    help="Quotes per sec the mock api serves before answering 429. Default is 0, no limit.")
+parser.add_argument("--client-rps", action="store", default=0, type=float,
+                    help="Quotes per sec the bot's rate limiter starts at, as rate_limit.max_rps. "
+                         "Default is 0, no limit.")
+parser.add_argument("--arb-rate", action="store", default=0.05, type=float,
+                    help="Fraction of routes the mock api quotes with arbitrage. Default is 0.05.")
+parser.add_argument("--seed", action="store", default=0, type=int,
+                    help="Seed of the mock api's random latencies, errors and arbitrages. Default is 0.")
+parser.add_argument("-o", "--output", action="store", default=None, type=str,
+                    help="Path to save results to. Default is logs/bench/<time>-<commit>.json.")
+parser.add_argument("--compare", action="store", default=None, type=str,
+                    help="Path of saved results to compare with.")
+
+
+def git_commit() -> str:
+    """
+    Returns the short hash of the checked out commit, with '-dirty' if there are uncommitted changes.
+
+    :return: Commit name, 'unknown' if not in a git repository
+    """
+    commit = run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=project_root_dir)
+    if commit.returncode != 0:
+        return "unknown"
+
+    status = run(["git", "status", "--porcelain", "--untracked-files=no"],
+                 capture_output=True, text=True, cwd=project_root_dir)
+
+    return commit.stdout.strip() + ("-dirty" if status.stdout.strip() else "")
+
+
+def mock_stats(url: str) -> dict:
+    """
+    Returns a mock server's response counters.
+
+    :param url: Url of the mock server
+    :return: Dictionary of counter name and value
+    """
+    return requests.get(f"{url.rsplit('/', 1)[0]}/stats", timeout=10).json()
+
+
+def change(new: float | None, old: float | None) -> str:
+    if not new or not old:
+        return ""
+
+    return f" ({(new - old) / old:+.0%})"
+
+
+# Scans and mock servers run in child processes that import this file, so only run it as a script
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            max_rps=args.max_rps, arb_rate=args.arb_rate, seed=args.seed,
+                            decimals=bench_decimals())
+    process, bridge_api, telegram_api = start_mock_servers(settings)
+    # Scans run in child processes, which read the Telegram api from the environment
+    os.environ["TELEGRAM_API"] = telegram_api
+
+    scales = [int(routes) for routes in args.routes.split(",")]
+    results = []
+    with TemporaryDirectory(prefix="synapse-bench-") as work_dir:
+        for routes in scales:
+            before = mock_stats(bridge_api)
+            result, = run_scales([routes], bridge_api, work_dir, loops=args.loops, warmup=args.warmup,
+                                 amounts=args.amounts, max_in_flight=args.max_in_flight,
+                                 max_rps=args.client_rps)
+            after = mock_stats(bridge_api)
+            result.update({f"status_{status}": after[status] - before.get(status, 0) for status in after})
+            results.append(result)
+            print(f"Scanned {result['routes']} routes in {result['loop_time']:,.3f} secs per loop.")
+
+    telegram_messages = mock_stats(f"{telegram_api}/stats").get('messages', 0)
+    process.terminate()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = {result['routes']: result for result in json.loads(file.read())['results']}
+
+    table = []
+    for result in results:
+        old = baseline.get(result['routes'], {})
+        table.append([
+            f"{result['routes']:,}",
+            f"{result['loop_time']:,.3f}{change(result['loop_time'], old.get('loop_time'))}",
+            f"{result['p50'] * 1000:,.1f}{change(result['p50'], old.get('p50'))}",
+            f"{result['p99'] * 1000:,.1f}{change(result['p99'], old.get('p99'))}",
+            f"{result['rps']:,.0f}{change(result['rps'], old.get('rps'))}",
+            f"{result['requests']:,}",
+            f"{result.get('status_429', 0):,}/{result.get('status_500', 0):,}",
+            f"{result['signals']:,}/{result['alerts']:,}",
+            f"{result['peak_threads']}{change(result['peak_threads'], old.get('peak_threads'))}",
+            f"{result['peak_memory']:,.1f}{change(result['peak_memory'], old.get('peak_memory'))}",
+        ])
+    columns = ["Routes", "Loop(s)", "p50(ms)", "p99(ms)", "Req/s", "Requests", "429/500", "Signals/Alerts",
+               "Threads", "Memory(MB)"]
+
+    commit = git_commit()
+    print(f"\nCommit {commit}, {args.loops} loops per scale, mock latency {args.latency * 1000:g} ms. "
+          f"Telegram messages sent: {telegram_messages}.")
+    if baseline:
+        print(f"Changes are against {args.compare}.")
+    print(tabulate(table, headers=columns, tablefmt="fancy_grid", stralign="left", disable_numparse=True))
+
+    output = args.output or f"{project_root_dir}/logs/bench/{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        file.write(json.dumps({
+            "commit": commit,
+            "time": datetime.now().astimezone().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "results": results,
+        }, indent=1))
+    print(f"Results saved to {output}")
@@ -0,0 +1,212 @@
+"""
+Vectorised replay of recorded quotes through the same decisions as the scan engine, for threshold tuning.
+"""
+import numpy as np
+
+from typing import List
+
+from src.common.history import query_quotes
+from src.variables import stablecoins
+
+
+def load_polls(path: str, routes: List[str], start: float | None = None, end: float | None = None,
+               gap: float = 1) -> dict:
+    """
+    Loads recorded quotes of routes and groups them into polls. Quotes of a route less than gap secs apart
+    belong to the same poll.
+
+    :param path: Path of the quote history database
+    :param routes: History route names to load
+    :param start: Unix time to load quotes from
+    :param end: Unix time to load quotes until
+    :param gap: Max secs between quotes of the same poll
+    :return: Dictionary with
+        route - poll route index into routes, shape (polls,)
+        ts - poll start time, shape (polls,)
+        amounts - amounts quoted per poll in ascending order, NaN padded, shape (polls, max amounts per poll)
+        arbs - arbitrage of each amount, NaN if padded or quote failed, same shape as amounts
+        quotes - number of quotes loaded
+    """
+    route_index, ts, amount_in, amount_out = [], [], [], []
+    for index, route in enumerate(routes):
+        rows = query_quotes(path, route, start, end)
+        if not rows:
+            continue
+        _, route_ts, route_in, route_out, _ = zip(*rows)
+        route_index.append(np.full(len(rows), index))
+        ts.append(np.array(route_ts, dtype=float))
+        amount_in.append(np.array(route_in, dtype=float))
+        amount_out.append(np.array(route_out, dtype=float))
+
+    if not ts:
+        empty = np.empty((0, 0))
+        return {"route": np.empty(0, dtype=int), "ts": np.empty(0), "amounts": empty, "arbs": empty, "quotes": 0}
+
+    route_index = np.concatenate(route_index)
+    ts = np.concatenate(ts)
+    amount_in = np.concatenate(amount_in)
+    arb = np.concatenate(amount_out) - amount_in
+
+    # Quotes come ordered by route and time, a poll starts at a new route or after a gap
+    new_poll = np.ones(len(ts), dtype=bool)
+    new_poll[1:] = (route_index[1:] != route_index[:-1]) | (np.diff(ts) > gap)
+    poll = np.cumsum(new_poll) - 1
+    starts = np.flatnonzero(new_poll)
+
+    # Order quotes by amount within each poll and place them in one row per poll
+    order = np.lexsort((amount_in, poll))
+    poll, amount_in, arb = poll[order], amount_in[order], arb[order]
+    column = np.arange(len(poll)) - starts[poll]
+
+    amounts = np.full((len(starts), column.max() + 1), np.nan)
+    arbs = np.full(amounts.shape, np.nan)
+    amounts[poll, column] = amount_in
+    arbs[poll, column] = arb
+
+    return {"route": route_index[starts], "ts": ts[starts], "amounts": amounts, "arbs": arbs, "quotes": len(ts)}
+
+
+def ladder_arbs(amounts: np.ndarray, arbs: np.ndarray, ladder: List[float] | None = None,
+                search: np.ndarray | None = None) -> np.ndarray:
+    """
+    Returns each poll's arbitrages in the order ScanEngine.scan_route would have seen them.
+    Without a ladder all quoted amounts are used, the first failed quote ends the poll as collect_arbs does,
+    unless its route searches, a search skips failed quotes.
+    With a ladder only its amounts are used and the first failed or missing one ends the poll, as collect_arbs does.
+
+    :param amounts: Amounts quoted, output of load_polls
+    :param arbs: Arbitrage of each amount, output of load_polls
+    :param ladder: List of swap amounts, None for all quoted amounts
+    :param search: True for each poll of a route searching for its optimal amount, None if none does.
+                   Only used without a ladder
+    :return: Arbitrages, valid ones first in each row, NaN padded, shape (polls, amounts)
+    """
+    if ladder is not None:
+        arbs = np.stack([np.where(np.isclose(amounts, amount), arbs, -np.inf).max(axis=1, initial=-np.inf)
+                         for amount in ladder], axis=1)
+        arbs[np.isneginf(arbs)] = np.nan
+        arbs[np.cumsum(np.isnan(arbs), axis=1) > 0] = np.nan
+    else:
+        ended = np.cumsum(np.isnan(arbs), axis=1) > 0
+        if search is not None:
+            ended &= ~search[:, None]
+        arbs = np.where(ended, np.nan, arbs)
+
+    # Move NaNs to the end of each row, keeping the order of valid arbitrages
+    order = np.argsort(np.isnan(arbs), axis=1, kind="stable")
+
+    return np.take_along_axis(arbs, order, axis=1)
+
+
+def select_arbs(arbs: np.ndarray, stable: np.ndarray, min_diff: float = 5) -> np.ndarray:
+    """
+    Vectorised select_arb: check_max_arb for stablecoin routes, max arbitrage otherwise.
+
+    :param arbs: Output of ladder_arbs
+    :param stable: True for each poll of a stablecoin route, shape (polls,)
+    :param min_diff: Minimum difference between swaps, as check_max_arb
+    :return: Selected arbitrage of each poll, NaN if it had no valid quote
+    """
+    polls, columns = arbs.shape
+    valid = ~np.isnan(arbs)
+    max_arb = np.where(valid, arbs, -np.inf).max(axis=1, initial=-np.inf)
+
+    # check_max_arb takes the last arbitrage that jumped by more than min_diff from the previous one
+    jumps = (arbs[:, 1:] - arbs[:, :-1]) > min_diff
+    last_jump = np.where(jumps, np.arange(1, columns), 0).max(axis=1, initial=0)
+    curr_arb = arbs[np.arange(polls), last_jump]
+    checked = np.where(max_arb - curr_arb > 2 * min_diff, max_arb, curr_arb)
+
+    selected = np.where(stable, checked, max_arb)
+    selected[~valid.any(axis=1)] = np.nan
+
+    return selected
+
+
+def count_alerts(route: np.ndarray, ts: np.ndarray, arb: np.ndarray, threshold: float,
+                 cooldown: float = 300, materiality: float = 0.2) -> np.ndarray:
+    """
+    Returns which polls would have sent an alert, applying AlertDeduplicator's cooldown and materiality.
+
+    :param route: Poll route index
+    :param ts: Poll start time
+    :param arb: Selected arbitrage of each poll
+    :param threshold: Min arbitrage to alert for
+    :param cooldown: Secs an unchanged arbitrage is suppressed for, 0 disables suppression
+    :param materiality: Fraction of threshold the arbitrage must move by to be re-alerted
+    :return: True for each poll that alerted
+    """
+    signals = arb >= threshold
+    if cooldown <= 0:
+        return signals
+
+    step = materiality * threshold
+    ids = np.round(arb / step) if step > 0 else arb
+
+    # Only polls above threshold are replayed one by one, they are few compared to all polls
+    alerts = np.zeros(len(arb), dtype=bool)
+    last_sent = {}
+    for index in np.flatnonzero(signals)[np.argsort(ts[signals], kind="stable")]:
+        key = (route[index], ids[index])
+        if key not in last_sent or ts[index] - last_sent[key] >= cooldown:
+            last_sent[key] = ts[index]
+            alerts[index] = True
+
+    return alerts
+
+
+def replay(polls: dict, routes_stable: np.ndarray, thresholds: List[float], ladders: List[list | None],
+           cooldown: float = 300, materiality: float = 0.2, profit: float = 0,
+           routes_search: np.ndarray | None = None) -> List[dict]:
+    """
+    Replays polls for every threshold and amount ladder.
+
+    :param polls: Output of load_polls
+    :param routes_stable: True for each route swapping a stablecoin, indexed as polls['route']
+    :param thresholds: List of min arbitrages to alert for
+    :param ladders: List of amount ladders, None for all quoted amounts
+    :param cooldown: Secs an unchanged arbitrage is suppressed for
+    :param materiality: Fraction of threshold the arbitrage must move by to be re-alerted
+    :param profit: Arbitrage a poll's best quote must exceed to count as an opportunity
+    :param routes_search: True for each route searching for its optimal amount, indexed as polls['route'],
+                          None if none does. Their recorded quotes take the max arbitrage, as
+                          ScanEngine.search_route does
+    :return: List of result dictionaries, one per threshold and ladder
+    """
+    stable = routes_stable[polls['route']]
+    search = None if routes_search is None else routes_search[polls['route']]
+    # A ladder quotes its amounts as collect_arbs does, so select_arb applies whether the route searches or not
+    recorded_stable = stable if search is None else stable & ~search
+    best = np.where(np.isnan(polls['arbs']), -np.inf, polls['arbs']).max(axis=1, initial=-np.inf)
+    opportunity = best > profit
+
+    results = []
+    for ladder in ladders:
+        selected = select_arbs(ladder_arbs(polls['amounts'], polls['arbs'], ladder, search),
+                               recorded_stable if ladder is None else stable)
+        for threshold in thresholds:
+            signals = selected >= threshold
+            alerts = count_alerts(polls['route'], polls['ts'], selected, threshold, cooldown, materiality)
+            missed = opportunity & ~signals
+            results.append({
+                "threshold": threshold,
+                "ladder": ladder,
+                "polls": len(selected),
+                "signals": int(signals.sum()),
+                "alerts": int(alerts.sum()),
+                "captured": float(selected[alerts].sum()),
+                "missed": int(missed.sum()),
+                "missed_arb": float(best[missed].sum()),
+            })
+
+    return results
+
+
+def is_stablecoin(route: str) -> bool:
+    """
+    Returns True if a history route swaps a stablecoin in, as select_arb checks.
+
+    :param route: History route name
+    :return: True if stablecoin
+    """
+    return route.split(":")[0] in stablecoins
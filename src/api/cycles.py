@@ -0,0 +1,244 @@
+"""
+Finds profitable multi-hop cycles, eg. USDC Ethereum -> Optimism -> Base -> Ethereum, in the quotes the scan
+already fetched. Every route's latest quote is an edge between (chain, token) nodes weighted by its log
+exchange rate, so a profitable cycle is a cycle of negative total weight.
+"""
+from math import (
+    exp,
+    log,
+)
+from time import monotonic
+from datetime import datetime
+from collections import deque
+
+from src.api.rpc import alert_deduplicator
+from src.api.route import Route
+from src.common.logger import log_arbitrage
+from src.common.message import telegram_enqueue_msg
+from src.variables import (
+    time_format,
+    get_env,
+)
+
+
+class Edge:
+    __slots__ = ("weight", "amount_in", "amount_out", "min_arb", "coin", "updated")
+
+    def __init__(self, weight: float, amount_in: float, amount_out: float, min_arb: float, coin: str,
+                 updated: float):
+        self.weight = weight
+        self.amount_in = amount_in
+        self.amount_out = amount_out
+        self.min_arb = min_arb
+        self.coin = coin
+        self.updated = updated
+
+
+class QuoteGraph:
+    """
+    Directed graph of the latest quote of every route, updated as quotes arrive.
+
+    Only an edge that got cheaper, or is new, can close a new negative cycle, so detection runs SPFA
+    (queue based Bellman-Ford) from the origin nodes of such edges only, instead of from every node.
+    """
+
+    def __init__(self, max_age: float = 60, max_cycles: int = 5, tolerance: float = 1e-9):
+        """
+        :param max_age: Secs after which an edge's quote is too old to trade on and is dropped
+        :param max_cycles: Max number of cycles returned per detection
+        :param tolerance: Min weight improvement that counts as a relaxation, so cycles of rate 1 are ignored
+        """
+        self.max_age = max_age
+        self.max_cycles = max_cycles
+        self.tolerance = tolerance
+        self.edges = {}
+        self.dirty = set()
+
+    def __len__(self) -> int:
+        return sum(len(edges) for edges in self.edges.values())
+
+    def update(self, route: Route, data: tuple or None) -> None:
+        """
+        Sets a route's edge to its latest quote, or drops the edge if the quote failed.
+
+        :param route: Route quoted
+        :param data: Tuple of max_arb & (amount_in, amount_out)
+        """
+        node_in = (route.name_in, route.token_in)
+        node_out = (route.name_out, route.token_out)
+
+        if not data or data[1][0] <= 0 or data[1][1] <= 0:
+            self.edges.get(node_in, {}).pop(node_out, None)
+            return
+
+        amount_in, amount_out = data[1]
+        weight = -log(amount_out / amount_in)
+        edges = self.edges.setdefault(node_in, {})
+        edge = edges.get(node_out)
+        if edge is None or weight < edge.weight - self.tolerance:
+            self.dirty.add(node_in)
+
+        edges[node_out] = Edge(weight, amount_in, amount_out, route.min_arb, route.coin, monotonic())
+
+    def expire(self) -> None:
+        """Drops edges whose quote is older than max_age secs."""
+        oldest = monotonic() - self.max_age
+        for node, edges in self.edges.items():
+            for node_out in [node_out for node_out, edge in edges.items() if edge.updated < oldest]:
+                del edges[node_out]
+
+    def find_cycle(self, sources: set, excluded: set) -> list or None:
+        """
+        Runs SPFA from sources as if from a virtual source with a zero weight edge to each of them.
+
+        :param sources: Nodes to start from
+        :param excluded: Edges (node_in, node_out) to ignore
+        :return: List of nodes of a negative cycle, first node repeated last, None if there is none
+        """
+        nodes = len(self.edges.keys() | {node for edges in self.edges.values() for node in edges})
+        distance = {node: 0.0 for node in sources}
+        hops = {node: 0 for node in sources}
+        previous = {}
+        queue = deque(sources)
+        queued = set(sources)
+
+        while queue:
+            node = queue.popleft()
+            queued.discard(node)
+            for node_out, edge in self.edges.get(node, {}).items():
+                if (node, node_out) in excluded:
+                    continue
+
+                candidate = distance[node] + edge.weight
+                if candidate < distance.get(node_out, float("inf")) - self.tolerance:
+                    distance[node_out] = candidate
+                    previous[node_out] = node
+                    hops[node_out] = hops[node] + 1
+
+                    # A shortest path with as many hops as nodes repeats a node, so it runs through a cycle
+                    if hops[node_out] >= nodes:
+                        cycle = self.trace_cycle(node_out, previous)
+                        if cycle is not None:
+                            return cycle
+
+                    if node_out not in queued:
+                        queue.append(node_out)
+                        queued.add(node_out)
+
+        return None
+
+    @staticmethod
+    def trace_cycle(node: tuple, previous: dict) -> list or None:
+        """
+        Walks back from a node along the nodes each was last relaxed from, looking for a cycle.
+
+        :param node: Node to walk back from
+        :param previous: Dictionary where key-node, value-node it was last relaxed from
+        :return: List of nodes of the cycle in trading order, first node repeated last, None if the walk ends
+        """
+        seen = []
+        positions = {}
+        while node not in positions:
+            if node not in previous:
+                return None
+            positions[node] = len(seen)
+            seen.append(node)
+            node = previous[node]
+
+        cycle = seen[positions[node]:] + [node]
+        cycle.reverse()
+
+        return cycle
+
+    def detect(self) -> list:
+        """
+        Finds negative cycles through the edges updated since the last detection.
+
+        :return: List of cycles, each a list of nodes with the first node repeated last
+        """
+        if self.max_age > 0:
+            self.expire()
+
+        sources = {node for node in self.dirty if self.edges.get(node)}
+        self.dirty = set()
+        if not sources:
+            return []
+
+        cycles, excluded = [], set()
+        while len(cycles) < self.max_cycles:
+            cycle = self.find_cycle(sources, excluded)
+            if cycle is None:
+                break
+            cycles.append(cycle)
+            # Search again without the cycle's weakest edge, to surface other cycles
+            hops = list(zip(cycle, cycle[1:]))
+            excluded.add(max(hops, key=lambda hop: self.edges[hop[0]][hop[1]].weight))
+
+        return cycles
+
+    def cycle_edges(self, cycle: list) -> list:
+        return [self.edges[node_in][node_out] for node_in, node_out in zip(cycle, cycle[1:])]
+
+
+def rotate_cycle(cycle: list) -> list:
+    """
+    Rotates a cycle to start at its smallest node, so the same cycle found from different nodes is equal.
+
+    :param cycle: List of nodes with the first node repeated last
+    :return: Rotated cycle, first node repeated last
+    """
+    nodes = cycle[:-1]
+    start = nodes.index(min(nodes))
+    nodes = nodes[start:] + nodes[:start]
+
+    return nodes + nodes[:1]
+
+
+def report_cycles(graph: QuoteGraph, cycles: list) -> list:
+    """
+    Alerts every cycle whose estimated profit >= the highest min_arb of its routes, and returns a dict
+    of each cycle like report_arbitrage does for routes. Cycles that earn no more than their best hop alone
+    are skipped, that hop is already alerted as a route.
+
+    The profit is estimated by trading the first hop's quoted amount through every hop's quoted rate,
+    so it is indicative only when the hops were quoted at similar amounts.
+
+    :param graph: Graph the cycles were found in
+    :param cycles: Output of QuoteGraph.detect
+    :return: List of dictionaries with id and message, one per cycle over its min_arb
+    """
+    reports = []
+    for cycle in cycles:
+        cycle = rotate_cycle(cycle)
+        edges = graph.cycle_edges(cycle)
+        rate = exp(-sum(edge.weight for edge in edges))
+        amount_in = edges[0].amount_in
+        profit = amount_in * (rate - 1)
+        min_arb = max(edge.min_arb for edge in edges)
+        coin = edges[0].coin
+        best_hop = max(edge.amount_out - edge.amount_in for edge in edges)
+        if profit < min_arb or profit <= best_hop:
+            continue
+
+        timestamp = datetime.now().astimezone().strftime(time_format)
+        path = " -> ".join(f"{token} {chain}" for chain, token in cycle)
+        message = f"{timestamp} - Synapse API\n" \
+                  f"Cycle {path}\n" \
+                  f"--->Profit: <a href='https://synapseprotocol.com'>{profit:,.2f} {cycle[0][1]}</a> " \
+                  f"({rate - 1:.3%}) on {amount_in:,} {cycle[0][1]}"
+        ter_msg = f"Cycle {path}; --->Profit: {profit:,.2f} {cycle[0][1]} ({rate - 1:.3%}) on {amount_in:,}"
+        extra = {"route": f"{coin}:{'->'.join(chain for chain, _ in cycle)}", "amount": amount_in}
+
+        dedupe_id = alert_deduplicator.arb_id(path, "cycle", coin, profit, min_arb)
+        alerted = alert_deduplicator.should_alert(dedupe_id)
+        if alerted:
+            telegram_enqueue_msg(message, telegram_chat_id=get_env("CHAT_ID_ALERTS"))
+            log_arbitrage.info(ter_msg, extra=extra)
+            print(ter_msg)
+        else:
+            log_arbitrage.debug(f"Suppressed: {ter_msg}", extra=extra)
+
+        reports.append({"id": dedupe_id, "message": message, "alerted": alerted, "cycle": cycle,
+                        "profit": profit, "coin": coin})
+
+    return reports
@@ -0,0 +1,83 @@
+"""
+Suppresses repeated Telegram alerts for an arbitrage that has not materially changed.
+"""
+from time import monotonic
+from threading import Lock
+from collections import OrderedDict
+
+from src.api.helpers import hash_arb_data
+
+
+class AlertDeduplicator:
+    """
+    Bounded store of recently alerted arbitrage ids. An id is the hash of the route and the arbitrage
+    rounded to a step of materiality * min_arb, so an opportunity is re-alerted only when it moves
+    by a material amount or once cooldown secs have passed since it was last sent.
+    """
+
+    def __init__(self, cooldown: float = 300, materiality: float = 0.2, max_size: int = 10_000):
+        """
+        :param cooldown: Secs to suppress an unchanged arbitrage for, 0 disables suppression
+        :param materiality: Fraction of a route's min_arb the arbitrage must move by to be re-alerted
+        :param max_size: Max number of ids held, oldest are evicted first
+        """
+        self.cooldown = cooldown
+        self.materiality = materiality
+        self.max_size = max_size
+        self.lock = Lock()
+        self.sent = OrderedDict()
+        self.suppressed = 0
+
+    def configure(self, cooldown: float, materiality: float) -> None:
+        """
+        Updates suppression settings.
+
+        :param cooldown: Secs to suppress an unchanged arbitrage for
+        :param materiality: Fraction of a route's min_arb the arbitrage must move by to be re-alerted
+        """
+        with self.lock:
+            self.cooldown = cooldown
+            self.materiality = materiality
+
+    def arb_id(self, network_in: str, network_out: str, coin: str, arbitrage: float, min_arb: float) -> str:
+        """
+        Returns the id of an arbitrage, equal for arbitrages within the same materiality step.
+
+        :param network_in: Network sending from
+        :param network_out: Network sending to
+        :param coin: Token name
+        :param arbitrage: Arbitrage amount
+        :param min_arb: Min required arbitrage of the route
+        :return: String of hashed data
+        """
+        step = self.materiality * min_arb
+        if step > 0:
+            arbitrage = arbitrage / step
+
+        return hash_arb_data(f"{coin}{network_in}", network_out, arbitrage)
+
+    def should_alert(self, arb_id: str) -> bool:
+        """
+        Returns True if arb_id has not been alerted within cooldown secs and records it as sent.
+
+        :param arb_id: Id returned by arb_id
+        :return: True if alert should be sent
+        """
+        if self.cooldown <= 0:
+            return True
+
+        now = monotonic()
+        with self.lock:
+            # Evict ids whose cooldown has passed, the oldest are always first
+            while self.sent and next(iter(self.sent.values())) <= now - self.cooldown:
+                self.sent.popitem(last=False)
+
+            if arb_id in self.sent:
+                self.suppressed += 1
+                return False
+
+            self.sent[arb_id] = now
+            while len(self.sent) > self.max_size:
+                self.sent.popitem(last=False)
+
+            return True
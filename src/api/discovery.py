@@ -0,0 +1,169 @@
+"""
+Discovers which routes of the scan plan Synapse supports, so unsupported ones are never polled.
+"""
+import os
+import json
+
+from time import time
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from json.decoder import JSONDecodeError
+
+from requests.exceptions import RequestException
+
+from src.api.rpc import (
+    bridge_client,
+    get_token_networks,
+)
+from src.api.route import Route
+from src.common.logger import log_error
+from src.variables import project_root_dir
+
+
+routes_cache_path = f"{project_root_dir}/logs/routes.json"
+
+
+def load_route_index(bridge_api: list, ttl: float, path: str = routes_cache_path) -> dict:
+    """
+    Loads the supported-route index from disk, skipping entries older than ttl secs.
+
+    :param bridge_api: Synapse bridge output apis the index was built for
+    :param ttl: Secs a discovered route is trusted for
+    :param path: Path of the index file
+    :return: Dictionary where key-discovery key, value-(supported, unix time checked)
+    """
+    try:
+        with open(path, 'r') as file:
+            cache = json.loads(file.read())
+    except (OSError, ValueError):
+        return {}
+
+    if cache.get('bridge_api') != bridge_api:
+        return {}
+
+    now = time()
+    return {key: (supported, checked) for key, (supported, checked) in cache.get('routes', {}).items()
+            if now - checked < ttl}
+
+
+def save_route_index(bridge_api: list, index: dict, path: str = routes_cache_path) -> None:
+    """
+    Writes the supported-route index to disk, replacing the old file atomically.
+
+    :param bridge_api: Synapse bridge output apis the index was built for
+    :param index: Dictionary where key-discovery key, value-(supported, unix time checked)
+    :param path: Path of the index file
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'w') as file:
+            file.write(json.dumps({'bridge_api': bridge_api, 'routes': index}, indent=1))
+        os.replace(temp_path, path)
+    except OSError as e:
+        log_error.warning(f"'DiscoveryError' - Could not save route index to {path}: {e}")
+
+
+def token_chain_ids(coin: str) -> set or None:
+    """
+    Returns the chain ids Synapse lists for a token.
+
+    :param coin: Token symbol, eg. USDC
+    :return: Set of chain ids, None if the token networks api is unavailable
+    """
+    try:
+        networks = get_token_networks(coin)
+        return {int(network['chainId']) for network in networks}
+    except (RequestException, JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def probe_route(route: Route, timeout: float = 10) -> bool or None:
+    """
+    Quotes a route's smallest swap amount once to find out whether Synapse supports it.
+
+    :param route: Route to probe
+    :param timeout: Max number of secs to wait for the request
+    :return: True if supported, False if the api rejects the route, None if the api could not be reached
+    """
+    payload, _ = route.query(min(route.amounts))
+
+    try:
+        response = bridge_client.get(route.bridge_api, payload, timeout)
+        message = response.json()
+    except (RequestException, JSONDecodeError):
+        return None
+
+    # Server errors say nothing about the route, so it is probed again on next start
+    if response.status_code >= 500:
+        return None
+
+    try:
+        return int(message['amountToReceive']) > 0
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def discover_routes(routes: List[Route], ttl: float = 86400, max_workers: int = 32,
+                    timeout: float = 10, path: str = routes_cache_path) -> dict:
+    """
+    Builds the supported-route index of a scan plan. Routes are looked up in the index on disk first,
+    then in the token networks api, and the rest are probed once, concurrently.
+    Routes whose support could not be determined are left out of the index, so they are kept and re-checked.
+
+    :param routes: List of routes. Output of func parse_args
+    :param ttl: Secs a discovered route is trusted for, 0 always re-discovers
+    :param max_workers: Max number of concurrent probes
+    :param timeout: Max number of secs to wait per request
+    :param path: Path of the index file
+    :return: Dictionary where key-discovery key, value-True if route is supported
+    """
+    if not routes:
+        return {}
+
+    bridge_api = list(routes[0].bridge_api)
+    index = load_route_index(bridge_api, ttl, path) if ttl > 0 else {}
+
+    unknown = [route for route in routes if route.discovery_key not in index]
+    chain_ids = {coin: token_chain_ids(coin) for coin in {route.coin for route in unknown}}
+
+    now = time()
+    to_probe = []
+    for route in unknown:
+        chains = chain_ids[route.coin]
+        if chains is None:
+            to_probe.append(route)
+        else:
+            index[route.discovery_key] = (route.chain_id_in in chains and route.chain_id_out in chains, now)
+
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="discovery") as executor:
+            probes = list(executor.map(lambda route: probe_route(route, timeout), to_probe))
+
+        now = time()
+        for route, supported in zip(to_probe, probes):
+            if supported is not None:
+                index[route.discovery_key] = (supported, now)
+
+    if ttl > 0:
+        save_route_index(bridge_api, index, path)
+
+    return {key: supported for key, (supported, _) in index.items()}
+
+
+def prune_args(routes: List[Route], index: dict) -> tuple:
+    """
+    Splits a scan plan into supported routes and routes the index marks as unsupported.
+
+    :param routes: List of routes. Output of func parse_args
+    :param index: Output of func discover_routes
+    :return: Tuple of (supported routes, unsupported routes)
+    """
+    supported, unsupported = [], []
+    for route in routes:
+        if index.get(route.discovery_key, True):
+            supported.append(route)
+        else:
+            unsupported.append(route)
+
+    return supported, unsupported
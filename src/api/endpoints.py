@@ -0,0 +1,342 @@
+"""
+Client for a set of equivalent bridge api endpoints. Requests go to the endpoint with the lowest latency for
+its load, are hedged to a second endpoint when slower than usual and endpoints that keep failing are ejected.
+Requests to each endpoint are paced by a rate limiter that adapts to the endpoint's 429s.
+"""
+from time import (
+    monotonic,
+    perf_counter,
+)
+from threading import Lock
+from datetime import (
+    datetime,
+    timezone,
+)
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+from requests import Response
+from requests.exceptions import RequestException
+
+from src.common.logger import log_error
+from src.common.ratelimit import AdaptiveRateLimiter
+from src.common.transport import get_session
+from src.common.metrics import (
+    hedges,
+    ejections,
+    endpoint_rate,
+    endpoint_latency,
+)
+
+
+class RateLimited(RequestException):
+    """An endpoint answered 429."""
+
+
+class RateLimitTimeout(RequestException):
+    """An endpoint's own rate limit leaves no time to send a request within its timeout."""
+
+
+def endpoint_urls(bridge_api: str or list) -> tuple:
+    """
+    Returns the endpoints of a bridge_api setting.
+
+    :param bridge_api: Url of the bridge output api, or list of urls of equivalent ones
+    :return: Tuple of urls
+    """
+    return (bridge_api,) if isinstance(bridge_api, str) else tuple(bridge_api)
+
+
+def pool_size(urls: tuple, routes: int, max_in_flight: int, hedge: bool) -> int:
+    """
+    Returns the number of connections per host a scan can have open at once. Each request in flight needs one,
+    and across several endpoints hedged requests, and hedges still in flight after the other answered,
+    run on up to 2 * max_in_flight hedge threads on top of requests sent directly.
+
+    :param urls: Urls of equivalent endpoints
+    :param routes: Number of routes scanned
+    :param max_in_flight: Max number of quote requests in flight
+    :param hedge: Requests are hedged
+    :return: Per-host connection pool size
+    """
+    size = min(routes, max_in_flight)
+    if len(urls) > 1 and hedge:
+        size += 2 * max_in_flight
+
+    return size
+
+
+def retry_after(response: Response) -> float or None:
+    """
+    Returns the secs a response's Retry-After header asks to wait for, given in secs or as an HTTP date.
+
+    :param response: Response to read
+    :return: Secs to wait for, None if not given or invalid
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class Endpoint:
+    """Latency and health of a single endpoint."""
+
+    __slots__ = ("url", "limiter", "samples", "latency", "p95", "in_flight", "failures", "ejections",
+                 "ejected_until")
+
+    def __init__(self, url: str, window: int, limiter: AdaptiveRateLimiter):
+        self.url = url
+        self.limiter = limiter
+        # Latencies of recent successful requests, their moving average and 95th percentile
+        self.samples = deque(maxlen=window)
+        self.latency = 0.0
+        self.p95 = None
+        self.in_flight = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+
+class BridgeClient:
+    """
+    Sends each request to the healthy endpoint with the lowest moving average latency times requests in flight,
+    so faster endpoints take more of the load. A request still unanswered after its endpoint's p95 latency is
+    sent again to the next best endpoint and whichever answers first wins, a request that failed is sent there
+    straight away.
+
+    An endpoint that fails `failures` times in a row is ejected for eject_time secs, doubled every time it fails
+    again on return, up to max_eject_time. If all endpoints are ejected the one returning first is still used.
+    A 429 is not a failure, it slows down the endpoint's rate limiter and the request fails over.
+    """
+
+    def __init__(self, hedge: bool = True, min_samples: int = 20, window: int = 200, failures: int = 5,
+                 eject_time: float = 30, max_eject_time: float = 300, smoothing: float = 0.2, max_workers: int = 64,
+                 rate_limit: dict | None = None):
+        """
+        :param hedge: Hedge requests slower than their endpoint's p95 latency
+        :param min_samples: Number of requests an endpoint must have answered before its requests are hedged
+        :param window: Number of recent latencies an endpoint's p95 is taken from
+        :param failures: Consecutive failures that eject an endpoint
+        :param eject_time: Secs an endpoint is first ejected for
+        :param max_eject_time: Max secs an endpoint is ejected for
+        :param smoothing: Weight of the latest latency in an endpoint's moving average
+        :param max_workers: Max number of threads sending hedged requests
+        :param rate_limit: Keyword arguments of each endpoint's AdaptiveRateLimiter
+        """
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self.window = window
+        self.failures = failures
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self.smoothing = smoothing
+        self.max_workers = max_workers
+        self.rate_limit = rate_limit or {}
+        self.lock = Lock()
+        self.endpoints = {}
+        self.executor = None
+
+    def configure(self, hedge: bool, min_samples: int, failures: int, eject_time: float, max_eject_time: float,
+                  max_workers: int, rate_limit: dict) -> None:
+        """
+        Updates client settings and the rate limits of endpoints already requested,
+        must be called before the first hedged request to change max_workers.
+        """
+        with self.lock:
+            self.hedge = hedge
+            self.min_samples = min_samples
+            self.failures = failures
+            self.eject_time = eject_time
+            self.max_eject_time = max_eject_time
+            self.max_workers = max_workers
+            self.rate_limit = rate_limit
+            for endpoint in self.endpoints.values():
+                endpoint.limiter.configure(**rate_limit)
+
+    def endpoint(self, url: str) -> Endpoint:
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            with self.lock:
+                endpoint = self.endpoints.get(url)
+                if endpoint is None:
+                    limiter = AdaptiveRateLimiter(**self.rate_limit)
+                    endpoint = self.endpoints[url] = Endpoint(url, self.window, limiter)
+                    endpoint_rate.set_function(lambda: limiter.rate, endpoint=url)
+
+        return endpoint
+
+    def rates(self) -> dict:
+        """
+        Returns the requests per sec each endpoint's rate limiter currently allows.
+
+        :return: Dictionary where key-endpoint url, value-allowed rate
+        """
+        return {url: endpoint.limiter.rate for url, endpoint in list(self.endpoints.items())}
+
+    def select(self, urls: tuple, exclude: Endpoint | None = None) -> Endpoint or None:
+        """
+        Returns the endpoint to send a request to.
+
+        :param urls: Urls of equivalent endpoints
+        :param exclude: Endpoint not to return, eg. the one a request being hedged went to
+        :return: Healthy endpoint, neither ejected nor waiting out a Retry-After, with the lowest latency for its
+                 load. None if there is none other than exclude
+        """
+        now = monotonic()
+        endpoints = [self.endpoint(url) for url in urls]
+        healthy = [endpoint for endpoint in endpoints if endpoint.ejected_until <= now and endpoint is not exclude
+                   and not endpoint.limiter.paused(now)]
+        if healthy:
+            return min(healthy, key=lambda endpoint: endpoint.latency * (endpoint.in_flight + 1))
+
+        if exclude is None:
+            # Keep scanning through the endpoint that returns first rather than not at all
+            return min(endpoints, key=lambda endpoint: endpoint.ejected_until)
+
+        return None
+
+    def record(self, endpoint: Endpoint, latency: float | None, eject: bool) -> None:
+        """
+        Records a request's outcome, ejecting the endpoint if it keeps failing.
+
+        :param endpoint: Endpoint the request was sent to
+        :param latency: Secs the request took, None if it failed
+        :param eject: Eject the endpoint if it keeps failing
+        """
+        ejected = None
+        with self.lock:
+            endpoint.in_flight -= 1
+            if latency is not None:
+                if endpoint.samples:
+                    endpoint.latency += self.smoothing * (latency - endpoint.latency)
+                else:
+                    endpoint.latency = latency
+                endpoint.samples.append(latency)
+                # Sorting is cheap at this window size, but not worth doing on every request
+                if endpoint.p95 is None or len(endpoint.samples) % 10 == 0:
+                    ordered = sorted(endpoint.samples)
+                    endpoint.p95 = ordered[int(0.95 * (len(ordered) - 1))]
+                endpoint.failures = 0
+                endpoint.ejections = 0
+            else:
+                endpoint.failures += 1
+                now = monotonic()
+                if eject and endpoint.failures >= self.failures and endpoint.ejected_until <= now:
+                    ejected = min(self.eject_time * 2 ** endpoint.ejections, self.max_eject_time)
+                    endpoint.ejected_until = now + ejected
+                    endpoint.ejections += 1
+                    # A single failure on return ejects it again
+                    endpoint.failures = self.failures - 1
+
+        if latency is not None:
+            endpoint_latency.observe(latency, endpoint=endpoint.url)
+        if ejected is not None:
+            ejections.inc(endpoint=endpoint.url)
+            log_error.warning(f"'EndpointError' - {endpoint.url} ejected for {ejected:.0f} secs after "
+                              f"{self.failures} consecutive failures")
+
+    def send(self, endpoint: Endpoint, params: dict, timeout: float, eject: bool = True) -> Response:
+        """
+        Sends a request to a single endpoint.
+
+        :param endpoint: Endpoint to send the request to
+        :param params: Query parameters
+        :param timeout: Max number of secs to wait for the request
+        :param eject: Eject the endpoint if it keeps failing
+        :return: Response of any status but 429, raises RequestException if the request failed
+        """
+        if not endpoint.limiter.acquire(timeout):
+            raise RateLimitTimeout(f"{endpoint.url} is limited to {endpoint.limiter.rate:,.1f} requests per sec")
+
+        with self.lock:
+            endpoint.in_flight += 1
+
+        start = perf_counter()
+        try:
+            response = get_session().get(endpoint.url, params=params, timeout=timeout)
+        except RequestException:
+            self.record(endpoint, None, eject)
+            raise
+
+        if response.status_code == 429:
+            wait_for = retry_after(response)
+            endpoint.limiter.record_throttled(wait_for)
+            with self.lock:
+                endpoint.in_flight -= 1
+            raise RateLimited(f"{endpoint.url} answered 429, retry after {wait_for} secs, now limited to "
+                              f"{endpoint.limiter.rate:,.1f} requests per sec", response=response)
+
+        endpoint.limiter.record_success()
+        self.record(endpoint, perf_counter() - start, eject)
+        return response
+
+    def get(self, urls: tuple, params: dict, timeout: float = 3) -> Response:
+        """
+        Sends a GET request to the best of a set of equivalent endpoints, hedging or failing over to the next best.
+
+        :param urls: Urls of equivalent endpoints
+        :param params: Query parameters
+        :param timeout: Max number of secs to wait for each request
+        :return: First response of any status, raises the last RequestException if all requests failed
+        """
+        primary = self.select(urls)
+        if len(urls) == 1:
+            return self.send(primary, params, timeout, eject=False)
+
+        secondary = self.select(urls, exclude=primary)
+        if secondary is None:
+            return self.send(primary, params, timeout)
+
+        delay = primary.p95 if self.hedge and len(primary.samples) >= self.min_samples else None
+        if delay is None or delay >= timeout:
+            try:
+                return self.send(primary, params, timeout)
+            except RequestException:
+                return self.send(secondary, params, timeout)
+
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+
+        futures = [self.executor.submit(self.send, primary, params, timeout)]
+        done, _ = wait(futures, timeout=delay)
+        hedged = not done
+        if hedged or futures[0].exception() is not None:
+            futures.append(self.executor.submit(self.send, secondary, params, timeout))
+
+        error = None
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except RequestException as e:
+                error = e
+                continue
+
+            if hedged:
+                hedges.inc(endpoint=secondary.url, won=str(future is futures[1]).lower())
+            return response
+
+        if hedged:
+            hedges.inc(endpoint=secondary.url, won="false")
+        raise error
+
+    def close(self) -> None:
+        """Shuts down the hedged request threads, requests in flight are not waited for."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,205 @@
+"""
+Asyncio scan engine that quotes every (route, amount) pair concurrently.
+"""
+import asyncio
+
+from time import perf_counter
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+from src.api.search import search_amounts
+from src.api.route import Route
+from src.api.rpc import (
+    collect_arbs,
+    record_arbs,
+    select_arb,
+    fetch_bridge_quote,
+    report_arbitrage,
+    throttled_routes,
+)
+from src.common.breaker import (
+    CLOSED,
+    BreakerRegistry,
+)
+from src.common.scheduler import RouteScheduler
+
+
+class ScanEngine:
+    """
+    Issues all quotes of a scan plan as concurrent non-blocking requests, capped at max_in_flight,
+    and hands each route's quotes to report_arbitrage for evaluation.
+
+    Blocking HTTP calls run on a single worker pool that lives as long as the engine,
+    so no threads are spawned per scan loop.
+    """
+
+    def __init__(self, max_in_flight: int = 32, timeout: float = 3, report: bool = True):
+        """
+        :param max_in_flight: Maximum number of quote requests in flight at any time
+        :param timeout: Max number of secs to wait per request
+        :param report: Evaluate and alert each route's arbitrage, else only quote it and leave reporting to the caller
+        """
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.report = report
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="scan")
+
+    async def quote(self, semaphore: asyncio.Semaphore, route: Route, amount: float) -> int or None:
+        """
+        Fetches a single quote without blocking the event loop.
+
+        :param semaphore: Semaphore limiting the number of in-flight requests
+        :param route: Route to quote
+        :param amount: Amount to swap, in whole tokens
+        :return: Raw amount to receive, None if quote failed
+        """
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, fetch_bridge_quote, route, amount, self.timeout)
+
+    async def quote_batch(self, semaphore: asyncio.Semaphore, route: Route, amounts: tuple) -> list:
+        """
+        Fetches quotes for all amounts of a route concurrently.
+
+        :return: List of raw amounts to receive, None for each failed quote
+        """
+        return await asyncio.gather(*[self.quote(semaphore, route, amount) for amount in amounts])
+
+    async def search_route(self, semaphore: asyncio.Semaphore, route: Route) -> tuple or None:
+        """
+        Searches for the amount with maximum arbitrage, quoting each search round concurrently.
+
+        :return: Tuple of max_arb & (amount_in, amount_out)
+        """
+        all_arbs = {}
+        searcher = search_amounts(route.amounts, route.search)
+        try:
+            batch = next(searcher)
+            while True:
+                quotes = await self.quote_batch(semaphore, route, batch)
+                batch = searcher.send(record_arbs(all_arbs, batch, quotes, route.scale_out))
+        except StopIteration:
+            pass
+
+        if len(all_arbs) > 0:
+            # The search measures the optimum, so take it as is
+            max_arb = max(all_arbs)
+            return max_arb, all_arbs[max_arb]
+        else:
+            return None
+
+    async def scan_route(self, semaphore: asyncio.Semaphore, route: Route) -> tuple:
+        """
+        Quotes all amounts of a route concurrently, or searches for the optimal amount if search is set,
+        and evaluates them for arbitrage.
+
+        :param semaphore: Semaphore limiting the number of in-flight requests
+        :param route: Route to scan
+        :return: Tuple of data, max_arb & (amount_in, amount_out) or None if no arbs, and report_arbitrage output,
+                 the latter None if report is off
+        """
+        if route.search:
+            data = await self.search_route(semaphore, route)
+        else:
+            quotes = await self.quote_batch(semaphore, route, route.amounts)
+            all_arbs = collect_arbs(route.amounts, quotes, route.scale_out)
+            data = select_arb(all_arbs, route.stable_in)
+
+        if not self.report:
+            return data, None
+
+        # Alerts are only queued for the Telegram dispatcher, so this never blocks the loop
+        return data, report_arbitrage(data, route)
+
+    async def timed(self, coroutine, index: int, timings: dict):
+        """Awaits a coroutine and records the secs it took in timings[index]."""
+        start = perf_counter()
+        try:
+            return await coroutine
+        finally:
+            timings[index] = perf_counter() - start
+
+    async def scan(self, routes: List[Route], timings: dict | None = None) -> list:
+        """
+        Scans all routes concurrently.
+
+        :param routes: List of routes. Output of func parse_args
+        :param timings: If given, filled with the secs each route took to complete, keyed by its index
+        :return: List of (scan_route data, report_arbitrage) output tuples, one per route
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        scans = [self.scan_route(semaphore, route) for route in routes]
+        if timings is not None:
+            scans = [self.timed(scan, index, timings) for index, scan in enumerate(scans)]
+
+        return await asyncio.gather(*scans)
+
+    def run(self, routes: List[Route], timings: dict | None = None) -> list:
+        """
+        Runs a single scan loop over all routes to completion.
+
+        :param routes: List of routes. Output of func parse_args
+        :param timings: If given, filled with the secs each route took to complete, keyed by its index.
+                        Routes start together, so this includes time spent waiting for a request slot
+        :return: List of (scan_route data, report_arbitrage) output tuples, one per route
+        """
+        return asyncio.run(self.scan(routes, timings))
+
+    def close(self) -> None:
+        """Shuts down the engine's worker pool."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def admit_batch(batch: List[str], routes: dict, scheduler: RouteScheduler,
+                route_breakers: BreakerRegistry, chain_breakers: BreakerRegistry) -> List[str]:
+    """
+    Returns the routes of a batch whose own and chains' circuits allow a poll.
+    The others are rescheduled for when their circuits let a probe through.
+
+    :param batch: Route keys due, output of RouteScheduler.next_batch
+    :param routes: Dictionary where key-route key, value-route
+    :param scheduler: Scheduler of the routes
+    :param route_breakers: Breakers of routes
+    :param chain_breakers: Breakers of chains
+    :return: Route keys to poll now
+    """
+    allowed = []
+    for key in batch:
+        breakers = [route_breakers.get(key)] + [chain_breakers.get(chain) for chain in routes[key].chains]
+        # Check every circuit first, allow() takes an open circuit's probe so is only called on routes polled
+        waiting = [breaker.retry_in() for breaker in breakers if breaker.state != CLOSED and breaker.retry_in() > 0]
+        if not waiting:
+            for breaker in breakers:
+                breaker.allow()
+            allowed.append(key)
+        else:
+            scheduler.update(key, None, delay=max(max(waiting), scheduler.min_interval))
+
+    return allowed
+
+
+def record_batch(keys: List[str], outputs: list, routes: dict, scheduler: RouteScheduler,
+                 route_breakers: BreakerRegistry, chain_breakers: BreakerRegistry) -> None:
+    """
+    Records a polled batch in the circuit breakers and schedules each route's next poll.
+    A route that got no quote because requests were rate limited is deferred to its next poll,
+    without counting as a failure.
+
+    :param keys: Route keys polled
+    :param outputs: Output of ScanEngine.run for the routes of keys
+    :param routes: Dictionary where key-route key, value-route
+    :param scheduler: Scheduler of the routes
+    :param route_breakers: Breakers of routes
+    :param chain_breakers: Breakers of chains
+    """
+    for key, (data, _) in zip(keys, outputs):
+        if data is None and key in throttled_routes:
+            scheduler.update(key, None)
+            continue
+
+        route_breakers.record(key, data is not None)
+        for chain in routes[key].chains:
+            chain_breakers.record(chain, data is not None)
+        scheduler.update(key, data[0] if data else None)
+
+    throttled_routes.difference_update(keys)
@@ -2,76 +2,73 @@ from itertools import permutations
 from typing import List
 from hashlib import sha256
 from tabulate import tabulate
-from src.variables import network_ids
+from src.api.route import Route
 
 
-def parse_args(schema: dict) -> List[list]:
+def parse_args(schema: dict) -> List[Route]:
     """
-    Parses input schema and returns a list of arguments ready to be passed to a function.
-
-    >>> arguments = parse_args(schema)
-    >>> print(arguments)
-    [['api', 10, 'USDC', [100, 200, 500], [6, 1, 'USDC'], [6, 10, 'USDC'], {"max_swap_amount": 10000, "coins": ["USDC"]}]...]
-        ^    ^     ^     ‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾
-       api  arb   name        amounts         taken_A          token_B                      special_chat
-                                  (deci, id, name)  (deci, id, name)
+    Parses input schema and returns the scan plan, a route for every ordered pair of a coin's networks.
+
+    >>> routes = parse_args(schema)
+    >>> print(routes)
+    [Route(USDC:Ethereum->Optimism), Route(USDC:Ethereum->Fantom)...]
+    >>> routes[0].settings()
+    ('api', 10, 'USDC', (100, 200, 500), (6, 1, 'USDC'), (6, 10, 'USDC'), {"max_swap_amount": 10000, "coins": ["USDC"]}, None)
+      ^    ^     ^     ‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾‾   ‾‾‾‾
+     api  arb   name        amounts         taken_A          token_B                      special_chat                 search
+                                (deci, id, name)  (deci, id, name)
     >>>
 
     :param schema: Dictionary with input information
-    :return: List of argument lists
+    :return: List of routes
     """
     special_chat = schema['settings']['special_chat']
     bridge_api = schema['settings']['bridge_api']
 
-    args = []
+    routes = []
     for coin in schema['coins']:
         amounts = schema['coins'][coin]['swap_amount']
         networks = schema['coins'][coin]['networks']
         arbitrage = schema['coins'][coin]['arbitrage']
+        search = schema['coins'][coin].get('search')
 
         networks = [[networks[i]['decimals'], networks[i]['chain_id'], networks[i]['token']]
                     for i in networks]
         pairs = list(permutations(networks, 2))
 
         for pair in pairs:
-            temp_list = [bridge_api, arbitrage, coin, amounts, pair[0], pair[1], special_chat]
-            args.append(temp_list)
+            routes.append(Route(bridge_api, arbitrage, coin, amounts, pair[0], pair[1], special_chat, search))
 
-    return args
+    return routes
 
 
-def print_start_message(arguments: List[list]) -> None:
+def print_start_message(routes: List[Route], breakers=None) -> None:
     """Prints script start message of all network configurations.
 
-    :param arguments: List of argument lists. Output of func paser_args
+    :param routes: List of routes. Output of func parse_args
+    :param breakers: BreakerRegistry of routes, if given adds each route's circuit state
     """
 
     table = []
-    for arg in arguments:
-        api = arg[0]
-        min_arb = arg[1]
-        token = arg[2]
-        amounts = arg[3]
-        from_id = str(arg[4][1])
-        to_id = str(arg[5][1])
-
-        try:
-            from_network = network_ids[from_id]
-        except:
-            from_network = arg[3]
-
-        try:
-            to_network = network_ids[to_id]
-        except:
-            to_network = arg[4]
-
+    for route in routes:
+        amounts = route.amounts
         swap_amounts = [f"{int(amount / 1000)}k" if amount > 1000 else f"{amount}" for amount in amounts]
         swaps = ", ".join(swap_amounts)
-
-        line = [token, from_network, to_network, swaps, min_arb]
+        if route.search:
+            # Search spans the configured range within rounds x points requests
+            low, high = swap_amounts[amounts.index(min(amounts))], swap_amounts[amounts.index(max(amounts))]
+            swaps = f"{low}-{high} " \
+                    f"(search {route.search.get('rounds', 2)}x{route.search.get('points', 3)})"
+
+        line = [route.coin, route.name_in, route.name_out, swaps, route.min_arb]
+        if breakers is not None:
+            breaker = breakers.breakers.get(route.key)
+            line.append(breaker.state if breaker else "closed")
         table.append(line)
 
     columns = ["Token", "From", "To", "SwapAmounts", "MinArb"]
+    if breakers is not None:
+        columns.append("Circuit")
 
     print(tabulate(table, headers=columns, showindex=True,
                    tablefmt="fancy_grid", numalign="left", stralign="left", colalign="left"))
@@ -0,0 +1,134 @@
+"""
+Compiled scan plan: each route of api.json as a slotted object with everything a scan needs worked out once,
+so polling a route only does arithmetic and I/O.
+"""
+from src.api.endpoints import endpoint_urls
+from src.variables import (
+    network_ids,
+    stablecoins,
+)
+
+
+class Route:
+    """
+    A route of the scan plan, built by parse_args. Chain names, keys, token scale factors, query payloads and
+    their cache keys, special chat eligibility and alert message templates are computed when it is built.
+
+    Routes are equal if built from the same settings, and are pickled as those settings only.
+    """
+
+    __slots__ = (
+        "bridge_api", "min_arb", "coin", "amounts", "network_in", "network_out", "special_chat", "search",
+        "decimals_in", "chain_id_in", "token_in", "decimals_out", "chain_id_out", "token_out",
+        "name_in", "name_out", "chains", "key", "name", "discovery_key", "scale_in", "scale_out",
+        "stable_in", "cost", "queries", "special_max_amount", "arb_rounding", "message_template", "terminal_template",
+    )
+
+    def __init__(self, bridge_api: str or list, min_arb: float, coin: str, amounts: list, network_in: list,
+                 network_out: list, special_chat: dict | None = None, search: dict | None = None):
+        """
+        :param bridge_api: Synapse bridge output api, or list of equivalent ones
+        :param min_arb: Min required arbitrage
+        :param coin: Coin name in api.json
+        :param amounts: List of amounts to swap, in whole tokens
+        :param network_in: Origin chain iterable with decimals, chain_id & token_name
+        :param network_out: Target chain iterable with decimals, chain_id & token_name
+        :param special_chat: Special chat settings with max_swap_amount and coins, if empty ignore
+        :param search: Search settings, if given search for the optimal amount instead of quoting all amounts
+        """
+        self.bridge_api = endpoint_urls(bridge_api)
+        self.min_arb = min_arb
+        self.coin = coin
+        self.amounts = tuple(amounts)
+        self.network_in = tuple(network_in)
+        self.network_out = tuple(network_out)
+        self.special_chat = special_chat
+        self.search = search
+
+        self.decimals_in, self.chain_id_in, self.token_in = self.network_in
+        self.decimals_out, self.chain_id_out, self.token_out = self.network_out
+        self.name_in = network_ids[str(self.chain_id_in)]
+        self.name_out = network_ids[str(self.chain_id_out)]
+        self.chains = (self.name_in, self.name_out)
+
+        # Key in the scheduler and breakers, eg. 'USDC:Ethereum->Optimism'
+        self.key = f"{coin}:{self.name_in}->{self.name_out}"
+        # Name in quote history, logs and metrics, eg. 'USDC:Ethereum->USDC:Optimism'
+        self.name = f"{self.token_in}:{self.name_in}->{self.token_out}:{self.name_out}"
+        # Key in the supported-route index, with tokens so changing a network's token re-discovers the route
+        self.discovery_key = f"{coin}:{self.chain_id_in}:{self.token_in}->{self.chain_id_out}:{self.token_out}"
+
+        self.scale_in = 10 ** self.decimals_in
+        self.scale_out = 10 ** self.decimals_out
+        self.stable_in = self.token_in in stablecoins
+        self.arb_rounding = int(self.decimals_in // 3)
+        if search:
+            self.cost = search.get('rounds', 2) * search.get('points', 3)
+        else:
+            self.cost = len(self.amounts)
+
+        self.queries = {amount: self.build_query(amount) for amount in self.amounts}
+
+        # Alerts of amounts up to special_max_amount also go to the special chat, None if the coin is not eligible
+        self.special_max_amount = None
+        if special_chat and self.token_in.upper() in special_chat['coins']:
+            self.special_max_amount = float(special_chat['max_swap_amount'])
+
+        self.message_template = "{timestamp} - Synapse API\n" \
+                                f"Sell {{amount_in:,}} {self.token_in} for {{amount_out:,.2f}} {self.token_out}, " \
+                                f"{self.name_in} -> {self.name_out}\n" \
+                                f"--->Arbitrage: <a href='https://synapseprotocol.com'>{{arbitrage:,.2f}} " \
+                                f"{self.token_out}</a>"
+        self.terminal_template = f"Sell {{amount_in:,}} {self.token_in} for {{amount_out:,.2f}} {self.token_out}, " \
+                                 f"{self.name_in} -> {self.name_out}; --->Arbitrage: {{arbitrage:,}} {self.token_out}"
+
+    def settings(self) -> tuple:
+        return (self.bridge_api, self.min_arb, self.coin, self.amounts, self.network_in, self.network_out,
+                self.special_chat, self.search)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Route) and self.settings() == other.settings()
+
+    def __hash__(self) -> int:
+        # Special chat and search settings are dicts, and equal routes have equal keys and amounts anyway
+        return hash((self.bridge_api, self.key, self.amounts, self.network_in, self.network_out))
+
+    def __reduce__(self) -> tuple:
+        return Route, self.settings()
+
+    def __repr__(self) -> str:
+        return f"Route({self.key})"
+
+    def build_query(self, amount: float) -> tuple:
+        """
+        Builds the bridge api query parameters for swapping an amount, and their quote cache key.
+
+        :param amount: Amount to swap, in whole tokens
+        :return: Tuple of query parameters dictionary and cache key
+        """
+        # Add zeros to be a valid synapse api argument, as an integer so searched amounts are not sent as floats
+        payload = {'fromChain': self.chain_id_in, 'toChain': self.chain_id_out,
+                   'fromToken': self.token_in, 'toToken': self.token_out,
+                   'amountFrom': int(round(amount * self.scale_in))}
+
+        return payload, (self.bridge_api, *sorted(payload.items()))
+
+    def query(self, amount: float) -> tuple:
+        """
+        Returns the query parameters and cache key of an amount, prebuilt for the configured amounts.
+
+        :param amount: Amount to swap, in whole tokens
+        :return: Tuple of query parameters dictionary and cache key
+        """
+        query = self.queries.get(amount)
+
+        return query if query is not None else self.build_query(amount)
+
+    def special(self, amount_in: float) -> bool:
+        """
+        Returns True if an alert of swapping amount_in also goes to the special chat.
+
+        :param amount_in: Amount swapped in
+        :return: True if special chat eligible
+        """
+        return self.special_max_amount is not None and self.special_max_amount >= amount_in
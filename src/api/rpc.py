@@ -1,28 +1,143 @@
 from datetime import datetime
+from time import monotonic
+from threading import Lock
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import (
-    Iterable,
+    Callable,
     List,
 )
 from json.decoder import JSONDecodeError
 
-from requests.exceptions import ConnectionError
+from requests.exceptions import RequestException
 
+from src.api.route import Route
 from src.api.helpers import hash_arb_data
-from src.variables import network_ids
-from src.common.message import telegram_send_msg
+from src.api.dedupe import AlertDeduplicator
+from src.api.endpoints import (
+    BridgeClient,
+    RateLimited,
+)
+from src.common.message import telegram_enqueue_msg
+from src.common.history import QuoteHistory
+from src.common.transport import get_session
+from src.common.metrics import (
+    errors,
+    in_flight,
+    quote_latency,
+    chain_latency,
+)
 from src.common.logger import (
     log_error,
     log_arbitrage,
 )
 from src.variables import (
     time_format,
-    stablecoins,
-    http_session,
-    CHAT_ID_ALERTS,
-    CHAT_ID_SPECIAL,
+    get_env,
 )
 
 
+class QuoteCache:
+    """
+    Bounded LRU cache of bridge quotes that expire after ttl secs, with in-flight request coalescing:
+    concurrent callers of the same key wait for the one request already in flight instead of issuing their own.
+    Failed quotes (None) are shared with waiting callers but never cached.
+    """
+
+    def __init__(self, ttl: float = 3, max_size: int = 4096):
+        """
+        :param ttl: Secs a quote is served from cache, 0 disables caching but keeps coalescing
+        :param max_size: Max number of quotes held, least recently used are evicted first
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def configure(self, ttl: float, max_size: int) -> None:
+        """
+        Updates cache settings and drops all cached quotes.
+
+        :param ttl: Secs a quote is served from cache
+        :param max_size: Max number of quotes held
+        """
+        with self.lock:
+            self.ttl = ttl
+            self.max_size = max_size
+            self.entries.clear()
+
+    def get(self, key: tuple, fetch: Callable):
+        """
+        Returns the cached value for key if fresh, else waits for an in-flight fetch of the same key,
+        else calls fetch and caches its result.
+
+        :param key: Hashable key identifying the quote
+        :param fetch: Function called without arguments to fetch the value
+        :return: Cached, coalesced or freshly fetched value
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self.in_flight[key] = Future()
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = fetch()
+        except BaseException as ex:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(ex)
+            raise
+
+        with self.lock:
+            del self.in_flight[key]
+            if value is not None and self.ttl > 0:
+                self.entries[key] = (monotonic() + self.ttl, value)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        """
+        Returns cache counters.
+
+        :return: Dictionary with hits, misses, coalesced and size
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "coalesced": self.coalesced, "size": len(self.entries)}
+
+
+quote_cache = QuoteCache()
+quote_history = QuoteHistory()
+alert_deduplicator = AlertDeduplicator()
+bridge_client = BridgeClient()
+# Keys of routes with a quote held back by a rate limit since their last recorded poll
+throttled_routes = set()
+
+
 def get_token_networks(token: str) -> list:
     """
     Returns all available networks for https://synapseprotocol.com for a given token.
@@ -36,7 +151,7 @@ def get_token_networks(token: str) -> list:
     token = token.upper()
 
     url = api.format(token=token)
-    response = http_session.get(url, timeout=10).json()
+    response = get_session().get(url, timeout=10).json()
 
     return response
 
@@ -52,7 +167,7 @@ def get_bridgeable_tokens(chain: str) -> list:
     chain = chain.upper()
 
     url = api.format(chain=chain)
-    response = http_session.get(url, timeout=10).json()
+    response = get_session().get(url, timeout=10).json()
 
     return response
 
@@ -80,63 +195,145 @@ def check_max_arb(all_arbs: dict, min_diff: int = 5) -> tuple:
     return max_arb, all_arbs[max_arb]
 
 
-def get_bridge_output(bridge_api: str, amounts: List, network_in: Iterable, network_out: Iterable,
-                      timeout: float = 3) -> tuple or None:
+def fetch_bridge_quote(route: Route, amount: float, timeout: float = 3, record: bool = True) -> int or None:
+    """
+    Queries https://synapseprotocol.com for the raw bridge output of a single swap amount.
+    Identical queries are served from quote_cache or coalesced with one already in flight.
+
+    :param route: Route to quote
+    :param amount: Amount to swap, in whole tokens
+    :param timeout: Max number of secs to wait for the request
+    :param record: Record the quote in quote_history
+    :return: Amount to receive in the smallest token unit, None if the request failed
     """
-    Queries https://synapseprotocol.com for swap bridge output for a cross-chain transaction.
+    payload, key = route.query(amount)
 
-    :param bridge_api: Synapse bridge output api
-    :param amounts: List of amounts to swap
-    :param network_in: Origin chain iterable with decimals, chain_id & token_name
-    :param network_out: Target chain iterable with decimals, chain_id & token_name
-    :param timeout: Max number of secs to wait per request
-    :return: Tuple of max_arb & amount swapped in
+    return quote_cache.get(key, lambda: request_bridge_quote(route, payload, timeout, record))
+
+
+def request_bridge_quote(route: Route, payload: dict, timeout: float = 3, record: bool = True) -> int or None:
     """
+    Requests the raw bridge output of a single swap amount, bypassing the quote cache.
 
-    decimals_in, chain_id_in, token_in = network_in
-    decimals_out, chain_id_out, token_out = network_out
-    name_in = network_ids[str(chain_id_in)]
-    name_out = network_ids[str(chain_id_out)]
+    :param route: Route to quote
+    :param payload: Query parameters with fromChain, toChain, fromToken, toToken & amountFrom
+    :param timeout: Max number of secs to wait for the request
+    :param record: Record the quote in quote_history
+    :return: Amount to receive in the smallest token unit, None if the request failed
+    """
+    # Latency is that of the HTTP exchange that answered, without rate limit waits, failovers or hedge delays
+    extra = {"route": route.name, "amount": payload['amountFrom'], "latency": None}
+
+    amount_out = None
+    throttled = False
+    in_flight.inc()
+    try:
+        response = bridge_client.get(route.bridge_api, payload, timeout)
+        extra.update(latency=round(response.elapsed.total_seconds(), 4), status=response.status_code)
+        message = response.json()
+        amount_out = int(message['amountToReceive'])
+
+    except JSONDecodeError:
+        log_error.critical(f"'JSONError' {response.status_code} - {response.url}", extra=extra)
+        errors.inc(type="JSONDecodeError")
+    except RateLimited as e:
+        # The api throttled us, not a failure of the route, so its poll is deferred rather than counted against
+        # its circuit. A request our own rate limit held back too long is a failure like a timeout
+        throttled = True
+        throttled_routes.add(route.key)
+        extra.update(latency=round(e.response.elapsed.total_seconds(), 4), status="RateLimited")
+        log_error.warning(f"'RateLimited' - {e} - {route.name_in} --> {route.name_out}, "
+                          f"{route.token_in} -> {route.token_out}", extra=extra)
+        errors.inc(type="RateLimited")
+    except RequestException as e:
+        # Connection errors, timeouts and retries exhausted on 5xx responses
+        error = type(e).__name__
+        extra.update(status=error)
+        if e.response is not None:
+            extra.update(latency=round(e.response.elapsed.total_seconds(), 4))
+        log_error.critical(f"'{error}' - {e} - {route.name_in} --> {route.name_out}, "
+                           f"{route.token_in} -> {route.token_out}", extra=extra)
+        errors.inc(type=error)
+    except (KeyError, TypeError, ValueError) as e:
+        # No amountToReceive, or not a number, eg. an error payload that is not a dictionary
+        log_error.warning(f"'ResponseError' {response.status_code} - {message} - "
+                          f"{route.name_in} --> {route.name_out}, {route.token_in} -> {route.token_out}", extra=extra)
+        errors.inc(type=type(e).__name__)
+    finally:
+        in_flight.dec()
+
+    if extra['latency'] is not None:
+        quote_latency.observe(extra['latency'], route=route.name)
+        for chain in set(route.chains):
+            chain_latency.observe(extra['latency'], chain=chain)
+
+    # A throttled request says nothing about the route's output
+    if record and not throttled:
+        quote_history.record(route.name, payload['amountFrom'] / route.scale_in,
+                             amount_out / route.scale_out if amount_out is not None else None, extra['latency'])
+
+    return amount_out
+
+
+def collect_arbs(amounts: List, quotes: List, scale_out: int) -> dict:
+    """
+    Builds the arbitrage dictionary from quoted outputs. Stops at the first failed quote,
+    so that only amounts up to the first failure are considered.
 
+    :param amounts: List of amounts swapped, in whole tokens
+    :param quotes: List of raw amounts received for each amount, None if quote failed
+    :param scale_out: 10 ** decimals of the token received
+    :return: Dictionary where key-arb, value-(amount_in, amount_out)
+    """
     all_arbs = {}
-    for amount in amounts:
+    for amount, amount_out in zip(amounts, quotes):
+        if amount_out is None:
+            break
 
-        # Add zeros to be a valid synapse api argument
-        amount_in = amount * (10 ** decimals_in)
+        # Calculate arbitrage
+        amount_out = amount_out / scale_out
+        arbitrage = amount_out - amount
+        # Add arb to arbs' dictionary
+        all_arbs[arbitrage] = (amount, amount_out)
 
-        payload = {'fromChain': chain_id_in, 'toChain': chain_id_out,
-                   'fromToken': token_in, 'toToken': token_out, 'amountFrom': amount_in}
+    return all_arbs
 
-        try:
-            response = http_session.get(bridge_api, params=payload, timeout=timeout)
-        except ConnectionError as e:
-            log_error.critical(f"'ConnectionError' - {e} - {name_in} --> {name_out}, {token_in} -> {token_out}")
-            # If response not returned break for loop
-            break
 
-        try:
-            message = response.json()
-        except JSONDecodeError:
-            log_error.critical(f"'JSONError' {response.status_code} - {response.url}")
-            break
+def record_arbs(all_arbs: dict, amounts: List, quotes: List, scale_out: int) -> list:
+    """
+    Adds every successful quote to the arbitrage dictionary, skipping failed ones.
 
-        try:
-            amount_out = message['amountToReceive']
-        except KeyError:
-            log_error.warning(f"'ResponseError' {response.status_code} - {message} - "
-                              f"{name_in} --> {name_out}, {token_in} -> {token_out}")
-            # If response not returned break for loop
-            break
+    :param all_arbs: Dictionary where key-arb, value-(amount_in, amount_out), updated in place
+    :param amounts: List of amounts swapped, in whole tokens
+    :param quotes: List of raw amounts received for each amount, None if quote failed
+    :param scale_out: 10 ** decimals of the token received
+    :return: List of arbitrage for each amount, None if its quote failed
+    """
+    arbs = []
+    for amount, amount_out in zip(amounts, quotes):
+        if amount_out is None:
+            arbs.append(None)
+            continue
 
-        # Calculate arbitrage
-        amount_out = int(amount_out) / (10 ** decimals_out)
+        amount_out = amount_out / scale_out
         arbitrage = amount_out - amount
-        # Add arb to arbs' dictionary
         all_arbs[arbitrage] = (amount, amount_out)
+        arbs.append(arbitrage)
 
+    return arbs
+
+
+def select_arb(all_arbs: dict, stable: bool) -> tuple or None:
+    """
+    Selects the arbitrage to act upon from all quoted arbitrages.
+
+    :param all_arbs: Dictionary with all arbs, where key-arb, value-(amount_in, amount_out)
+    :param stable: True if the token swapped in is a stablecoin
+    :return: Tuple of max_arb & (amount_in, amount_out), None if no arbs
+    """
     if len(all_arbs) > 0:
         # Return max arbitrage
-        if token_in in stablecoins:
+        if stable:
             return check_max_arb(all_arbs)
         else:
             max_arb = max(all_arbs)
@@ -145,25 +342,15 @@ def get_bridge_output(bridge_api: str, amounts: List, network_in: Iterable, netw
         return None
 
 
-def alert_arbitrage(bridge_api: str, min_arb: float, coin: str, amounts: list,
-                    network_in: Iterable, network_out: Iterable, special_chat: dict) -> dict or None:
+def report_arbitrage(data: tuple or None, route: Route) -> dict or None:
     """
-    Queries bridge swap output and if arbitrage > min_arb alerts and then returns a dict with hashed id and
-    constructed message to send.
+    Alerts if quoted arbitrage > min_arb and then returns a dict with hashed id and constructed message to send.
 
-    :param bridge_api: Synapse bridge output api
-    :param min_arb: Min required arbitrage
-    :param coin: Token name
-    :param amounts: List of amounts to swap
-    :param network_in: In network details, (decimal, id, name)
-    :param network_out: Out network details, (decimal, id, name)
-    :param special_chat: Send specific info, if empty ignore
+    :param data: Tuple of max_arb & (amount_in, amount_out)
+    :param route: Route quoted
     :return: Dictionary with id and message
     """
 
-    # Query swap amount out
-    data = get_bridge_output(bridge_api, amounts, network_in, network_out)
-
     if not data:
         return None
 
@@ -171,35 +358,35 @@ def alert_arbitrage(bridge_api: str, min_arb: float, coin: str, amounts: list,
     amount_in, amount_out = data[1]
 
     # Execute only if swap_amount is Not None, eg. get request was successful
-    if arbitrage >= min_arb:
+    if arbitrage >= route.min_arb:
 
-        decimals_in, chain_id_in, token_in = network_in
-        decimals_out, chain_id_out, token_out = network_out
-        network_in = network_ids[str(chain_id_in)]
-        network_out = network_ids[str(chain_id_out)]
         timestamp = datetime.now().astimezone().strftime(time_format)
+        arbitrage = round(arbitrage, route.arb_rounding)
 
-        arbitrage = round(arbitrage, int(decimals_in // 3))
+        message = route.message_template.format(timestamp=timestamp, amount_in=amount_in, amount_out=amount_out,
+                                                arbitrage=arbitrage)
+        ter_msg = route.terminal_template.format(amount_in=amount_in, amount_out=amount_out, arbitrage=arbitrage)
 
-        message = f"{timestamp} - Synapse API\n" \
-                  f"Sell {amount_in:,} {token_in} for {amount_out:,.2f} {token_out}, {network_in} -> {network_out}\n" \
-                  f"--->Arbitrage: <a href='https://synapseprotocol.com'>{arbitrage:,.2f} {token_out}</a>"
+        extra = {"route": route.key, "amount": amount_in}
 
-        ter_msg = f"Sell {amount_in:,} {token_in} for {amount_out:,.2f} {token_out}, {network_in} -> {network_out}; " \
-                  f"--->Arbitrage: {arbitrage:,} {token_out}"
+        # Hash id to compare arbs later
+        id_hash = hash_arb_data(route.name_in, route.name_out, arbitrage)
 
-        # Send arbitrage to ALL alerts channel and log
-        telegram_send_msg(message, telegram_chat_id=CHAT_ID_ALERTS)
-        log_arbitrage.info(ter_msg)
-        print(ter_msg)
+        # Skip Telegram if the same opportunity was alerted recently
+        dedupe_id = alert_deduplicator.arb_id(route.name_in, route.name_out, route.coin, data[0], route.min_arb)
+        alerted = alert_deduplicator.should_alert(dedupe_id)
 
-        # If special chat required, send telegram msg to it
-        if special_chat:
-            if float(special_chat['max_swap_amount']) >= float(amount_in) and token_in.upper() in special_chat['coins']:
-                telegram_send_msg(message, telegram_chat_id=CHAT_ID_SPECIAL)
+        if alerted:
+            # Send arbitrage to ALL alerts channel and log
+            telegram_enqueue_msg(message, telegram_chat_id=get_env("CHAT_ID_ALERTS"))
+            log_arbitrage.info(ter_msg, extra=extra)
+            print(ter_msg)
 
-        # Hash id to compare arbs later
-        id_hash = hash_arb_data(network_in, network_out, arbitrage)
+            # If special chat required, send telegram msg to it
+            if route.special(amount_in):
+                telegram_enqueue_msg(message, telegram_chat_id=get_env("CHAT_ID_SPECIAL"))
+        else:
+            log_arbitrage.debug(f"Suppressed: {ter_msg}", extra=extra)
 
-        return {"id": id_hash, "message": message,
-                "networks": str(network_in) + str(network_out), "arbitrage": arbitrage, "coin": coin}
+        return {"id": id_hash, "message": message, "alerted": alerted,
+                "networks": route.name_in + route.name_out, "arbitrage": arbitrage, "coin": route.coin}
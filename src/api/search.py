@@ -0,0 +1,71 @@
+"""
+Coarse-to-fine search for the swap amount with the highest arbitrage.
+"""
+from typing import Generator
+
+
+def grid(low: float, high: float, points: int, step: float) -> list:
+    """
+    Returns `points` evenly spaced amounts between low and high inclusive, rounded to step.
+
+    :param low: Lowest amount
+    :param high: Highest amount
+    :param points: Number of amounts
+    :param step: Granularity of amounts, eg. 1000 for USDC
+    :return: Sorted list of unique amounts
+    """
+    if points < 2 or high <= low:
+        return [low]
+
+    amounts = {round((low + i * (high - low) / (points - 1)) / step) * step for i in range(points)}
+    # Int amounts keep payloads exact for whole-token steps
+    amounts = {int(amount) if float(amount).is_integer() else amount for amount in amounts}
+
+    return sorted(amount for amount in amounts if low <= amount <= high)
+
+
+def search_amounts(amounts: list, search: dict) -> Generator[list, list, dict]:
+    """
+    Brackets the amount with the highest arbitrage between min(amounts) and max(amounts).
+    Each round quotes `points` amounts, then narrows the bracket to the neighbours of the best
+    quoted amount, until `rounds` is reached or the bracket can not be split at `step`.
+
+    Drive it by sending back the arbitrage of every yielded amount, None if its quote failed:
+
+    >>> searcher = search_amounts([9000, 200000], {"rounds": 2, "points": 3, "step": 1000})
+    >>> batch = next(searcher)
+    >>> batch = searcher.send([arbitrage(amount) for amount in batch])
+
+    :param amounts: Configured swap amounts, their range bounds the search
+    :param search: Search settings with rounds, points and step
+    :return: Generator that returns a dictionary of amount and arbitrage for all quoted amounts
+    """
+    rounds = search.get('rounds', 2)
+    points = search.get('points', 3)
+    step = search.get('step', 1)
+
+    low, high = min(amounts), max(amounts)
+    arbs = {}
+
+    batch = grid(low, high, points, step)
+    for _ in range(rounds):
+        results = yield batch
+
+        for amount, arbitrage in zip(batch, results):
+            if arbitrage is not None:
+                arbs[amount] = arbitrage
+
+        if not arbs:
+            break
+
+        # Narrow the bracket to the neighbours of the best amount quoted so far
+        quoted = sorted(arbs)
+        best = quoted.index(max(quoted, key=lambda amount: arbs[amount]))
+        low = quoted[max(best - 1, 0)]
+        high = quoted[min(best + 1, len(quoted) - 1)]
+
+        batch = [amount for amount in grid(low, high, points + 2, step) if amount not in arbs]
+        if not batch:
+            break
+
+    return arbs
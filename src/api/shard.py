@@ -0,0 +1,512 @@
+"""
+Sharded scanning: routes are split across worker processes by consistent hashing, and a coordinator
+evaluates their quotes, de-duplicates and sends alerts, and moves routes of dead workers to live ones.
+"""
+from bisect import (
+    bisect,
+    insort,
+)
+from hashlib import md5
+from datetime import datetime
+from queue import Empty
+from time import (
+    monotonic,
+    perf_counter,
+)
+from typing import Callable
+from signal import (
+    signal,
+    SIGUSR1,
+    SIG_IGN,
+)
+from multiprocessing import (
+    get_context,
+    parent_process,
+)
+
+from src.api.cycles import (
+    QuoteGraph,
+    report_cycles,
+)
+from src.api.engine import (
+    ScanEngine,
+    admit_batch,
+    record_batch,
+)
+from src.api.endpoints import (
+    endpoint_urls,
+    pool_size,
+)
+from src.api.rpc import (
+    quote_cache,
+    quote_history,
+    bridge_client,
+    report_arbitrage,
+)
+from src.common.breaker import (
+    BreakerRegistry,
+    report_breaker_change,
+)
+from src.common.logger import (
+    log_error,
+    logs_dir_path,
+    setup_loggers,
+)
+from src.common.metrics import (
+    loop_duration,
+    loop_routes,
+    start_metrics_server,
+)
+from src.common.scheduler import RouteScheduler
+from src.common.reload import diff_routes
+from src.common.profiler import (
+    LoopProfiler,
+    profiles_dir_path,
+)
+from src.common.transport import (
+    configure_transport,
+    warm_up,
+)
+from src.variables import (
+    time_format,
+    project_root_dir,
+)
+
+
+class HashRing:
+    """
+    Consistent hash ring. Each node owns `replicas` points on the ring and a key belongs to the node of
+    the first point after the key's hash, so adding or removing a node only moves that node's keys.
+    """
+
+    def __init__(self, nodes: list = (), replicas: int = 64):
+        """
+        :param nodes: Initial nodes
+        :param replicas: Points per node, more spread keys more evenly
+        """
+        self.replicas = replicas
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            self.add(node)
+
+    def __contains__(self, node) -> bool:
+        return node in self.owners.values()
+
+    def __len__(self) -> int:
+        return len(set(self.owners.values()))
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(md5(value.encode()).digest()[:8], "big")
+
+    def add(self, node) -> None:
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}#{replica}")
+            if point not in self.owners:
+                insort(self.points, point)
+            self.owners[point] = node
+
+    def remove(self, node) -> None:
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}#{replica}")
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.points.remove(point)
+
+    def node(self, key: str):
+        """
+        Returns the node owning a key.
+
+        :param key: Key to place, eg. a route key
+        :return: Node, None if the ring is empty
+        """
+        if not self.points:
+            return None
+
+        index = bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+    def assign(self, keys: list) -> dict:
+        """
+        Splits keys across the nodes.
+
+        :param keys: Keys to place
+        :return: Dictionary where key-node, value-list of keys it owns
+        """
+        assignment = {node: [] for node in set(self.owners.values())}
+        for key in keys:
+            assignment[self.node(key)].append(key)
+
+        return assignment
+
+
+def run_shard_worker(shard: int, routes: dict, settings: dict, commands, results, profile: bool = False) -> None:
+    """
+    Scans the routes assigned to a shard, like api.py does for all routes, and sends each route's quote
+    to the coordinator instead of alerting. Runs in its own process until told to stop.
+
+    Messages sent to results: ('ready', shard), ('result', shard, key, scan_route data),
+    ('loop', shard, number of routes, secs) after each poll and ('heartbeat', shard) while idle.
+    Messages read from commands: ('assign', list of route keys), ('update', dictionary of added and changed
+    routes, list of removed route keys), ('profile', True to enable profiling else False) and ('stop',).
+
+    :param shard: Shard number
+    :param routes: Dictionary where key-route key, value-route, of all routes
+    :param settings: settings of api.json
+    :param commands: Queue of commands from the coordinator
+    :param results: Queue of messages to the coordinator
+    :param profile: Start with profiling enabled
+    """
+    logging_settings = {**settings.get('logging', {}), 'logs_dir': f"{logs_dir_path}/shard-{shard}"}
+    setup_loggers(**logging_settings)
+
+    max_in_flight = settings.get('max_in_flight', 32)
+    cache_settings = settings.get('quote_cache', {})
+    endpoint_settings = settings.get('endpoints', {})
+    rate_limit_settings = settings.get('rate_limit', {})
+    scheduler_settings = settings.get('scheduler', {})
+    breaker_settings = settings.get('breaker', {})
+    history_settings = settings.get('history', {})
+    metrics_settings = settings.get('metrics', {})
+    profiling_settings = settings.get('profiling', {})
+    shard_settings = settings.get('shards', {})
+    workers = shard_settings.get('workers', 1)
+
+    # Routes of dead workers move to this one, so pools are sized for max_in_flight routes
+    bridge_api = endpoint_urls(settings['bridge_api'])
+    configure_transport(pool_size(bridge_api, max_in_flight, max_in_flight, endpoint_settings.get('hedge', True)))
+    warm_up(list(bridge_api), connections=max_in_flight)
+    quote_cache.configure(ttl=cache_settings.get('ttl', 3), max_size=cache_settings.get('max_size', 4096))
+    bridge_client.configure(hedge=endpoint_settings.get('hedge', True),
+                            min_samples=endpoint_settings.get('min_samples', 20),
+                            failures=endpoint_settings.get('failures', 5),
+                            eject_time=endpoint_settings.get('eject_time', 30),
+                            max_eject_time=endpoint_settings.get('max_eject_time', 300),
+                            max_workers=2 * max_in_flight,
+                            # Workers share the endpoints' limits
+                            rate_limit={'max_rate': rate_limit_settings.get('max_rps', 100) / workers,
+                                        'min_rate': rate_limit_settings.get('min_rps', 1) / workers,
+                                        'burst': rate_limit_settings.get('burst', 0.1),
+                                        'increase': rate_limit_settings.get('increase', 1) / workers,
+                                        'decrease': rate_limit_settings.get('decrease', 0.5)})
+    # Workers record to the same database, waiting for each other's writes for up to busy_timeout secs
+    if history_settings.get('enabled', True):
+        quote_history.open(f"{project_root_dir}/{history_settings.get('path', 'logs/quotes.db')}",
+                           batch_size=history_settings.get('batch_size', 500),
+                           flush_interval=history_settings.get('flush_interval', 1),
+                           busy_timeout=history_settings.get('busy_timeout', 5))
+    # Each worker serves its own quote latency and loop metrics, on consecutive ports from metrics_port
+    if metrics_settings.get('enabled', False):
+        start_metrics_server(port=shard_settings.get('metrics_port', 9111) + shard,
+                             host=metrics_settings.get('host', '127.0.0.1'))
+
+    engine = ScanEngine(max_in_flight=max_in_flight, report=False)
+    route_breakers = BreakerRegistry(failures=breaker_settings.get('failures', 3),
+                                     backoff=breaker_settings.get('backoff', 30),
+                                     max_backoff=breaker_settings.get('max_backoff', 3600),
+                                     on_change=report_breaker_change(f"SYNAPSE_API shard {shard}"))
+    chain_breakers = BreakerRegistry(failures=breaker_settings.get('chain_failures', 20),
+                                     backoff=breaker_settings.get('backoff', 30),
+                                     max_backoff=breaker_settings.get('max_backoff', 3600),
+                                     on_change=report_breaker_change(f"SYNAPSE_API shard {shard}"))
+    scheduler = RouteScheduler(min_interval=scheduler_settings.get('min_interval', 1),
+                               max_interval=scheduler_settings.get('max_interval', 60),
+                               max_rps=scheduler_settings.get('max_rps', 100) / workers)
+    # Each worker saves the profiles of its own loops over budget, toggled by the coordinator
+    profiler = LoopProfiler(budget=profiling_settings.get('budget', 10),
+                            interval=profiling_settings.get('interval', 0.01), enabled=profile,
+                            profiles_dir=f"{profiles_dir_path}/shard-{shard}")
+    # A SIGUSR1 sent to every process of the bot is handled by the coordinator only
+    signal(SIGUSR1, SIG_IGN)
+    heartbeat = shard_settings.get('heartbeat', 5)
+    loop_counter = 0
+
+    results.put(("ready", shard))
+    coordinator = parent_process()
+    try:
+        # Stop with the coordinator if it is killed before telling workers to stop
+        while coordinator.is_alive():
+            # Wait for commands while no route is due, but at least heartbeat every few secs
+            timeout = min(scheduler.wait_time(), heartbeat) if len(scheduler) else heartbeat
+            try:
+                command = commands.get(timeout=timeout) if timeout > 0 else commands.get_nowait()
+            except Empty:
+                command = None
+
+            while command is not None:
+                if command[0] == "stop":
+                    return
+                if command[0] == "update":
+                    routes.update(command[1])
+                    for key in command[2]:
+                        routes.pop(key, None)
+                        scheduler.remove(key)
+                    # Changed routes this worker polls keep their polling state
+                    for key in command[1]:
+                        scheduler.configure_route(key, min_arb=routes[key].min_arb, cost=routes[key].cost)
+                elif command[0] == "profile":
+                    if command[1] != profiler.enabled:
+                        profiler.toggle()
+                elif command[0] == "assign":
+                    assigned = set(command[1])
+                    for key in set(scheduler.routes) - assigned:
+                        scheduler.remove(key)
+                    # Routes moved here start as new, their state stays with the worker that had them
+                    for key in assigned - set(scheduler.routes):
+                        scheduler.add(key, min_arb=routes[key].min_arb, cost=routes[key].cost)
+                try:
+                    command = commands.get_nowait()
+                except Empty:
+                    command = None
+
+            batch = scheduler.next_batch()
+            if not batch:
+                results.put(("heartbeat", shard))
+                continue
+
+            start = perf_counter()
+            allowed = admit_batch(batch, routes, scheduler, route_breakers, chain_breakers)
+            if not allowed:
+                continue
+
+            loop_counter += 1
+            profiler.start_loop()
+            timings = {} if profiler.enabled else None
+            outputs = engine.run([routes[key] for key in allowed], timings)
+            record_batch(allowed, outputs, routes, scheduler, route_breakers, chain_breakers)
+            for key, (data, _) in zip(allowed, outputs):
+                results.put(("result", shard, key, data))
+
+            duration = perf_counter() - start
+            loop_duration.observe(duration)
+            loop_routes.set(len(allowed))
+            if timings is not None:
+                for index, secs in timings.items():
+                    profiler.record_route(allowed[index], secs)
+                saved = profiler.end_loop(loop_counter, duration)
+                if saved:
+                    print(f"Shard {shard} loop {loop_counter} took {duration:,.2f} secs, over its "
+                          f"{profiler.budget:,} secs budget. Profile saved to {saved}")
+            results.put(("loop", shard, len(allowed), duration, sum(bridge_client.rates().values())))
+
+    except KeyboardInterrupt:
+        # The coordinator shuts workers down
+        pass
+    finally:
+        # Do not wait on exit for the coordinator to read results it no longer wants
+        results.cancel_join_thread()
+        engine.close()
+        bridge_client.close()
+        profiler.disable()
+        quote_history.close()
+
+
+class ShardCoordinator:
+    """
+    Runs `workers` shard worker processes, assigns routes to them by consistent hashing and evaluates
+    every quote they send with report_arbitrage, so alerts of all shards go through one deduplicator.
+    With a graph, quotes of all shards also feed one QuoteGraph, searched for cycles after every worker's loop.
+
+    A worker that exits, or sends nothing for `timeout` secs, is terminated and its routes are moved to the
+    live workers. It is restarted after a backoff and takes its routes back once ready.
+    Loops run in the workers, so each one profiles its own, toggled for all of them through the coordinator.
+    """
+
+    def __init__(self, routes: dict, settings: dict, workers: int = 2, timeout: float = 60,
+                 replicas: int = 64, max_backoff: float = 300, graph: QuoteGraph | None = None,
+                 profile: bool = False):
+        """
+        :param routes: Dictionary where key-route key, value-route
+        :param settings: settings of api.json, passed to the workers
+        :param workers: Number of worker processes
+        :param timeout: Secs without a message after which a worker counts as hung
+        :param replicas: Points per worker on the hash ring
+        :param max_backoff: Max secs to wait before restarting a worker that keeps dying
+        :param graph: Graph to search for cycles across routes, None to skip
+        :param profile: Start workers with profiling enabled
+        """
+        self.routes = routes
+        self.settings = settings
+        self.workers = workers
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.graph = graph
+        self.context = get_context("spawn")
+        self.results = self.context.Queue()
+        self.ring = HashRing(replicas=replicas)
+        self.processes = {}
+        self.commands = {}
+        self.last_seen = {}
+        self.assigned = {}
+        self.restarts = {shard: 0 for shard in range(workers)}
+        self.restart_at = {}
+        self.loops = 0
+        # Toggled from a signal handler, so only a flag is set there and workers are told from run()
+        self.profiling = profile
+        self.profiling_sent = profile
+
+    def start_worker(self, shard: int) -> None:
+        self.commands[shard] = self.context.Queue()
+        process = self.context.Process(target=run_shard_worker, name=f"shard-{shard}", daemon=True,
+                                       args=(shard, self.routes, self.settings, self.commands[shard], self.results,
+                                             self.profiling))
+        process.start()
+        self.processes[shard] = process
+        self.last_seen[shard] = monotonic()
+        self.restart_at.pop(shard, None)
+
+    def start(self) -> None:
+        """Starts all workers. Routes are assigned to each one once it reports ready."""
+        for shard in range(self.workers):
+            self.start_worker(shard)
+
+    def toggle_profiling(self, *args) -> None:
+        """Enables profiling in all workers if disabled and vice versa. Can be registered as a signal handler."""
+        self.profiling = not self.profiling
+
+    def send_profiling(self) -> None:
+        """Tells all workers to enable or disable profiling if it was toggled since last sent."""
+        if self.profiling == self.profiling_sent:
+            return
+
+        for shard in self.processes:
+            self.commands[shard].put(("profile", self.profiling))
+        self.profiling_sent = self.profiling
+        print(f"Profiling {'enabled' if self.profiling else 'disabled'} in {len(self.processes)} workers.")
+
+    def rebalance(self) -> None:
+        """Assigns every route to a live worker and sends each worker whose routes changed its new routes."""
+        assignment = self.ring.assign(list(self.routes))
+        for shard, keys in assignment.items():
+            if set(keys) != set(self.assigned.get(shard, [])):
+                self.commands[shard].put(("assign", keys))
+        self.assigned = assignment
+
+        timestamp = datetime.now().astimezone().strftime(time_format)
+        shares = ", ".join(f"shard {shard}: {len(keys)}" for shard, keys in sorted(assignment.items()))
+        print(f"{timestamp}: Routes assigned to {len(self.ring)} of {self.workers} workers - {shares}.")
+
+    def update_routes(self, routes: dict) -> tuple:
+        """
+        Replaces the scan plan. Every worker gets the added and changed routes and drops the removed ones,
+        then routes are reassigned, so only added and removed routes move between workers.
+
+        :param routes: Dictionary where key-route key, value-route, of the new plan
+        :return: Output of diff_routes
+        """
+        added, removed, changed = diff_routes(self.routes, routes)
+        self.routes = routes
+        updates = {key: routes[key] for key in added + changed}
+        # Workers still starting read the command once ready
+        for shard in self.processes:
+            self.commands[shard].put(("update", updates, removed))
+        if len(self.ring):
+            self.rebalance()
+
+        return added, removed, changed
+
+    def worker_failed(self, shard: int, reason: str) -> None:
+        """
+        Terminates a dead or hung worker, moves its routes to the live workers and schedules its restart.
+
+        :param shard: Shard number
+        :param reason: Why the worker failed, for logging
+        """
+        process = self.processes.pop(shard)
+        if process.is_alive():
+            process.terminate()
+        process.join(1)
+
+        log_error.warning(f"'ShardError' - Worker {shard} {reason}, moving its routes to the other workers")
+        if shard in self.ring:
+            self.ring.remove(shard)
+            self.assigned.pop(shard, None)
+            if len(self.ring):
+                self.rebalance()
+
+        self.restarts[shard] += 1
+        self.restart_at[shard] = monotonic() + min(2 ** self.restarts[shard], self.max_backoff)
+
+    def check_workers(self) -> None:
+        """Fails workers that exited or stopped sending messages, and restarts failed ones when due."""
+        now = monotonic()
+        for shard, process in list(self.processes.items()):
+            if process.exitcode is not None:
+                self.worker_failed(shard, f"exited with code {process.exitcode}")
+            elif now - self.last_seen[shard] > self.timeout:
+                self.worker_failed(shard, f"sent nothing for {self.timeout} secs")
+
+        for shard, restart_at in list(self.restart_at.items()):
+            if now >= restart_at:
+                self.start_worker(shard)
+
+    def handle(self, message: tuple) -> None:
+        """
+        Handles a message from a worker.
+
+        :param message: Tuple of message type, shard number and its contents
+        """
+        kind, shard = message[0], message[1]
+        if shard not in self.processes:
+            return
+        self.last_seen[shard] = monotonic()
+
+        if kind == "ready":
+            self.ring.add(shard)
+            self.rebalance()
+
+        elif kind == "result":
+            key, data = message[2], message[3]
+            route = self.routes.get(key)
+            if route is not None:
+                report_arbitrage(data, route)
+                if self.graph is not None:
+                    self.graph.update(route, data)
+
+        elif kind == "loop":
+            self.loops += 1
+            routes, duration, rate = message[2], message[3], message[4]
+            cycles = report_cycles(self.graph, self.graph.detect()) if self.graph is not None else []
+            timestamp = datetime.now().astimezone().strftime(time_format)
+            print(f"{timestamp}: Loop {self.loops} - shard {shard} scanned {routes} routes in {duration:,.2f} secs. "
+                  f"Cycles: {len(cycles)}. Allowed rate: {rate:,.1f} requests per sec.")
+
+    def run(self, load_routes: Callable[[], dict or None] = None) -> None:
+        """
+        Starts the workers and handles their messages forever.
+
+        :param load_routes: Function called every sec that returns a new scan plan, or None if unchanged
+        """
+        self.start()
+        next_check = monotonic() + 1
+        while True:
+            try:
+                self.handle(self.results.get(timeout=1))
+            except Empty:
+                pass
+
+            self.send_profiling()
+            if monotonic() >= next_check:
+                new_routes = load_routes() if load_routes is not None else None
+                if new_routes is not None:
+                    added, removed, changed = self.update_routes(new_routes)
+                    timestamp = datetime.now().astimezone().strftime(time_format)
+                    print(f"{timestamp}: Reloaded routes - {len(added)} added, {len(removed)} removed, "
+                          f"{len(changed)} changed.")
+                self.check_workers()
+                next_check = monotonic() + 1
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Tells all workers to stop and waits for them, terminating those that do not.
+
+        :param timeout: Max secs to wait for each worker
+        """
+        for shard in self.processes:
+            self.commands[shard].put(("stop",))
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = {}
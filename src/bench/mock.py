@@ -0,0 +1,226 @@
+"""
+Local stand-ins for the Synapse bridge output api and the Telegram Bot API, for benchmarking the scanner
+without touching the network. Both run in their own process so they do not compete with the scanner for the GIL.
+"""
+import json
+import random
+
+from time import (
+    sleep,
+    monotonic,
+)
+from hashlib import sha256
+from threading import (
+    Lock,
+    Thread,
+)
+from collections import Counter
+from multiprocessing import get_context
+from urllib.parse import (
+    urlsplit,
+    parse_qs,
+)
+from http.server import (
+    ThreadingHTTPServer,
+    BaseHTTPRequestHandler,
+)
+
+from src.common.ratelimit import TokenBucket
+
+
+class MockSettings:
+    """Behaviour of the mock bridge api. Every random draw is seeded, so equal runs see equal responses."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, error_rate: float = 0.0,
+                 max_rps: float = 0, arb_rate: float = 0.05, seed: int = 0, decimals: dict | None = None):
+        """
+        :param latency: Median secs to answer a quote
+        :param jitter: Sigma of the lognormal latency, 0 answers every quote in exactly latency secs
+        :param error_rate: Fraction of quotes answered with a 500 error
+        :param max_rps: Quotes per sec served before answering 429 with Retry-After, 0 never rate limits
+        :param arb_rate: Fraction of routes quoted with a profitable arbitrage
+        :param seed: Seed of all random draws
+        :param decimals: Dictionary where key-'chain_id:token', value-token decimals. Quotes between tokens of
+                         different decimals are rescaled, tokens missing are quoted in the decimals they were sent in
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.arb_rate = arb_rate
+        self.seed = seed
+        self.decimals = decimals or {}
+
+
+def seeded_random(seed: int, *parts) -> random.Random:
+    """
+    Returns a random generator seeded from seed and parts, independent of the order requests arrive in.
+
+    :param seed: Base seed
+    :param parts: Values identifying the draw
+    :return: Seeded Random
+    """
+    digest = sha256(":".join(str(part) for part in (seed, *parts)).encode()).digest()
+
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def route_edge(seed: int, arb_rate: float, chain_in: str, chain_out: str, token_in: str, token_out: str) -> float:
+    """
+    Returns the fraction of the amount a route gains or loses when bridged, fixed per route.
+    About arb_rate of routes gain between 0.05% and 0.2%, the rest lose between 0.02% and 0.1%.
+
+    :return: Edge as a fraction of the amount swapped
+    """
+    rng = seeded_random(seed, "edge", chain_in, chain_out, token_in, token_out)
+    if rng.random() < arb_rate:
+        return rng.uniform(0.0005, 0.002)
+
+    return -rng.uniform(0.0002, 0.001)
+
+
+class MockBridgeHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests with fromChain, toChain, fromToken, toToken & amountFrom like estimate_bridge_output.
+    GET /stats returns response counts by status.
+    """
+
+    protocol_version = "HTTP/1.1"
+    settings = MockSettings()
+    bucket = None
+    lock = Lock()
+    seen = Counter()
+    stats = Counter()
+
+    def do_HEAD(self) -> None:
+        self.respond(200, b"")
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            with self.lock:
+                self.respond(200, json.dumps(self.stats).encode())
+            return
+
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            amount_in = int(query['amountFrom'])
+            route = (query['fromChain'], query['toChain'], query['fromToken'], query['toToken'])
+        except (KeyError, ValueError):
+            self.reply(400, {"error": "Invalid query"})
+            return
+
+        settings = self.settings
+        with self.lock:
+            # Repeats of the same quote get their own, but reproducible, draws
+            self.seen[url.query] += 1
+            draw = self.seen[url.query]
+            limited = self.bucket is not None and not self.bucket.take(monotonic())
+
+        if limited:
+            self.reply(429, {"error": "Too many requests"}, {"Retry-After": "1"})
+            return
+
+        rng = seeded_random(settings.seed, url.query, draw)
+        if settings.latency > 0:
+            sleep(settings.latency * (rng.lognormvariate(0, settings.jitter) if settings.jitter > 0 else 1))
+
+        if rng.random() < settings.error_rate:
+            self.reply(500, {"error": "Internal server error"})
+            return
+
+        edge = route_edge(settings.seed, settings.arb_rate, *route)
+        amount_out = int(amount_in * (1 + edge))
+        decimals_in = settings.decimals.get(f"{route[0]}:{route[2]}")
+        decimals_out = settings.decimals.get(f"{route[1]}:{route[3]}")
+        if decimals_in is not None and decimals_out is not None:
+            # Integer scaling, floats lose precision at 18 decimals
+            if decimals_out >= decimals_in:
+                amount_out *= 10 ** (decimals_out - decimals_in)
+            else:
+                amount_out //= 10 ** (decimals_in - decimals_out)
+        self.reply(200, {"amountToReceive": str(amount_out)})
+
+    def reply(self, status: int, body: dict, headers: dict | None = None) -> None:
+        with self.lock:
+            self.stats[str(status)] += 1
+        self.respond(status, json.dumps(body).encode(), headers)
+
+    def respond(self, status: int, body: bytes, headers: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class MockTelegramHandler(BaseHTTPRequestHandler):
+    """Accepts every sendMessage request like the Telegram Bot API. GET /stats returns the number of messages."""
+
+    protocol_version = "HTTP/1.1"
+    lock = Lock()
+    stats = Counter()
+
+    def do_HEAD(self) -> None:
+        self.respond(b"")
+
+    def do_GET(self) -> None:
+        with self.lock:
+            self.respond(json.dumps(self.stats).encode())
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.lock:
+            self.stats["messages"] += 1
+        self.respond(json.dumps({"ok": True, "result": {}}).encode())
+
+    def respond(self, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Accept as many connections as the scanner opens at once
+    request_queue_size = 1024
+
+
+def serve(settings: MockSettings, ports) -> None:
+    MockBridgeHandler.settings = settings
+    if settings.max_rps > 0:
+        MockBridgeHandler.bucket = TokenBucket(rate=settings.max_rps, capacity=settings.max_rps)
+
+    bridge = MockServer(("127.0.0.1", 0), MockBridgeHandler)
+    telegram = MockServer(("127.0.0.1", 0), MockTelegramHandler)
+    ports.put((bridge.server_port, telegram.server_port))
+
+    Thread(target=telegram.serve_forever, daemon=True).start()
+    bridge.serve_forever()
+
+
+def start_mock_servers(settings: MockSettings) -> tuple:
+    """
+    Starts the mock bridge api and Telegram stub in a child process.
+
+    :param settings: Mock bridge behaviour
+    :return: Tuple of (process, bridge api url, telegram api url)
+    """
+    context = get_context("spawn")
+    ports = context.Queue()
+    process = context.Process(target=serve, args=(settings, ports), name="mock-servers", daemon=True)
+    process.start()
+    bridge_port, telegram_port = ports.get(timeout=30)
+
+    return (process, f"http://127.0.0.1:{bridge_port}/estimate_bridge_output",
+            f"http://127.0.0.1:{telegram_port}")
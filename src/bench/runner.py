@@ -0,0 +1,226 @@
+"""
+Runs the API bot's scan pipeline against the mock servers and measures it.
+Each scale runs in a fresh process, so peak memory and threads are those of that scale alone.
+"""
+import os
+import math
+import resource
+import threading
+
+from time import (
+    time,
+    sleep,
+    perf_counter,
+)
+from typing import List
+from itertools import count
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from src.api.engine import ScanEngine
+from src.api.helpers import parse_args
+from src.api.rpc import (
+    quote_cache,
+    quote_history,
+    bridge_client,
+    alert_deduplicator,
+)
+from src.common.history import query_quotes
+from src.common.logger import setup_loggers
+from src.common.message import get_dispatcher
+from src.common.transport import (
+    configure_transport,
+    warm_up,
+)
+from src.variables import (
+    network_ids,
+    telegram_api,
+)
+
+
+# Tokens of the synthetic coins, stablecoins first so select_arb's check_max_arb is exercised too
+bench_tokens = ["USDC", "USDT", "DAI", "ETH"]
+bench_amounts = [9000, 30000, 50000, 100000, 150000, 200000, 300000]
+
+
+def bench_decimals() -> dict:
+    """
+    Returns the decimals of every bench token on every chain. Like in api.json, ETH and Binance tokens have 18,
+    the rest 6, so routes between tokens of different decimals are benchmarked too.
+
+    :return: Dictionary where key-'chain_id:token', value-token decimals
+    """
+    return {f"{chain_id}:{token}": 18 if token == "ETH" or chain_id == "56" else 6
+            for chain_id in network_ids for token in bench_tokens}
+
+
+def bench_config(routes: int, bridge_api: str, amounts: int = 4, arbitrage: float = 25) -> dict:
+    """
+    Builds an api.json style config with at least the given number of routes. Every coin is offered on
+    every chain, so each coin adds chains x (chains - 1) routes.
+
+    :param routes: Min number of routes
+    :param bridge_api: Synapse bridge output api
+    :param amounts: Number of swap amounts per route
+    :param arbitrage: Min arbitrage of every coin
+    :return: Config dictionary
+    """
+    chain_ids = sorted(network_ids, key=int)
+    decimals = bench_decimals()
+    per_coin = len(chain_ids) * (len(chain_ids) - 1)
+
+    coins = {}
+    for index in range(-(-routes // per_coin)):
+        token = bench_tokens[index % len(bench_tokens)]
+        coins[f"{token}{index}"] = {
+            "swap_amount": bench_amounts[:amounts],
+            "arbitrage": arbitrage,
+            "networks": {network_ids[chain_id]: {"decimals": decimals[f"{chain_id}:{token}"],
+                                                 "chain_id": int(chain_id), "token": token}
+                         for chain_id in chain_ids},
+        }
+
+    return {
+        "settings": {
+            "special_chat": {"max_swap_amount": 10000, "coins": bench_tokens[:1]},
+            "bridge_api": bridge_api,
+        },
+        "coins": coins,
+    }
+
+
+def percentile(values: list, q: float) -> float | None:
+    """
+    Returns the nearest-rank percentile of values.
+
+    :param values: Sorted list of numbers
+    :param q: Percentile between 0 and 100
+    :return: Percentile, None if values is empty
+    """
+    if not values:
+        return None
+
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class ThreadSampler:
+    """Samples the number of live threads from a background thread and keeps the peak."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampler", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            # Do not count the sampler itself
+            self.peak = max(self.peak, threading.active_count() - 1)
+            sleep(self.interval)
+
+
+def run_scale(routes: int, bridge_api: str, work_dir: str, loops: int = 5, warmup: int = 1,
+              amounts: int = 4, max_in_flight: int = 32, max_rps: float = 0) -> dict:
+    """
+    Scans a synthetic plan of routes like api.py does: parse_args, transport warm up, quote history and
+    alert dedupe, then ScanEngine loops that quote every route and alert through the Telegram dispatcher.
+    The quote cache is disabled so every loop requests all quotes, and the client's rate limit unless max_rps
+    is given, so the pipeline is measured rather than the limiter. Must run in a fresh process,
+    with TELEGRAM_API pointing at the Telegram stub.
+
+    :param routes: Number of routes to scan
+    :param bridge_api: Mock bridge output api
+    :param work_dir: Directory for the quote history database and logs of this run
+    :param loops: Number of measured loops
+    :param warmup: Number of loops run before measuring
+    :param amounts: Number of swap amounts per route
+    :param max_in_flight: Max number of quote requests in flight
+    :param max_rps: Max quote requests per sec the client's rate limiter starts at, 0 disables it
+    :return: Dictionary of measurements
+    """
+    setup_loggers(logs_dir=f"{work_dir}/logs")
+    arguments = parse_args(bench_config(routes, bridge_api, amounts))[:routes]
+
+    pool_size = min(len(arguments), max_in_flight)
+    configure_transport(pool_size)
+    warm_up([bridge_api], connections=pool_size)
+    warm_up([telegram_api])
+
+    quote_cache.configure(ttl=0, max_size=4096)
+    bridge_client.configure(hedge=True, min_samples=20, failures=5, eject_time=30, max_eject_time=300,
+                            max_workers=2 * max_in_flight,
+                            rate_limit={'max_rate': max_rps or math.inf})
+    quote_history.open(f"{work_dir}/quotes.db")
+    alert_deduplicator.configure(cooldown=300, materiality=0.2)
+    engine = ScanEngine(max_in_flight=max_in_flight)
+
+    loop_times, signals, alerts = [], 0, 0
+    with ThreadSampler() as sampler:
+        for loop in count():
+            if loop == warmup:
+                measured_from = time()
+            elif loop == warmup + loops:
+                break
+
+            start = perf_counter()
+            outputs = engine.run(arguments)
+            elapsed = perf_counter() - start
+
+            # Alerts are deduplicated across loops, so most are sent during warm up
+            alerts += sum(1 for _, report in outputs if report and report['alerted'])
+            if loop >= warmup:
+                loop_times.append(elapsed)
+                signals += sum(1 for _, report in outputs if report)
+
+        get_dispatcher().stop()
+        quote_history.close()
+
+    engine.close()
+
+    quotes = query_quotes(f"{work_dir}/quotes.db", start=measured_from)
+    latencies = sorted(quote[4] for quote in quotes if quote[4] is not None)
+
+    return {
+        "routes": len(arguments),
+        "loops": loops,
+        "loop_time": sorted(loop_times)[len(loop_times) // 2],
+        "loop_time_max": max(loop_times),
+        "requests": len(quotes),
+        "failed": sum(1 for quote in quotes if quote[3] is None),
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "rps": len(quotes) / sum(loop_times),
+        "signals": signals,
+        "alerts": alerts,
+        "peak_threads": sampler.peak,
+        # ru_maxrss is in KB on Linux
+        "peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_scales(scales: List[int], bridge_api: str, work_dir: str, **kwargs) -> List[dict]:
+    """
+    Runs run_scale for each number of routes, each in its own process.
+
+    :param scales: Numbers of routes
+    :param bridge_api: Mock bridge output api
+    :param work_dir: Directory for each run's files, one sub directory per scale
+    :param kwargs: Keyword arguments of run_scale
+    :return: List of run_scale outputs
+    """
+    results = []
+    for routes in scales:
+        scale_dir = f"{work_dir}/{routes}"
+        os.makedirs(scale_dir, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results.append(executor.submit(run_scale, routes, bridge_api, scale_dir, **kwargs).result())
+
+    return results
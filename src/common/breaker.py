@@ -0,0 +1,175 @@
+"""
+Circuit breakers that stop polling routes and chains which keep failing.
+"""
+from time import monotonic
+from typing import Callable
+
+from src.common.logger import log_error
+from src.common.message import telegram_enqueue_msg
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Closed while calls succeed. Opens after `failures` consecutive failures and rejects calls for
+    `backoff` secs, then lets a single probe through per backoff period (half-open). A successful probe
+    closes it, a failed one re-opens it with the backoff doubled, up to max_backoff.
+    """
+
+    __slots__ = ("failures", "base_backoff", "max_backoff", "state", "failure_count", "backoff", "open_until")
+
+    def __init__(self, failures: int = 3, backoff: float = 30, max_backoff: float = 3600):
+        """
+        :param failures: Consecutive failures that open the breaker
+        :param backoff: Secs the breaker stays open after first tripping
+        :param max_backoff: Max secs the breaker stays open
+        """
+        self.failures = failures
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failure_count = 0
+        self.backoff = backoff
+        self.open_until = 0.0
+
+    def allow(self) -> bool:
+        """
+        Returns True if a call may be made. An open breaker whose backoff has passed lets one probe through.
+
+        :return: True if call is allowed
+        """
+        if self.state == CLOSED:
+            return True
+
+        now = monotonic()
+        if now >= self.open_until:
+            # Let one probe through, another one only if it never reports back within backoff
+            self.state = HALF_OPEN
+            self.open_until = now + self.backoff
+            return True
+
+        return False
+
+    def retry_in(self) -> float:
+        """
+        Returns secs until the breaker lets a probe through.
+
+        :return: Secs to wait for
+        """
+        return max(0.0, self.open_until - monotonic())
+
+    def record_success(self) -> str:
+        """
+        Records a successful call and closes the breaker.
+
+        :return: Previous state
+        """
+        previous = self.state
+        self.state = CLOSED
+        self.failure_count = 0
+        self.backoff = self.base_backoff
+
+        return previous
+
+    def record_failure(self) -> str:
+        """
+        Records a failed call, opening the breaker if failures threshold is hit or a probe failed.
+
+        :return: Previous state
+        """
+        previous = self.state
+        self.failure_count += 1
+
+        if self.state == HALF_OPEN:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.trip()
+        elif self.state == CLOSED and self.failure_count >= self.failures:
+            self.trip()
+
+        return previous
+
+    def trip(self) -> None:
+        self.state = OPEN
+        self.open_until = monotonic() + self.backoff
+
+
+class BreakerRegistry:
+    """
+    Circuit breakers keyed by name, eg. one per route and one per chain.
+    Calls on_change(key, breaker) when a breaker first opens and when it closes again.
+    """
+
+    def __init__(self, failures: int = 3, backoff: float = 30, max_backoff: float = 3600,
+                 on_change: Callable | None = None):
+        """
+        :param failures: Consecutive failures that open a breaker
+        :param backoff: Secs a breaker stays open after first tripping
+        :param max_backoff: Max secs a breaker stays open
+        :param on_change: Function called with key and breaker when a breaker opens or closes
+        """
+        self.failures = failures
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_change = on_change
+        self.breakers = {}
+
+    def get(self, key: str) -> CircuitBreaker:
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(self.failures, self.backoff, self.max_backoff)
+
+        return self.breakers[key]
+
+    def allow(self, key: str) -> bool:
+        return self.get(key).allow()
+
+    def record(self, key: str, success: bool) -> None:
+        """
+        Records the outcome of a call and notifies on_change if the breaker opened or closed.
+
+        :param key: Breaker key
+        :param success: True if the call succeeded
+        """
+        breaker = self.get(key)
+        if success:
+            previous = breaker.record_success()
+            changed = previous != CLOSED
+        else:
+            previous = breaker.record_failure()
+            changed = previous == CLOSED and breaker.state == OPEN
+
+        if changed and self.on_change:
+            self.on_change(key, breaker)
+
+    def tripped(self) -> dict:
+        """
+        Returns all breakers that are not closed.
+
+        :return: Dictionary of key and breaker
+        """
+        return {key: breaker for key, breaker in self.breakers.items() if breaker.state != CLOSED}
+
+
+def report_breaker_change(program_name: str) -> Callable:
+    """
+    Returns an on_change function that reports breakers opening and closing in the terminal,
+    error.log and the Telegram debug chat.
+
+    :param program_name: Name of running program, eg. SYNAPSE_API
+    :return: Function to pass as BreakerRegistry on_change
+    """
+    def on_change(key: str, breaker: CircuitBreaker) -> None:
+        if breaker.state == OPEN:
+            message = f"⚠️ {program_name} circuit open: {key} failed {breaker.failure_count} times. " \
+                      f"Probing again in {breaker.retry_in():,.0f} secs."
+        else:
+            message = f"✅ {program_name} circuit closed: {key} recovered."
+
+        log_error.warning(message)
+        print(message)
+        telegram_enqueue_msg(message, debug=True)
+
+    return on_change
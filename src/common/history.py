@@ -0,0 +1,218 @@
+"""
+Append-only store of every bridge quote, kept in SQLite for later analysis and backtesting.
+"""
+import os
+import sqlite3
+
+from time import (
+    time,
+    monotonic,
+)
+from queue import (
+    SimpleQueue,
+    Empty,
+)
+from threading import Thread
+
+from src.common.logger import log_error
+
+
+schema = """
+CREATE TABLE IF NOT EXISTS routes (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quotes (
+    route_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    amount_in REAL NOT NULL,
+    amount_out REAL,
+    latency REAL,
+    PRIMARY KEY (route_id, ts, amount_in)
+) WITHOUT ROWID;
+"""
+
+
+class QuoteHistory:
+    """
+    Records quotes from any thread without blocking it: records are queued and a background thread
+    inserts them in batches of up to batch_size, or every flush_interval secs, in a single transaction.
+
+    Quotes are clustered by route and time in a SQLite database in WAL mode,
+    so range queries per route read only the rows they return, and can run while quotes are written.
+    A failed quote is stored with amount_out NULL. Does nothing until opened.
+
+    Several processes can record to the same database: a writer waits up to busy_timeout secs for another's
+    transaction, and a batch still locked out after that is retried with the next one, up to max_attempts times.
+    """
+
+    max_attempts = 3
+
+    def __init__(self):
+        self.path = None
+        self.batch_size = 500
+        self.flush_interval = 1
+        self.busy_timeout = 5
+        self.queue = SimpleQueue()
+        self.thread = None
+        self.written = 0
+
+    def open(self, path: str, batch_size: int = 500, flush_interval: float = 1, busy_timeout: float = 5) -> None:
+        """
+        Creates the database if needed and starts recording.
+
+        :param path: Path of the SQLite database file
+        :param batch_size: Max number of quotes inserted per transaction
+        :param flush_interval: Max secs a quote waits in the queue before being written
+        :param busy_timeout: Max secs to wait for another process writing to the database
+        """
+        if self.thread is not None:
+            return
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = sqlite3.connect(path, timeout=busy_timeout)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(schema)
+        connection.close()
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.busy_timeout = busy_timeout
+        self.thread = Thread(target=self.run, name="history", daemon=True)
+        self.thread.start()
+
+    def record(self, route: str, amount_in: float, amount_out: float | None, latency: float | None) -> None:
+        """
+        Queues a quote to be written.
+
+        :param route: Route name, eg. 'USDC:Ethereum->USDC:Optimism'
+        :param amount_in: Amount swapped, in whole tokens
+        :param amount_out: Amount received, in whole tokens, None if the quote failed
+        :param latency: Secs the HTTP exchange of the quote took, None if no response was received
+        """
+        if self.thread is not None:
+            self.queue.put((route, time(), amount_in, amount_out, latency))
+
+    def close(self, timeout: float = 10) -> None:
+        """
+        Writes all queued quotes and stops recording.
+
+        :param timeout: Max secs to wait for queued quotes to be written
+        """
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def run(self) -> None:
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        route_ids = dict(connection.execute("SELECT name, id FROM routes"))
+
+        stopping = False
+        retry, attempts = [], 0
+        while not stopping:
+            batch = retry
+            deadline = monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - monotonic()))
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if not batch:
+                continue
+
+            retry, attempts = [], attempts + 1
+            try:
+                self.write(connection, route_ids, batch)
+                attempts = 0
+            except sqlite3.OperationalError as e:
+                # Locked by another process for longer than busy_timeout
+                if attempts < self.max_attempts and not stopping:
+                    log_error.warning(f"'HistoryError' - {len(batch)} quotes retried: {e}")
+                    retry = batch
+                else:
+                    log_error.warning(f"'HistoryError' - {len(batch)} quotes not written: {e}")
+                    attempts = 0
+            except sqlite3.Error as e:
+                log_error.warning(f"'HistoryError' - {len(batch)} quotes not written: {e}")
+                attempts = 0
+
+        connection.close()
+
+    def write(self, connection: sqlite3.Connection, route_ids: dict, batch: list) -> None:
+        """
+        Inserts a batch of quotes in one transaction, adding routes not seen before.
+        A quote of a route, time and amount already recorded is skipped, keeping the first observation.
+
+        :param connection: Writer's SQLite connection
+        :param route_ids: Dictionary where key-route name, value-route id, updated once committed
+        :param batch: List of (route, ts, amount_in, amount_out, latency) tuples
+        """
+        new_ids = {}
+        with connection:
+            for route in {item[0] for item in batch} - route_ids.keys():
+                connection.execute("INSERT OR IGNORE INTO routes (name) VALUES (?)", (route,))
+                new_ids[route] = connection.execute("SELECT id FROM routes WHERE name = ?", (route,)).fetchone()[0]
+
+            ids = route_ids | new_ids
+            connection.executemany("INSERT OR IGNORE INTO quotes VALUES (?, ?, ?, ?, ?)",
+                                   [(ids[route], *rest) for route, *rest in batch])
+        # Only once committed, a rolled back route id may be taken by another process
+        route_ids.update(new_ids)
+        self.written += len(batch)
+
+
+def query_quotes(path: str, route: str | None = None, start: float | None = None,
+                 end: float | None = None) -> list:
+    """
+    Returns recorded quotes in time order, for one route or all.
+
+    :param path: Path of the SQLite database file
+    :param route: Route name, all routes if None
+    :param start: Unix time to return quotes from, inclusive
+    :param end: Unix time to return quotes until, exclusive
+    :return: List of (route, ts, amount_in, amount_out, latency) tuples
+    """
+    conditions, params = [], []
+    if route is not None:
+        conditions.append("routes.name = ?")
+        params.append(route)
+    if start is not None:
+        conditions.append("quotes.ts >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("quotes.ts < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return connection.execute(
+            f"SELECT routes.name, quotes.ts, quotes.amount_in, quotes.amount_out, quotes.latency "
+            f"FROM quotes JOIN routes ON routes.id = quotes.route_id {where} "
+            f"ORDER BY routes.name, quotes.ts", params).fetchall()
+    finally:
+        connection.close()
+
+
+def query_routes(path: str) -> list:
+    """
+    Returns the names of all routes with recorded quotes.
+
+    :param path: Path of the SQLite database file
+    :return: List of route names
+    """
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return [name for name, in connection.execute("SELECT name FROM routes ORDER BY name")]
+    finally:
+        connection.close()
@@ -1,6 +1,19 @@
 import os
+import gzip
+import json
+import queue
+import shutil
 import logging
 
+from atexit import register
+from datetime import datetime
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+
 from src.variables import (
     log_format,
     time_format,
@@ -8,25 +21,84 @@ from src.variables import (
 )
 
 
+# Optional fields callers pass with extra={...}, written as JSON keys when set
+structured_fields = ("route", "amount", "latency", "status")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as a single JSON object line, with any of structured_fields set on the record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in structured_fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                line[field] = value
+
+        return json.dumps(line, default=str)
+
+
+def gzip_namer(name: str) -> str:
+    return f"{name}.gz"
+
+
+def gzip_rotator(source: str, dest: str) -> None:
+    """Compresses a rotated log file and removes the original."""
+    with open(source, 'rb') as file_in, gzip.open(dest, 'wb') as file_out:
+        shutil.copyfileobj(file_in, file_out)
+    os.remove(source)
+
+
+def file_handler(
+        filename: str,
+        max_bytes: int = 10_000_000,
+        backups: int = 5,
+        when: str | None = None,
+        json_lines: bool = False,
+) -> logging.Handler:
+    """
+    Creates a log file handler that rotates by size, or by time if when is given, and gzips rotated files.
+
+    :param filename: Name of filename
+    :param max_bytes: Size in bytes to rotate the file at, 0 never rotates by size
+    :param backups: Number of rotated files to keep
+    :param when: Time interval to rotate the file at, eg. 'midnight' or 'H', see TimedRotatingFileHandler
+    :param json_lines: Write JSON lines instead of plain text
+    :returns: Log handler
+    """
+    if when:
+        handler = TimedRotatingFileHandler(filename, when=when, backupCount=backups)
+    else:
+        handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backups)
+    handler.namer = gzip_namer
+    handler.rotator = gzip_rotator
+
+    if json_lines:
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(log_format, datefmt=time_format))
+
+    return handler
+
+
 def logger_setup(
         log_name: str,
-        filename: str,
+        handler: logging.Handler,
         level=logging.DEBUG,
 ) -> logging.Logger:
     """
     Sets up a new logger config.
 
     :param log_name: Name of Logger. Make sure unique name is given for each Log
-    :param filename: Name of filename
+    :param handler: Handler the logger writes to
     :param level: Logger level of severity
     :returns: An instance of the Logger class
     """
-    # Set up formatting style
-    formatter = logging.Formatter(log_format, datefmt=time_format)
-
-    handler = logging.FileHandler(filename)
-    handler.setFormatter(formatter)
-
     # Create logger with name, level and handler
     logger = logging.getLogger(log_name)
     logger.setLevel(level)
@@ -36,9 +108,68 @@ def logger_setup(
 
 
 logs_dir_path = f"{project_root_dir}/logs"
-if not os.path.isdir(logs_dir_path):
-    os.mkdir(logs_dir_path)
 
-log_error = logger_setup("error", f"{project_root_dir}/logs/error.log")
-log_telegram = logger_setup("telegram", f"{project_root_dir}/logs/telegram.log")
-log_arbitrage = logger_setup("arbitrage", f"{project_root_dir}/logs/arbitrage.log")
+# Logger name -> log file name. Loggers only write to their files once setup_loggers is called.
+log_files = {
+    "error": "error.log",
+    "telegram": "telegram.log",
+    "arbitrage": "arbitrage.log",
+}
+
+log_error = logging.getLogger("error")
+log_telegram = logging.getLogger("telegram")
+log_arbitrage = logging.getLogger("arbitrage")
+
+_listener: QueueListener | None = None
+
+
+def setup_loggers(
+        logs_dir: str = logs_dir_path,
+        max_bytes: int = 10_000_000,
+        backups: int = 5,
+        when: str | None = None,
+        json_lines: bool = False,
+) -> None:
+    """
+    Creates the logs directory and routes every logger through a queue to its own rotating log file.
+    Callers only put records on the queue, a background thread writes them to disk.
+    Only the first call has effect, so importing modules never touches the disk and programs call this
+    once on start. Queued records are written before the program exits.
+
+    :param logs_dir: Directory to write log files to
+    :param max_bytes: Size in bytes to rotate each file at, 0 never rotates by size
+    :param backups: Number of rotated files to keep per log
+    :param when: Time interval to rotate files at instead of size, eg. 'midnight'
+    :param json_lines: Write JSON lines instead of plain text
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    os.makedirs(logs_dir, exist_ok=True)
+
+    records = queue.SimpleQueue()
+    handlers = []
+    for log_name, filename in log_files.items():
+        handler = file_handler(f"{logs_dir}/{filename}", max_bytes, backups, when, json_lines)
+        # The listener hands every record to all handlers, so each only keeps its own logger's records
+        handler.addFilter(logging.Filter(log_name))
+        handlers.append(handler)
+
+        logger_setup(log_name, QueueHandler(records))
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    register(stop_loggers)
+
+
+def stop_loggers() -> None:
+    """Writes all queued records, stops the background writer and closes log files."""
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
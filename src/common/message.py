@@ -1,31 +1,103 @@
 import requests
 
-from time import sleep
+from time import (
+    sleep,
+    monotonic,
+    perf_counter,
+)
+from queue import (
+    Queue,
+    Empty,
+)
+from atexit import register
+from threading import (
+    Lock,
+    Thread,
+)
+from json.decoder import JSONDecodeError
 
-from requests.exceptions import ConnectionError
+from requests.exceptions import RequestException
 
 from src.common.logger import (
     log_error,
     log_telegram,
 )
+from src.common.transport import get_session
+from src.common.ratelimit import TokenBucket
+from src.common.metrics import (
+    telegram_latency,
+    telegram_queue,
+)
 from src.variables import (
-    TOKEN,
-    CHAT_ID_ALERTS,
-    CHAT_ID_DEBUG,
+    get_env,
+    telegram_api,
 )
 
 
+# Telegram rejects messages longer than this
+max_message_length = 4096
+
+
+def post_telegram_msg(
+        message_text: str,
+        telegram_token: str,
+        telegram_chat_id: str,
+        disable_web_page_preview: bool = True,
+        timeout: float = 10,
+) -> tuple:
+    """
+    Makes a single sendMessage request to Telegram.
+
+    :param message_text: Text message to send
+    :param telegram_token: Telegram TOKEN API
+    :param telegram_chat_id: Telegram chat ID
+    :param disable_web_page_preview: Set web preview on/off
+    :param timeout: Max secs to wait for POST request
+    :return: Tuple of (requests.Response or None, secs Telegram asks to wait before retrying or None)
+    :raises RequestException: If Telegram can not be reached, times out or retries run out
+    :raises JSONDecodeError: If Telegram's response is not valid JSON
+    """
+    # construct url using token for a sendMessage POST request
+    url = f"{telegram_api}/bot{telegram_token}/sendMessage"
+
+    # Construct data for the request
+    payload = {
+        "chat_id": telegram_chat_id,
+        "text": message_text,
+        "disable_web_page_preview": disable_web_page_preview,
+        "parse_mode": "HTML"
+    }
+
+    start = perf_counter()
+    try:
+        post_request = get_session().post(url=url, data=payload, timeout=timeout)
+    finally:
+        telegram_latency.observe(perf_counter() - start)
+    response = post_request.json()
+
+    if response.get('ok'):
+        return post_request, None
+
+    retry_after = response.get('parameters', {}).get('retry_after')
+    log_error.warning(f"'Telegram Message not sent, {response.get('error_code')} - "
+                      f"{response.get('description')}. Retry after: {retry_after}")
+
+    return None, retry_after
+
+
 def telegram_send_msg(
         message_text: str,
         disable_web_page_preview: bool = True,
-        telegram_token: str = TOKEN,
-        telegram_chat_id: str = CHAT_ID_ALERTS,
+        telegram_token: str | None = None,
+        telegram_chat_id: str | None = None,
         debug: bool = False,
         timeout: float = 10,
         sleep_time: int = 3,
+        max_retries: int = 5,
 ) -> requests.Response or None:
     """
-    Sends a Telegram message to a specified chat.
+    Sends a Telegram message to a specified chat and blocks until it is sent.
+    Scanning code should use telegram_enqueue_msg instead.
     Must have a .env file with the following variables:
     TOKEN: your Telegram access token.
     CHAT_ID: the specific id of the chat you want the message sent to
@@ -38,44 +110,238 @@ def telegram_send_msg(
     :param telegram_chat_id: Telegram chat ID for alerts, default is 'CHAT_ID_ALERTS' from .env file
     :param debug: If true sends message to Telegram 'CHAT_ID_DEBUG' chat taken from .env file
     :param timeout: Max secs to wait for POST request
-    :param sleep_time: Time to sleep if Telegram bot clutters
+    :param sleep_time: Time to sleep if Telegram bot clutters and does not say how long to wait
+    :param max_retries: Max number of attempts before giving up
     :return: requests.Response
     """
-    telegram_token = str(telegram_token)
-    telegram_chat_id = str(telegram_chat_id)
-    message_text = str(message_text)
-
     # if Chat ID not provided - try CHAT_ID_ALERTS or CHAT_ID_DEBUG variable from the .env file
     if debug:
-        telegram_chat_id = CHAT_ID_DEBUG
-
-    # construct url using token for a sendMessage POST request
-    url = f"https://api.telegram.org/bot{telegram_token}/sendMessage"
+        telegram_chat_id = get_env("CHAT_ID_DEBUG")
+    elif telegram_chat_id is None:
+        telegram_chat_id = get_env("CHAT_ID_ALERTS")
 
-    # Construct data for the request
-    payload = {
-        "chat_id": telegram_chat_id,
-        "text": message_text,
-        "disable_web_page_preview": disable_web_page_preview,
-        "parse_mode": "HTML"
-    }
+    telegram_token = str(telegram_token or get_env("TOKEN"))
+    telegram_chat_id = str(telegram_chat_id)
+    message_text = str(message_text)
 
     # send the POST request
     log_telegram.info(f"Telegram Sending: {message_text}")
     try:
-        counter = 1
-        # If too many requests, wait for Telegram's rate limit
-        while True:
-            post_request = requests.post(url=url, data=payload, timeout=timeout)
-
-            if post_request.json()['ok']:
+        for attempt in range(1, max_retries + 1):
+            post_request, retry_after = post_telegram_msg(message_text, telegram_token, telegram_chat_id,
+                                                          disable_web_page_preview, timeout)
+            if post_request is not None:
                 return post_request
 
-            log_error.warning(f"'Telegram Message not sent, attempt {counter}. "
-                              f"Sleeping {sleep_time} secs...")
-            counter += 1
-            sleep(sleep_time)
+            # If too many requests, wait for Telegram's rate limit
+            if attempt < max_retries:
+                sleep(retry_after or sleep_time)
 
-    except ConnectionError as ex:
+    except (RequestException, JSONDecodeError) as ex:
         log_error.warning(f"'Telegram Message not sent: {message_text}. {ex}")
         return None
+
+    log_error.warning(f"'Telegram Message dropped after {max_retries} attempts: {message_text}")
+    return None
+
+
+class TelegramDispatcher:
+    """
+    Sends Telegram messages from a background thread so callers never wait on Telegram.
+
+    Messages queued for the same chat within digest_window secs are merged into one digest message.
+    Each chat is limited by its own token bucket, paused for as long as Telegram's retry_after asks,
+    and a message is dropped after max_retries failed attempts.
+    """
+
+    def __init__(self, telegram_token: str | None = None, digest_window: float = 2, rate: float = 20 / 60,
+                 burst: int = 3, max_retries: int = 5, sleep_time: float = 3, timeout: float = 10):
+        """
+        :param telegram_token: Telegram TOKEN API, default is 'TOKEN' from .env file
+        :param digest_window: Secs to collect messages for a chat before sending them as one
+        :param rate: Messages per sec allowed per chat
+        :param burst: Max number of messages sent back to back per chat
+        :param max_retries: Max number of attempts per message before dropping it
+        :param sleep_time: Secs to pause a chat after a failure without retry_after
+        :param timeout: Max secs to wait for POST request
+        """
+        self.telegram_token = str(telegram_token or get_env("TOKEN"))
+        self.digest_window = digest_window
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.sleep_time = sleep_time
+        self.timeout = timeout
+
+        self.queue = Queue()
+        # chat_id -> [monotonic time first message was queued, list of messages, attempts]
+        self.pending = {}
+        # Number of messages in pending, only updated by the dispatcher thread
+        self.pending_messages = 0
+        telegram_queue.set_function(self.depth)
+        self.buckets = {}
+        self.thread = Thread(target=self.run, name="telegram", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, message_text: str, telegram_chat_id: str) -> None:
+        self.queue.put((str(telegram_chat_id), str(message_text)))
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Sends all queued messages, waiting at most timeout secs, and stops the dispatcher thread.
+
+        :param timeout: Max secs to wait for queued messages to be sent
+        """
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self) -> None:
+        stopping = False
+        while not stopping or self.pending:
+            # The thread must outlive any single failed send, or every later alert would be lost
+            try:
+                try:
+                    item = self.queue.get(timeout=self.next_wakeup())
+                    if item is None:
+                        stopping = True
+                    else:
+                        chat_id, message_text = item
+                        self.pending.setdefault(chat_id, [monotonic(), [], 0])[1].append(message_text)
+                except Empty:
+                    pass
+
+                self.flush(force=stopping)
+            except Exception as ex:
+                log_error.warning(f"'TelegramError' - dispatcher failed to send, retrying: {type(ex).__name__} {ex}")
+                sleep(self.sleep_time)
+
+            self.pending_messages = sum(len(messages) for _, messages, _ in self.pending.values())
+
+    def depth(self) -> int:
+        """
+        Returns the number of messages queued or waiting to be sent.
+
+        :return: Number of messages
+        """
+        return self.queue.qsize() + self.pending_messages
+
+    def next_wakeup(self) -> float:
+        """
+        Returns secs until a pending chat may be sent to.
+
+        :return: Secs to wait for
+        """
+        now = monotonic()
+        wakeups = [max(first + self.digest_window, self.bucket(chat_id).ready_at(now))
+                   for chat_id, (first, _, _) in self.pending.items()]
+
+        return max(0.0, min(wakeups, default=now + 1) - now)
+
+    def bucket(self, chat_id: str) -> TokenBucket:
+        if chat_id not in self.buckets:
+            self.buckets[chat_id] = TokenBucket(self.rate, self.burst)
+
+        return self.buckets[chat_id]
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Sends every chat's pending messages whose digest window has passed and whose bucket has a token.
+
+        :param force: Send regardless of the digest window
+        """
+        for chat_id in list(self.pending):
+            first, messages, attempts = self.pending[chat_id]
+            now = monotonic()
+            if (now < first + self.digest_window and not force) or not self.bucket(chat_id).take(now):
+                continue
+
+            digest = merge_messages(messages)
+            log_telegram.info(f"Telegram Sending: {digest[0]}")
+            try:
+                post_request, retry_after = post_telegram_msg(digest[0], self.telegram_token, chat_id,
+                                                              timeout=self.timeout)
+            except (RequestException, JSONDecodeError) as ex:
+                log_error.warning(f"'Telegram Message not sent: {digest[0]}. {ex}")
+                post_request, retry_after = None, None
+
+            if post_request is not None:
+                remaining = digest[1:]
+                attempts = 0
+            else:
+                remaining = digest
+                attempts += 1
+                self.bucket(chat_id).pause(monotonic(), retry_after or self.sleep_time)
+
+                if attempts >= self.max_retries:
+                    log_error.warning(f"'Telegram Message dropped after {attempts} attempts: {digest[0]}")
+                    remaining = digest[1:]
+                    attempts = 0
+
+            if remaining:
+                self.pending[chat_id] = [first, remaining, attempts]
+            else:
+                del self.pending[chat_id]
+
+
+def merge_messages(messages: list) -> list:
+    """
+    Merges messages into as few digest messages as fit Telegram's message length limit.
+
+    :param messages: List of message texts
+    :return: List of digest message texts
+    """
+    if len(messages) == 1:
+        return messages
+
+    digests = []
+    current = ""
+    for message in messages:
+        if current and len(current) + len(message) + 2 > max_message_length:
+            digests.append(current)
+            current = ""
+        current = f"{current}\n\n{message}" if current else message
+    digests.append(current)
+
+    return digests
+
+
+_dispatcher: TelegramDispatcher | None = None
+_dispatcher_lock = Lock()
+
+
+def get_dispatcher() -> TelegramDispatcher:
+    """
+    Returns the shared Telegram dispatcher, starting it on first use.
+    Queued messages are sent before the program exits.
+
+    :return: TelegramDispatcher instance
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = TelegramDispatcher()
+                register(_dispatcher.stop)
+
+    return _dispatcher
+
+
+def telegram_enqueue_msg(
+        message_text: str,
+        telegram_chat_id: str | None = None,
+        debug: bool = False,
+) -> None:
+    """
+    Queues a Telegram message to be sent in the background and returns immediately.
+    Messages queued for the same chat in quick succession are sent as one digest.
+
+    :param message_text: Text message to send
+    :param telegram_chat_id: Telegram chat ID for alerts, default is 'CHAT_ID_ALERTS' from .env file
+    :param debug: If true sends message to Telegram 'CHAT_ID_DEBUG' chat taken from .env file
+    """
+    if debug:
+        telegram_chat_id = get_env("CHAT_ID_DEBUG")
+    elif telegram_chat_id is None:
+        telegram_chat_id = get_env("CHAT_ID_ALERTS")
+
+    get_dispatcher().enqueue(message_text, telegram_chat_id)
@@ -0,0 +1,271 @@
+"""
+In-process metrics registry, served over HTTP in the Prometheus text format.
+"""
+from bisect import bisect_left
+from threading import (
+    Lock,
+    Thread,
+)
+from typing import Callable
+from http.server import (
+    ThreadingHTTPServer,
+    BaseHTTPRequestHandler,
+)
+
+from src.common.logger import log_error
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    """
+    Returns a sample's label set, eg. '{route="USDC:Ethereum->USDC:Optimism"}'.
+
+    :param names: Label names
+    :param values: Label values, in the order of names
+    :param extra: Preformatted label appended last, eg. 'le="0.1"'
+    :return: Label set, empty if there are no labels
+    """
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return f"{{{','.join(pairs)}}}" if pairs else ""
+
+
+class Metric:
+    """Base of all metrics: a named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        """
+        :param name: Metric name, eg. synapse_quote_latency_seconds
+        :param documentation: Help text
+        :param labels: Label names, values are passed as keyword arguments when recording
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = Lock()
+        self.values = {}
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def samples(self) -> list:
+        """
+        Returns the metric's samples.
+
+        :return: List of (name suffix, label set, value)
+        """
+        with self.lock:
+            values = list(self.values.items())
+
+        return [("", format_labels(self.label_names, key), value) for key, value in values]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {format_value(value)}" for suffix, labels, value in self.samples()]
+
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Value that only goes up, eg. number of errors."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down, or is read from a function when scraped, eg. requests in flight."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self.functions = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels) -> None:
+        """
+        Reads the gauge's value from function on every scrape.
+
+        :param function: Function called without arguments that returns the value
+        """
+        with self.lock:
+            self.functions[self.key(labels)] = function
+
+    def samples(self) -> list:
+        with self.lock:
+            functions = list(self.functions.items())
+
+        samples = super().samples()
+        for key, function in functions:
+            try:
+                samples.append(("", format_labels(self.label_names, key), function()))
+            except Exception as e:
+                log_error.warning(f"'MetricsError' - {self.name} could not be read: {e}")
+
+        return samples
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, eg. request latency."""
+
+    kind = "histogram"
+
+    # Upper bounds in secs suited to HTTP request latency
+    default_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = default_buckets):
+        """
+        :param buckets: Bucket upper bounds in ascending order, +Inf is added
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Bucket counts, then sum and count
+                counts = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> list:
+        with self.lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+
+        samples = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", format_labels(self.label_names, key, f'le="{format_value(bound)}"'),
+                                cumulative))
+            samples.append(("_sum", format_labels(self.label_names, key), counts[-2]))
+            samples.append(("_count", format_labels(self.label_names, key), counts[-1]))
+
+        return samples
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them for a scrape."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            self.metrics[metric.name] = metric
+
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+
+        :return: Metrics text
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+quote_latency = registry.register(Histogram(
+    "synapse_quote_latency_seconds", "Secs a bridge quote took, per route.", ("route",)))
+chain_latency = registry.register(Histogram(
+    "synapse_chain_quote_latency_seconds", "Secs a bridge quote took, per origin or target chain.", ("chain",)))
+errors = registry.register(Counter(
+    "synapse_errors_total", "Number of failed quotes and page actions, per error type.", ("type",)))
+loop_duration = registry.register(Histogram(
+    "synapse_loop_duration_seconds", "Secs a scan loop took.",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)))
+loop_routes = registry.register(Gauge(
+    "synapse_loop_routes", "Number of routes scanned by the last loop."))
+in_flight = registry.register(Gauge(
+    "synapse_requests_in_flight", "Number of bridge quote requests in flight."))
+endpoint_latency = registry.register(Histogram(
+    "synapse_endpoint_latency_seconds", "Secs a bridge api request took, per endpoint.", ("endpoint",)))
+hedges = registry.register(Counter(
+    "synapse_hedged_requests_total", "Number of hedged bridge api requests, per endpoint and whether it won.",
+    ("endpoint", "won")))
+endpoint_rate = registry.register(Gauge(
+    "synapse_endpoint_allowed_rate", "Requests per sec the rate limiter of a bridge api endpoint allows.",
+    ("endpoint",)))
+ejections = registry.register(Counter(
+    "synapse_endpoint_ejections_total", "Number of times a bridge api endpoint was ejected.", ("endpoint",)))
+telegram_latency = registry.register(Histogram(
+    "synapse_telegram_send_latency_seconds", "Secs a Telegram sendMessage request took."))
+telegram_queue = registry.register(Gauge(
+    "synapse_telegram_queue_depth", "Number of Telegram messages waiting to be sent."))
+page_load = registry.register(Histogram(
+    "synapse_page_load_seconds", "Secs the Synapse dApp took to load in a driver.",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60)))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_metrics_server(port: int = 9101, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves all metrics at http://host:port/metrics from a background thread.
+
+    :param port: Port to listen on
+    :param host: Address to listen on, 127.0.0.1 only accepts local scrapes
+    :return: Running server
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+
+    return server
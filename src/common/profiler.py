@@ -0,0 +1,246 @@
+"""
+Opt-in sampling profiler that saves the stacks of scan loops that take longer than their budget.
+"""
+import os
+import re
+import sys
+
+from time import perf_counter
+from datetime import datetime
+from threading import (
+    Lock,
+    Thread,
+    Event,
+    enumerate as enumerate_threads,
+    get_ident,
+)
+from collections import Counter
+from typing import Callable
+
+from src.common.logger import log_error
+from src.variables import project_root_dir
+
+
+profiles_dir_path = f"{project_root_dir}/logs/profiles"
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all threads every interval secs from a background thread.
+
+    Unlike cProfile, which only sees the thread it runs in, sampling covers the worker threads quotes run on.
+    A sample only walks frames and counts tuples of code objects, names are resolved when stacks are saved,
+    so the cost per sample stays in the tens of microseconds.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """
+        :param interval: Secs between samples
+        """
+        self.interval = interval
+        self.lock = Lock()
+        self.stacks = Counter()
+        self.names = {}
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+
+    def reset(self) -> Counter:
+        """
+        Returns the stacks sampled so far and starts counting anew.
+
+        :return: Counter where key-(thread name, tuple of code objects from leaf to root), value-samples
+        """
+        with self.lock:
+            stacks, self.stacks = self.stacks, Counter()
+
+        return stacks
+
+    def run(self) -> None:
+        own_id = get_ident()
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            if frames.keys() - self.names.keys():
+                # Pool threads are numbered, eg. scan_12, so group them under one name
+                self.names = {thread.ident: re.sub(r"[_-]?\d+( \(.*\))?$", "", thread.name)
+                              for thread in enumerate_threads()}
+
+            samples = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                samples.append((self.names.get(thread_id, "thread"), tuple(codes)))
+
+            with self.lock:
+                self.stacks.update(samples)
+
+
+def frame_name(code) -> str:
+    """
+    Returns a readable name of a code object, eg. 'ScanEngine.quote (src/api/engine.py:37)'.
+
+    :param code: Code object
+    :return: Frame name
+    """
+    filename = code.co_filename
+    if filename.startswith(project_root_dir):
+        filename = filename[len(project_root_dir) + 1:]
+    else:
+        filename = os.path.basename(filename)
+
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+
+
+def fold_stacks(stacks: Counter) -> list:
+    """
+    Formats sampled stacks as collapsed stack lines, the input format of flamegraph.pl, speedscope and inferno.
+
+    :param stacks: Output of StackSampler.reset
+    :return: List of 'thread;root frame;...;leaf frame samples' lines, most sampled first
+    """
+    folded = Counter()
+    for (thread_name, codes), samples in stacks.items():
+        names = [thread_name] + [frame_name(code).replace(";", ",") for code in reversed(codes)]
+        folded[";".join(names)] += samples
+
+    return [f"{stack} {samples}" for stack, samples in folded.most_common()]
+
+
+class LoopProfiler:
+    """
+    Samples stacks while enabled and saves them, with each route's timing, for every loop over budget secs.
+    While disabled no thread runs and loops only check a flag. Toggled from the terminal with SIGUSR1.
+    """
+
+    def __init__(self, budget: float = 10, interval: float = 0.01, enabled: bool = False,
+                 profiles_dir: str = profiles_dir_path, max_profiles: int = 100):
+        """
+        :param budget: Secs a loop may take before its profile is saved
+        :param interval: Secs between stack samples
+        :param enabled: Start sampling immediately
+        :param profiles_dir: Directory to save profiles to
+        :param max_profiles: Number of saved loops to keep, older ones are deleted
+        """
+        self.budget = budget
+        self.profiles_dir = profiles_dir
+        self.max_profiles = max_profiles
+        self.sampler = StackSampler(interval)
+        self.enabled = False
+        self.lock = Lock()
+        self.routes = {}
+        if enabled:
+            self.enable()
+
+    def enable(self) -> None:
+        self.sampler.reset()
+        self.sampler.start()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.sampler.stop()
+
+    def toggle(self, *args) -> None:
+        """Enables profiling if disabled and vice versa. Can be registered as a signal handler."""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        print(f"Profiling {'enabled' if self.enabled else 'disabled'}, loop budget {self.budget:,} secs.")
+
+    def start_loop(self) -> None:
+        """Discards samples and route timings taken before the loop."""
+        if not self.enabled:
+            return
+
+        self.sampler.reset()
+        with self.lock:
+            self.routes = {}
+
+    def record_route(self, key: str, secs: float) -> None:
+        """
+        Records how long a route took in the current loop.
+
+        :param key: Route key
+        :param secs: Secs the route took
+        """
+        with self.lock:
+            self.routes[key] = self.routes.get(key, 0) + secs
+
+    def timed(self, key: str, func: Callable) -> Callable:
+        """
+        Wraps func to record its run time under key.
+
+        :param key: Route key
+        :param func: Function to time
+        :return: Function with the same arguments and output as func
+        """
+        def timed_func(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record_route(key, perf_counter() - start)
+
+        return timed_func
+
+    def end_loop(self, loop: int, duration: float) -> str or None:
+        """
+        Saves the loop's sampled stacks and route timings if it took longer than the budget.
+
+        :param loop: Loop number
+        :param duration: Secs the loop took
+        :return: Path of the saved stacks, None if not saved
+        """
+        if not self.enabled or duration <= self.budget:
+            return None
+
+        stacks = self.sampler.reset()
+        with self.lock:
+            routes, self.routes = self.routes, {}
+
+        name = f"{self.profiles_dir}/loop-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{loop}"
+        try:
+            os.makedirs(self.profiles_dir, exist_ok=True)
+            with open(f"{name}.folded", 'w') as file:
+                file.write("\n".join(fold_stacks(stacks)) + "\n")
+            with open(f"{name}.routes.tsv", 'w') as file:
+                file.write(f"# Loop {loop} took {duration:,.3f} secs, budget {self.budget:,} secs\n")
+                file.write("route\tsecs\n")
+                file.writelines(f"{key}\t{secs:.4f}\n" for key, secs in
+                                sorted(routes.items(), key=lambda item: -item[1]))
+            self.prune()
+        except OSError as e:
+            log_error.warning(f"'ProfilerError' - Could not save profile {name}: {e}")
+            return None
+
+        return f"{name}.folded"
+
+    def prune(self) -> None:
+        """Deletes the oldest saved loops beyond max_profiles."""
+        profiles = sorted(entry.path for entry in os.scandir(self.profiles_dir) if entry.name.endswith(".folded"))
+        for path in profiles[:max(0, len(profiles) - self.max_profiles)]:
+            for file_path in (path, path.replace(".folded", ".routes.tsv")):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
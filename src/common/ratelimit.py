@@ -0,0 +1,151 @@
+"""
+Rate limiting primitives.
+"""
+from time import (
+    monotonic,
+    sleep,
+)
+from threading import Lock
+
+
+class TokenBucket:
+    """Token bucket that can be paused, eg. for the retry_after Telegram asks for."""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: Tokens added per sec
+        :param capacity: Max tokens held
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float, tokens: float = 1) -> float:
+        """
+        Returns the time the given number of tokens will be available at.
+
+        :param now: Current monotonic time
+        :param tokens: Number of tokens needed, capped at capacity
+        :return: Monotonic time
+        """
+        self.refill(now)
+        tokens = min(tokens, self.capacity)
+        wait = 0 if self.tokens >= tokens else (tokens - self.tokens) / self.rate
+        return max(now + wait, self.paused_until)
+
+    def take(self, now: float, tokens: float = 1) -> bool:
+        """
+        Takes tokens if they are available.
+
+        :param now: Current monotonic time
+        :param tokens: Number of tokens to take, capped at capacity
+        :return: True if the tokens were taken
+        """
+        if self.ready_at(now, tokens) > now:
+            return False
+
+        self.tokens -= min(tokens, self.capacity)
+        return True
+
+    def pause(self, now: float, secs: float) -> None:
+        self.paused_until = max(self.paused_until, now + secs)
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe limiter that paces requests to an upstream evenly at an allowed rate it adapts to the upstream's
+    limit: every 429 cuts the rate by `decrease` and pauses all requests for the Retry-After asked for, every
+    success raises it again by `increase` requests per sec per sec, up to max_rate. Throughput so settles just
+    under the upstream limit instead of bursting into it.
+    """
+
+    def __init__(self, max_rate: float = 100, min_rate: float = 1, burst: float = 0.1, increase: float = 1,
+                 decrease: float = 0.5, cooldown: float = 1):
+        """
+        :param max_rate: Max allowed requests per sec, and the starting rate
+        :param min_rate: Min allowed requests per sec
+        :param burst: Secs of requests at the allowed rate that may be sent at once
+        :param increase: Requests per sec the rate rises by per sec of successful requests
+        :param decrease: Factor the rate is multiplied by on a 429
+        :param cooldown: Min secs between two rate cuts, so a burst of 429s to the same overload counts once
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.lock = Lock()
+        self.bucket = TokenBucket(rate=max_rate, capacity=max(1.0, max_rate * burst))
+        self.decreased = 0.0
+
+    def configure(self, max_rate: float = 100, min_rate: float = 1, burst: float = 0.1, increase: float = 1,
+                  decrease: float = 0.5, cooldown: float = 1) -> None:
+        """
+        Updates limiter settings. A limiter not slowed down by 429s moves to the new max_rate, else its
+        current rate is kept within the new bounds.
+        """
+        with self.lock:
+            at_max = self.bucket.rate >= self.max_rate
+            self.max_rate = max_rate
+            self.min_rate = min_rate
+            self.burst = burst
+            self.increase = increase
+            self.decrease = decrease
+            self.cooldown = cooldown
+            self.set_rate(max_rate if at_max else self.bucket.rate)
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def set_rate(self, rate: float) -> None:
+        self.bucket.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.bucket.capacity = max(1.0, self.bucket.rate * self.burst)
+
+    def paused(self, now: float) -> bool:
+        return self.bucket.paused_until > now
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Reserves the next request slot and waits for it, so waiting requests are released one at a time
+        at the allowed rate rather than all at once.
+
+        :param timeout: Max secs to wait for
+        :return: True if a slot was taken, False if none is free within timeout
+        """
+        with self.lock:
+            now = monotonic()
+            ready_at = self.bucket.ready_at(now)
+            if ready_at > now + timeout:
+                return False
+            # Tokens go negative for slots reserved ahead
+            self.bucket.tokens -= 1
+
+        if ready_at > now:
+            sleep(ready_at - now)
+        return True
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.set_rate(self.bucket.rate + self.increase / self.bucket.rate)
+
+    def record_throttled(self, retry_after: float | None = None) -> None:
+        """
+        Slows down after a 429.
+
+        :param retry_after: Secs the upstream asked to wait for, if any
+        """
+        with self.lock:
+            now = monotonic()
+            if now - self.decreased >= self.cooldown:
+                self.set_rate(self.bucket.rate * self.decrease)
+                self.decreased = now
+            if retry_after:
+                self.bucket.pause(now, retry_after)
@@ -0,0 +1,162 @@
+"""
+Reloads a scanner's config file while it runs and applies only the routes that changed.
+"""
+import os
+import json
+
+from time import monotonic
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from src.common.logger import log_error
+from src.common.scheduler import RouteScheduler
+
+
+class ConfigWatcher:
+    """
+    Polls a config file's modification time and size, at most every interval secs, so it is cheap enough
+    to check every loop. A file that changed but is not valid JSON, eg. while still being written, is skipped.
+    """
+
+    def __init__(self, path: str, interval: float = 2):
+        """
+        :param path: Path of the config file
+        :param interval: Min secs between checks of the file
+        """
+        self.path = path
+        self.interval = interval
+        self.signature = self.stat()
+        self.checked = monotonic()
+
+    def stat(self) -> tuple or None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self) -> dict or None:
+        """
+        Returns the config if the file changed since it was last read.
+
+        :return: Config dictionary, None if unchanged or unreadable
+        """
+        now = monotonic()
+        if now - self.checked < self.interval:
+            return None
+        self.checked = now
+
+        signature = self.stat()
+        if signature is None or signature == self.signature:
+            return None
+        self.signature = signature
+
+        try:
+            with open(self.path, 'r') as file:
+                return json.loads(file.read())
+        except (OSError, ValueError) as e:
+            log_error.warning(f"'ConfigError' - {self.path} changed but could not be read, "
+                              f"keeping the running config: {e}")
+            return None
+
+
+class BackgroundReload:
+    """
+    Runs the slow part of applying a reloaded config, eg. probing its new routes, on a worker thread,
+    so a scan loop checking for it every loop is never blocked. One reload runs at a time.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reload")
+        self.future = None
+
+    def busy(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    def submit(self, function: Callable, *args) -> None:
+        """
+        Starts a reload, unless one is already running.
+
+        :param function: Function returning the reloaded result
+        :param args: Arguments of function
+        """
+        if not self.busy():
+            self.future = self.executor.submit(function, *args)
+
+    def result(self):
+        """
+        Returns the result of a finished reload, once.
+
+        :return: Output of the submitted function, None if no reload finished since last called or it failed
+        """
+        if self.future is None or not self.future.done():
+            return None
+
+        future, self.future = self.future, None
+        try:
+            return future.result()
+        except Exception as e:
+            log_error.warning(f"'ConfigError' - reload failed, keeping the running config: {e}")
+            return None
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def warn_restart_settings(path: str, old: dict, new: dict, reloaded: tuple) -> list:
+    """
+    Warns about the settings of a reloaded config that changed but are only read at start.
+
+    :param path: Path of the config file
+    :param old: Settings the scanner is running with
+    :param new: Settings of the reloaded config
+    :param reloaded: Names of the settings the scanner applies on reload
+    :return: Names of the changed settings that need a restart
+    """
+    changed = sorted(name for name in old.keys() | new.keys()
+                     if name not in reloaded and old.get(name) != new.get(name))
+    if changed:
+        log_error.warning(f"'ConfigError' - {path} changed settings {', '.join(changed)}, "
+                          f"restart to apply them")
+
+    return changed
+
+
+def diff_routes(old: dict, new: dict) -> tuple:
+    """
+    Compares two scan plans.
+
+    :param old: Dictionary where key-route key, value-route, of the running plan
+    :param new: Dictionary where key-route key, value-route, of the new plan
+    :return: Tuple of lists of added, removed and changed route keys
+    """
+    added = [key for key in new if key not in old]
+    removed = [key for key in old if key not in new]
+    changed = [key for key in new if key in old and new[key] != old[key]]
+
+    return added, removed, changed
+
+
+def apply_routes(routes: dict, new_routes: dict, scheduler: RouteScheduler) -> tuple:
+    """
+    Updates the running plan to new_routes. Added routes are due immediately, removed ones are dropped and
+    changed ones keep their polling state, so unchanged routes are not disturbed at all.
+
+    :param routes: Dictionary where key-route key, value-route with min_arb and cost, updated in place
+    :param new_routes: Dictionary where key-route key, value-route with min_arb and cost, of the new plan
+    :param scheduler: Scheduler polling the routes
+    :return: Output of diff_routes
+    """
+    added, removed, changed = diff_routes(routes, new_routes)
+    for key in removed:
+        del routes[key]
+        scheduler.remove(key)
+    for key in added:
+        routes[key] = new_routes[key]
+        scheduler.add(key, min_arb=new_routes[key].min_arb, cost=new_routes[key].cost)
+    for key in changed:
+        routes[key] = new_routes[key]
+        scheduler.configure_route(key, min_arb=new_routes[key].min_arb, cost=new_routes[key].cost)
+
+    return added, removed, changed
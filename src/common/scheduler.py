@@ -0,0 +1,161 @@
+"""
+Priority queue scheduler that polls each route at an interval adapted to how close it gets to arbitrage.
+"""
+import heapq
+
+from time import monotonic
+from itertools import count
+
+from src.common.ratelimit import TokenBucket
+
+
+class RouteState:
+    """Polling state of a single route."""
+
+    __slots__ = ("min_arb", "cost", "interval", "due", "last_arb", "heat", "volatility")
+
+    def __init__(self, min_arb: float, cost: int, interval: float, due: float):
+        self.min_arb = min_arb
+        self.cost = cost
+        self.interval = interval
+        self.due = due
+        self.last_arb = None
+        # Smoothed arbitrage and absolute arbitrage change, as fractions of min_arb
+        self.heat = 0.0
+        self.volatility = 0.0
+
+
+class RouteScheduler:
+    """
+    Schedules route polls by due time. After each poll a route's interval is set from its smoothed
+    arbitrage and volatility relative to its min_arb: routes at or above the threshold are polled every
+    min_interval secs, routes that never come close back off to max_interval secs.
+    Routes are only released while the global max_rps request budget allows.
+    """
+
+    def __init__(self, min_interval: float = 1, max_interval: float = 60, max_rps: float = 100,
+                 smoothing: float = 0.3):
+        """
+        :param min_interval: Secs between polls of the hottest routes
+        :param max_interval: Secs between polls of the coldest routes
+        :param max_rps: Max number of requests per sec across all routes
+        :param smoothing: Weight of the latest poll in the smoothed arbitrage and volatility
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.budget = TokenBucket(rate=max_rps, capacity=max_rps)
+        self.routes = {}
+        self.queue = []
+        self.counter = count()
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def add(self, key: str, min_arb: float, cost: int = 1) -> None:
+        """
+        Adds a route, due immediately.
+
+        :param key: Unique route key
+        :param min_arb: Min required arbitrage of the route
+        :param cost: Number of requests a poll of the route makes
+        """
+        now = monotonic()
+        self.routes[key] = RouteState(min_arb, cost, self.min_interval, now)
+        heapq.heappush(self.queue, (now, next(self.counter), key))
+
+    def configure_route(self, key: str, min_arb: float, cost: int = 1) -> None:
+        """
+        Changes a route's min_arb and cost, keeping its interval, due time and recent arbitrage.
+
+        :param key: Route key
+        :param min_arb: Min required arbitrage of the route
+        :param cost: Number of requests a poll of the route makes
+        """
+        route = self.routes.get(key)
+        if route is not None:
+            route.min_arb = min_arb
+            route.cost = cost
+
+    def remove(self, key: str) -> None:
+        """
+        Removes a route. Its queue entry is skipped when popped.
+
+        :param key: Route key
+        """
+        self.routes.pop(key, None)
+
+    def next_batch(self) -> list:
+        """
+        Pops all routes that are due, as long as the request budget allows.
+
+        :return: List of route keys to poll now
+        """
+        now = monotonic()
+        batch = []
+        while self.queue and self.queue[0][0] <= now:
+            due, _, key = self.queue[0]
+            route = self.routes.get(key)
+
+            # Skip entries of removed or rescheduled routes
+            if route is None or route.due != due:
+                heapq.heappop(self.queue)
+                continue
+
+            if not self.budget.take(now, route.cost):
+                break
+
+            heapq.heappop(self.queue)
+            route.due = None
+            batch.append(key)
+
+        return batch
+
+    def wait_time(self) -> float:
+        """
+        Returns secs until the next route is due and within budget.
+
+        :return: Secs to wait for
+        """
+        now = monotonic()
+        while self.queue:
+            due, _, key = self.queue[0]
+            route = self.routes.get(key)
+            if route is None or route.due != due:
+                heapq.heappop(self.queue)
+                continue
+
+            return max(0.0, self.budget.ready_at(max(now, due), route.cost) - now)
+
+        return self.max_interval
+
+    def update(self, key: str, arbitrage: float | None, delay: float | None = None) -> float:
+        """
+        Records a route's latest arbitrage and schedules its next poll.
+
+        :param key: Route key
+        :param arbitrage: Highest arbitrage quoted, None if the poll failed or was skipped
+        :param delay: Secs until the next poll, overrides the route's interval if given
+        :return: Secs until the route's next poll
+        """
+        route = self.routes.get(key)
+        if route is None:
+            return 0
+
+        if arbitrage is not None:
+            scale = abs(route.min_arb) or 1
+            ratio = arbitrage / scale
+            change = abs(arbitrage - route.last_arb) / scale if route.last_arb is not None else 0
+
+            route.heat += self.smoothing * (ratio - route.heat)
+            route.volatility += self.smoothing * (change - route.volatility)
+            route.last_arb = arbitrage
+
+            score = min(max(route.heat + route.volatility, 0.0), 1.0)
+            route.interval = self.max_interval - (self.max_interval - self.min_interval) * score
+
+        interval = route.interval if delay is None else delay
+        route.due = monotonic() + interval
+        heapq.heappush(self.queue, (route.due, next(self.counter), key))
+
+        return interval
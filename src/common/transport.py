@@ -0,0 +1,205 @@
+"""
+Shared HTTP transport. One requests.Session with per-host connection pools sized for the scan's
+concurrency, kept alive between loops, pre-warmed before the first loop and instrumented with
+pool-wait and connect-time counters.
+"""
+from threading import (
+    Lock,
+    Thread,
+)
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from urllib3 import Retry
+from urllib3.exceptions import EmptyPoolError
+from urllib3.connection import (
+    HTTPConnection,
+    HTTPSConnection,
+)
+from urllib3.connectionpool import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from src.common.logger import log_error
+
+
+class TransportStats:
+    """Thread-safe counters of connection pool waits, new connections and connections opened beyond pool size."""
+
+    # Acquiring a connection slower than this counts as having waited for the pool
+    wait_threshold = 0.001
+
+    def __init__(self):
+        self.lock = Lock()
+        self.acquires = 0
+        self.pool_waits = 0
+        self.pool_wait_time = 0.0
+        self.connects = 0
+        self.connect_time = 0.0
+        self.overflows = 0
+
+    def record_acquire(self, elapsed: float) -> None:
+        with self.lock:
+            self.acquires += 1
+            if elapsed > self.wait_threshold:
+                self.pool_waits += 1
+                self.pool_wait_time += elapsed
+
+    def record_connect(self, elapsed: float) -> None:
+        with self.lock:
+            self.connects += 1
+            self.connect_time += elapsed
+
+    def record_overflow(self) -> None:
+        with self.lock:
+            self.overflows += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of all counters.
+
+        :return: Dictionary of counter name and value
+        """
+        with self.lock:
+            return {"acquires": self.acquires, "pool_waits": self.pool_waits,
+                    "pool_wait_time": self.pool_wait_time, "connects": self.connects,
+                    "connect_time": self.connect_time, "overflows": self.overflows}
+
+
+transport_stats = TransportStats()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self) -> None:
+        start = perf_counter()
+        super().connect()
+        transport_stats.record_connect(perf_counter() - start)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self) -> None:
+        start = perf_counter()
+        super().connect()
+        transport_stats.record_connect(perf_counter() - start)
+
+
+class TimedPoolMixin:
+    """
+    Times how long a request waits for a free connection. If none frees up within wait_timeout secs,
+    eg. because the interpreter is shutting down and has drained the pools, a new connection is opened.
+    """
+
+    wait_timeout = 1
+
+    def _get_conn(self, timeout: float | None = None):
+        start = perf_counter()
+        try:
+            conn = super()._get_conn(self.wait_timeout if timeout is None else timeout)
+        except EmptyPoolError:
+            transport_stats.record_overflow()
+            conn = self._new_conn()
+        transport_stats.record_acquire(perf_counter() - start)
+        return conn
+
+
+class TimedHTTPConnectionPool(TimedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(TimedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TransportAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools record pool-wait and connect-time counters."""
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+# Connections kept per host, set via configure_transport before the session is first used
+pool_maxsize = 10
+
+_session: Session | None = None
+_session_lock = Lock()
+
+
+def create_session(maxsize: int = 10) -> Session:
+    """
+    Creates a keep-alive requests Session with blocking per-host connection pools.
+
+    :param maxsize: Max number of connections kept open per host
+    :return: Configured Session
+    """
+    # 429s are left to the caller's rate limiter, retrying them in every thread only adds to the overload.
+    # urllib3 retries any response with a Retry-After header otherwise
+    retry_strategy = Retry(total=2, status_forcelist=[500, 502, 503, 504], backoff_factor=0.1,
+                           respect_retry_after_header=False)
+    # Wait for a free connection rather than open throwaway ones when the pool is exhausted
+    adapter = TransportAdapter(pool_connections=16, pool_maxsize=maxsize, pool_block=True,
+                               max_retries=retry_strategy)
+
+    session = Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def configure_transport(maxsize: int) -> None:
+    """
+    Sets the per-host connection pool size. Must be called before the session is first used.
+
+    :param maxsize: Max number of connections kept open per host, eg. the number of routes in flight
+    """
+    global pool_maxsize
+    pool_maxsize = max(1, int(maxsize))
+
+
+def get_session() -> Session:
+    """
+    Returns the shared Session, creating it on first use.
+
+    :return: Shared requests Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session(pool_maxsize)
+
+    return _session
+
+
+def warm_up(urls: list, connections: int = 1) -> None:
+    """
+    Resolves DNS and completes TCP/TLS handshakes ahead of the first scan loop by sending up to `connections`
+    concurrent HEAD requests to each url's host through the shared session, whose pool then keeps their
+    connections alive. Any response will do, only the connection is of use.
+
+    :param urls: List of urls whose hosts will be connected to
+    :param connections: Number of connections to open per host
+    """
+    session = get_session()
+
+    def head(url: str) -> None:
+        try:
+            session.head(url, timeout=5)
+        except RequestException as ex:
+            log_error.warning(f"'WarmUpError' - {url} - {ex}")
+
+    for url in {f"{urlsplit(url).scheme}://{urlsplit(url).netloc}/" for url in urls}:
+        threads = [Thread(target=head, args=(url,), daemon=True) for _ in range(min(connections, pool_maxsize))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
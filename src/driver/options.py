@@ -1,21 +1,21 @@
 """
 Configure Chrome settings and initiate it.
 """
-import os
-from dotenv import load_dotenv
-
 from selenium.webdriver.chrome.options import Options
 
 
-load_dotenv()
-# Get env variables
-CHROME_LOCATION = os.getenv('CHROME_LOCATION')
+def driver_options() -> Options:
+    """
+    Returns the Chrome driver options.
+
+    :return: Chrome options
+    """
+    options = Options()
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--start-maximized")
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-dev-shm-usage')
 
-# Chrome driver options
-driver_options = Options()
-driver_options.add_argument("--window-size=1920,1080")
-driver_options.add_argument("--start-maximized")
-driver_options.add_argument('--headless')
-driver_options.add_argument('--no-sandbox')
-driver_options.add_argument('--disable-gpu')
-driver_options.add_argument('--disable-dev-shm-usage')
+    return options
@@ -0,0 +1,132 @@
+"""
+Pool of Chrome web drivers, each owned by one worker thread, to query several routes in parallel.
+"""
+from threading import (
+    Lock,
+    local,
+)
+from typing import (
+    Callable,
+    List,
+)
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+
+from selenium.webdriver import Chrome
+
+from src.common.logger import log_error
+from src.driver.driver import create_driver
+
+
+class DriverPool:
+    """
+    Runs functions that take a web driver as their first argument on `size` worker threads.
+    Each worker opens its own driver on first use and keeps it for the pool's lifetime.
+    A driver that crashed, or whose browser no longer responds, is quit and replaced before the next call.
+    """
+
+    def __init__(self, size: int = 2, factory: Callable = create_driver):
+        """
+        :param size: Number of workers, each with its own Chrome instance
+        :param factory: Function called without arguments to open a new driver, or an object wrapping one
+                        that provides current_url and quit
+        """
+        self.size = size
+        self.factory = factory
+        self.local = local()
+        self.lock = Lock()
+        self.drivers = []
+        self.restarts = 0
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="driver")
+
+    def driver(self) -> Chrome:
+        """
+        Returns the calling worker's driver, opening it if needed.
+
+        :return: Chrome webdriver instance
+        """
+        driver = getattr(self.local, "driver", None)
+        if driver is None:
+            driver = self.local.driver = self.factory()
+            with self.lock:
+                self.drivers.append(driver)
+
+        return driver
+
+    def restart(self) -> None:
+        """Quits the calling worker's driver, the next call opens a new one."""
+        driver = getattr(self.local, "driver", None)
+        if driver is None:
+            return
+
+        self.local.driver = None
+        with self.lock:
+            self.drivers.remove(driver)
+            self.restarts += 1
+        quit_driver(driver)
+
+    def call(self, func: Callable, *args):
+        """
+        Calls func with the worker's driver and args, replacing the driver if it died during the call.
+
+        :param func: Function taking a driver as its first argument
+        :return: Output of func
+        """
+        driver = self.driver()
+        try:
+            return func(driver, *args)
+        except BaseException:
+            if not driver_alive(driver):
+                log_error.warning(f"'DriverError' - Chrome driver crashed, restarting it")
+                self.restart()
+            raise
+
+    def submit(self, func: Callable, *args) -> Future:
+        """
+        Schedules func to be called on a worker with its driver as first argument.
+
+        :param func: Function taking a driver as its first argument
+        :return: Future of func output
+        """
+        return self.executor.submit(self.call, func, *args)
+
+    def map(self, func: Callable, arguments: List[list]) -> List[Future]:
+        """
+        Schedules func for each argument list, split across the workers.
+
+        :param func: Function taking a driver as its first argument
+        :param arguments: List of argument lists passed to func after the driver
+        :return: List of futures in the order of arguments
+        """
+        return [self.submit(func, *arg) for arg in arguments]
+
+    def quit(self) -> None:
+        """Stops the workers and quits all drivers."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            quit_driver(driver)
+
+
+def driver_alive(driver: Chrome) -> bool:
+    """
+    Checks whether the driver's browser still responds.
+
+    :param driver: Chrome webdriver instance
+    :return: True if driver is usable
+    """
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def quit_driver(driver: Chrome) -> None:
+    try:
+        driver.quit()
+    except Exception as e:
+        log_error.warning(f"'DriverError' - Could not quit Chrome driver: {e}")
@@ -21,6 +21,14 @@ parser.add_argument(
     help=f"Path to 'api.json' file with all configuration settings as defined in README.md."
 )
 
+parser.add_argument(
+    "-p",
+    "--profile",
+    action="store_true",
+    help="Samples stacks of every loop and saves loops over settings.profiling.budget secs to 'logs/profiles'. "
+         "Can also be toggled while running with 'kill -USR1 <pid>'."
+)
+
 parser.add_argument(
     "-v",
     "--version",
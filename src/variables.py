@@ -3,28 +3,32 @@ Set up program variables.
 """
 import os
 from re import compile
-from dotenv import load_dotenv
-from urllib3 import Retry
 
-from requests import Session
-from requests.adapters import HTTPAdapter
 
+_env_loaded = False
 
-load_dotenv()
-# Get env variables
-TOKEN = os.getenv("TOKEN")
-CHAT_ID_ALERTS = os.getenv("CHAT_ID_ALERTS")
-CHAT_ID_ALERTS_FILTER = os.getenv("CHAT_ID_ALERTS_FILTER")
-CHAT_ID_SPECIAL = os.getenv("CHAT_ID_SPECIAL")
-CHAT_ID_DEBUG = os.getenv("CHAT_ID_DEBUG")
-ALCHEMY_OP_KEY = os.getenv('ALCHEMY_OP_KEY')
 
-# Set up and configure requests session
-http_session = Session()
-retry_strategy = Retry(total=2, status_forcelist=[429, 500, 502, 503, 504])
-adapter = HTTPAdapter(max_retries=retry_strategy)
-http_session.mount("https://", adapter)
-http_session.mount("http://", adapter)
+def get_env(name: str) -> str | None:
+    """
+    Returns an environment variable, loading the .env file on first call.
+    Variables used: TOKEN, CHAT_ID_ALERTS, CHAT_ID_ALERTS_FILTER, CHAT_ID_SPECIAL, CHAT_ID_DEBUG and
+    ALCHEMY_OP_KEY.
+
+    :param name: Variable name, eg. TOKEN
+    :return: Variable value, None if not set
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+    return os.getenv(name)
+
+
+# TELEGRAM_API points the bots at another Bot API server, eg. the benchmark stub
+telegram_api = os.getenv("TELEGRAM_API", "https://api.telegram.org")
 
 time_format = "%Y-%m-%d %H:%M:%S, %Z"
 time_format_regex = compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}, [A-Za-z]*")
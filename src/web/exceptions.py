@@ -1,9 +1,8 @@
 from datetime import datetime
 from typing import TypeVar
 
-from selenium.webdriver import Chrome
-
 from src.common.message import telegram_send_msg
+from src.driver.pool import DriverPool
 from src.variables import time_format
 
 
@@ -12,15 +11,15 @@ Function = TypeVar("Function")
 
 
 def exit_handler_driver(
-        driver: Chrome,
+        drivers: DriverPool,
         program_name: str = "",
         telegram_chat_id: str = "",
         info: str = "",
 ) -> None:
     """
-    Sends a notification message in Telegram to notify of program termination and quits driver.
+    Sends a notification message in Telegram to notify of program termination and quits all drivers.
 
-    :param driver: Web driver instance
+    :param drivers: Pool of web drivers
     :param program_name: Name of running program
     :param telegram_chat_id: Telegram Chat ID to send message to
     :param info: Additional info to include in debug message
@@ -39,5 +38,5 @@ def exit_handler_driver(
 
     print(message)
 
-    # Quit chrome driver
-    driver.quit()
+    # Quit chrome drivers
+    drivers.quit()
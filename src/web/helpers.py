@@ -1,8 +1,6 @@
 from typing import List
 from tabulate import tabulate
 
-from src.driver.driver import chrome_driver
-
 
 def print_start_message(arguments: List[list]) -> None:
     """Prints script start message of all network configurations.
@@ -12,11 +10,11 @@ def print_start_message(arguments: List[list]) -> None:
 
     table = []
     for arg in arguments:
-        amounts = arg[1]
-        min_arb = arg[2]
-        src_network_name = arg[3]
-        dest_network_name = arg[4]
-        token = arg[5]
+        amounts = arg[0]
+        min_arb = arg[1]
+        src_network_name = arg[2]
+        dest_network_name = arg[3]
+        token = arg[4]
 
         swap_amounts = [f"{int(amount / 1000)}k" if amount > 1000 else amount for amount in amounts]
 
@@ -29,13 +27,37 @@ def print_start_message(arguments: List[list]) -> None:
                    tablefmt="fancy_grid", numalign="left", stralign="left", colalign="left"))
 
 
+class WebArgs(list):
+    """
+    Argument list of a route, with the min_arb and cost the scheduler and apply_routes read from a route.
+    """
+
+    @property
+    def min_arb(self) -> float:
+        return self[1]
+
+    @property
+    def cost(self) -> int:
+        return len(self[0])
+
+
+def route_key(arg: list) -> str:
+    """
+    Returns a unique, readable key of a route, eg. 'USDC:Ethereum->Optimism'.
+
+    :param arg: Argument list. Element of func parse_args_web output
+    :return: Route key
+    """
+    return f"{arg[4]}:{arg[2]}->{arg[3]}"
+
+
 def parse_args_web(schema: dict) -> List[list]:
     """
-    Parses input schema and returns a list of arguments ready to be passed to a function.
+    Parses input schema and returns a list of arguments ready to be passed to query_synapse after a driver.
 
     >>> arguments = parse_args_web(schema)
     >>> print(arguments)
-    [[driver, [10,000, 20,000, 50,000], 30, '1', '10'], {"max_swap_amount": 10000, "coins": ["USDC"]}...]
+    [[[10,000, 20,000, 50,000], 30, 'Ethereum', 'Optimism', 'USDC', {"max_swap_amount": 10000, "coins": ["USDC"]}]...]
 
     >>>
 
@@ -53,6 +75,6 @@ def parse_args_web(schema: dict) -> List[list]:
 
         for network, info in coin_info.get('networks').items():
             arbitrage = info.get('arbitrage')
-            args.append([chrome_driver, amounts, arbitrage, 'Ethereum', network, coin_name, special_chat])
+            args.append(WebArgs([amounts, arbitrage, 'Ethereum', network, coin_name, special_chat]))
 
     return args
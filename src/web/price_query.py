@@ -1,5 +1,5 @@
-import time
 from datetime import datetime
+from time import perf_counter
 
 from selenium import webdriver
 from selenium.webdriver import Chrome
@@ -8,18 +8,72 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import WebDriverException
-from src.common.message import telegram_send_msg
+from src.common.message import telegram_enqueue_msg
+from src.common.metrics import (
+    errors,
+    page_load,
+    quote_latency,
+    chain_latency,
+)
 from src.common.logger import (
     log_arbitrage,
     log_error,
 )
 from src.variables import (
     time_format,
-    CHAT_ID_ALERTS,
-    CHAT_ID_SPECIAL,
+    get_env,
 )
 
 
+# Runs inside the page via execute_async_script. Clears the amount in field and waits for the amount out
+# field to clear, so a quote left from the previous route is never read, then enters the amount and waits
+# for the quote. Values are set through the native setter and followed by input events, so React sees them.
+# Fields are watched with a MutationObserver, and polled every 50ms in case React only changes the property.
+quote_amount_script = """
+const [inXpath, outXpath, amount, timeoutMs, done] = arguments;
+const find = xpath => document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+    .singleNodeValue;
+const input = find(inXpath);
+if (!input || !find(outXpath)) {
+    done(null);
+    return;
+}
+
+const setValue = value => {
+    Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set.call(input, value);
+    input.dispatchEvent(new Event('input', {bubbles: true}));
+    input.dispatchEvent(new Event('change', {bubbles: true}));
+};
+
+const waitFor = (condition, onDone) => {
+    let finished = false;
+    const finish = value => {
+        if (finished) return;
+        finished = true;
+        observer.disconnect();
+        clearInterval(poll);
+        clearTimeout(timer);
+        onDone(value);
+    };
+    const check = () => {
+        const output = find(outXpath);
+        if (output && condition(output.value)) finish(output.value);
+    };
+    const observer = new MutationObserver(check);
+    observer.observe(document.body, {subtree: true, childList: true, attributes: true, characterData: true});
+    const poll = setInterval(check, 50);
+    const timer = setTimeout(() => finish(''), timeoutMs);
+    check();
+};
+
+setValue('');
+waitFor(value => value === '', () => {
+    setValue(amount);
+    waitFor(value => value !== '', done);
+});
+"""
+
+
 class SynapseFrontEndExc(Exception):
     pass
 
@@ -28,8 +82,156 @@ class SynapseAmountOutExc(Exception):
     pass
 
 
+class SynapsePage:
+    """
+    A Synapse dApp page kept open in a web driver between queries.
+
+    Tracks the token and destination network currently selected, so consecutive queries only change
+    the fields that differ. The page is reloaded when it was never loaded, when a query failed on it,
+    or on every query if persistent is False.
+    """
+
+    url = "https://www.synapseprotocol.com/"
+
+    coin_in_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div[2]/div/button'
+    coin_out_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[2]/div[2]/div/button'
+    network_out_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[2]/div[1]/div[2]/div/div[2]/div[2]/button'
+    search_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[1]/div/input'
+    coin_result_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[2]/div[1]'
+    network_result_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[2]/button'
+    amount_in_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div[2]/div/div/input'
+    amount_out_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[2]/div[2]/div/div/input'
+
+    def __init__(self, driver: Chrome, persistent: bool = True):
+        """
+        :param driver: Chrome webdriver instance owned by the page
+        :param persistent: Keep the page loaded between queries, else reload it for every query
+        """
+        self.driver = driver
+        self.persistent = persistent
+        self.token = None
+        self.network_out = None
+        self.script_timeout = None
+
+    @property
+    def current_url(self) -> str:
+        return self.driver.current_url
+
+    def quit(self) -> None:
+        self.driver.quit()
+
+    def quote_amount(self, amount: float, max_wait_time: int = 15) -> str or None:
+        """
+        Enters an amount in and waits for the amount out, in a single execute_async_script call.
+
+        :param amount: Amount to swap
+        :param max_wait_time: Maximum number of seconds to wait for the amount out
+        :return: Amount out field value, empty if it did not fill in time, None if the fields are missing
+        """
+        try:
+            # Leave the script room to time out on its own and report an empty quote
+            script_timeout = 2 * max_wait_time + 5
+            if self.script_timeout != script_timeout:
+                self.driver.set_script_timeout(script_timeout)
+                self.script_timeout = script_timeout
+            return self.driver.execute_async_script(quote_amount_script, self.amount_in_xpath,
+                                                    self.amount_out_xpath, f"{amount}", max_wait_time * 1000)
+        except WebDriverException:
+            errors.inc(type="WebDriverException")
+            return None
+
+    def invalidate(self) -> None:
+        """Forgets the page state, so that the next query reloads the page."""
+        self.token = None
+        self.network_out = None
+
+    def is_valid(self) -> bool:
+        """
+        Checks that the dApp is still loaded with its swap form.
+
+        :return: True if page can be reused
+        """
+        try:
+            return self.driver.current_url.startswith(self.url) and \
+                len(self.driver.find_elements(By.XPATH, self.amount_in_xpath)) > 0
+        except WebDriverException:
+            return False
+
+    def prepare(self, src_network_name: str, dest_network_name: str, token_name: str,
+                max_wait_time: int = 15) -> None:
+        """
+        Brings the page to the token and destination network given, changing only what differs.
+
+        :param src_network_name: Chain name source, used for logging
+        :param dest_network_name: Chain name destination
+        :param token_name: Token code, for example USDC
+        :param max_wait_time: Maximum number of seconds to wait for driver element
+        :raises SynapseFrontEndExc: If Synapse front end can not be reached or a field can not be set
+        """
+        route = f"{src_network_name} -> {dest_network_name}, {token_name}"
+
+        if not self.persistent or self.token is None or not self.is_valid():
+            self.invalidate()
+            start = perf_counter()
+            try:
+                self.driver.get(self.url)
+            except WebDriverException:
+                log_error.warning(f"Error querying {self.url}")
+                errors.inc(type="WebDriverException")
+                raise SynapseFrontEndExc
+            page_load.observe(perf_counter() - start)
+
+        try:
+            if self.token != token_name:
+                # Changing the token may reset the destination network, so both are selected again
+                self.network_out = None
+                self.pick(self.coin_in_xpath, token_name, self.coin_result_xpath, max_wait_time,
+                          f"{route}. CoinIN Error")
+                self.pick(self.coin_out_xpath, token_name, self.coin_result_xpath, max_wait_time,
+                          f"{route}. CoinOUT Error")
+                self.token = token_name
+
+            if self.network_out != dest_network_name:
+                self.pick(self.network_out_xpath, dest_network_name, self.network_result_xpath, max_wait_time,
+                          f"{route}. NetworkOUT Error")
+                self.network_out = dest_network_name
+
+        except SynapseFrontEndExc:
+            self.invalidate()
+            raise
+
+    def pick(self, button_xpath: str, text: str, result_xpath: str, max_wait_time: int, error: str) -> None:
+        """
+        Opens a selector, searches it for text and clicks the first result.
+
+        :param button_xpath: XPath of the button opening the selector
+        :param text: Text to search for
+        :param result_xpath: XPath of the first search result
+        :param max_wait_time: Maximum number of seconds to wait for driver element
+        :param error: Message to log if selection fails
+        :raises SynapseFrontEndExc: If selection fails
+        """
+        driver = self.driver
+        try:
+            WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, button_xpath)))
+            driver.find_element(By.XPATH, button_xpath).click()
+            # Search for the desired item
+            driver.find_element(By.XPATH, self.search_xpath).send_keys(f"{text}")
+            # Click the desired item
+            WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, result_xpath)))
+            driver.find_element(By.XPATH, result_xpath).click()
+        except Exception:
+            log_error.warning(error)
+            raise SynapseFrontEndExc
+        finally:
+            try:
+                webdriver.ActionChains(driver).send_keys(Keys.ESCAPE).perform()
+            except WebDriverException:
+                pass
+
+
 def query_synapse(
-        driver: Chrome,
+        page: SynapsePage,
         amounts: list,
         min_arbitrage: float,
         src_network_name: str = "Ethereum",
@@ -37,11 +239,11 @@ def query_synapse(
         token_name: str = "USDC",
         special_chat: dict | None = None,
         max_wait_time: int = 15,
-) -> None:
+) -> float:
     """
-    Queries Hop Bridge and checks for arbitrage opportunity.
+    Queries Synapse Bridge and checks for arbitrage opportunity.
 
-    :param driver: Chrome webdriver instance
+    :param page: Synapse dApp page to query on
     :param amounts: List of amounts to swap
     :param min_arbitrage: Minimum arbitrage to alert for
     :param src_network_name: Chain ID source
@@ -49,105 +251,50 @@ def query_synapse(
     :param token_name: Token code, for example USDC
     :param max_wait_time: Maximum number of seconds to wait for driver element
     :param special_chat: Send specific info, if empty ignore
+    :return: Highest arbitrage quoted
     :raises raise SynapseFrontEndExc: If Synapse front end can not be reached
     """
-
-    url = f"https://www.synapseprotocol.com/"
-
     try:
-        driver.get(url)
+        page.prepare(src_network_name, dest_network_name, token_name, max_wait_time)
+        return query_amounts(page, amounts, min_arbitrage, src_network_name, dest_network_name,
+                             token_name, special_chat, max_wait_time)
+    except (SynapseFrontEndExc, SynapseAmountOutExc):
+        page.invalidate()
+        raise
 
-    except WebDriverException:
-        log_error.warning(f"Error querying {url}")
-        raise SynapseFrontEndExc
 
-    # Select a COIN IN
-    try:
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div[2]/div/button'
-        WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, xpath)))
-        driver.find_element(By.XPATH, xpath).click()
-        # Search for the desired coin
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[1]/div/input'
-        driver.find_element(By.XPATH, xpath).send_keys(f"{token_name}")
-        # Click the desired coin
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[2]/div[1]'
-        WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, xpath)))
-        driver.find_element(By.XPATH, xpath).click()
-    except Exception:
-        log_error.warning(f"{src_network_name} -> {dest_network_name}, {token_name}. CoinIN Error")
-        raise SynapseFrontEndExc
-    finally:
-        webdriver.ActionChains(driver).send_keys(Keys.ESCAPE).perform()
-
-    # Select a COIN OUT
-    try:
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[2]/div[2]/div/button'
-        WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, xpath)))
-        driver.find_element(By.XPATH, xpath).click()
-        # Search for the desired coin
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[1]/div/input'
-        driver.find_element(By.XPATH, xpath).send_keys(f"{token_name}")
-        # Click the desired coin
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[2]/div[1]'
-        WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, xpath)))
-        driver.find_element(By.XPATH, xpath).click()
-    except Exception:
-        log_error.warning(f"{src_network_name} -> {dest_network_name}, {token_name}. AmountIn Error")
-        raise SynapseFrontEndExc
-    finally:
-        webdriver.ActionChains(driver).send_keys(Keys.ESCAPE).perform()
-
-    # Select a NETWORK OUT
-    try:
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[2]/div[1]/div[2]/div/div[2]/div[2]/button'
-        WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, xpath)))
-        driver.find_element(By.XPATH, xpath).click()
-        # Search for the desired network
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[1]/div/input'
-        driver.find_element(By.XPATH, xpath).send_keys(f"{dest_network_name}")
-        # Click the desired network
-        xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div/div/div[2]/button'
-        WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, xpath)))
-        driver.find_element(By.XPATH, xpath).click()
-    except Exception:
-        log_error.warning(f"{src_network_name} -> {dest_network_name}, {token_name}. AmountIn Error")
-        raise SynapseFrontEndExc
-    finally:
-        webdriver.ActionChains(driver).send_keys(Keys.ESCAPE).perform()
+def query_amounts(
+        page: SynapsePage,
+        amounts: list,
+        min_arbitrage: float,
+        src_network_name: str,
+        dest_network_name: str,
+        token_name: str,
+        special_chat: dict | None,
+        max_wait_time: int,
+) -> float:
+    """
+    Quotes all amounts on a prepared page and alerts if the highest arbitrage is above min_arbitrage.
+
+    :return: Highest arbitrage quoted
+    """
+    url = page.url
 
     all_arbs = {}
     for amount in amounts:
         amount = float(amount)
 
-        in_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[1]/div[2]/div/div/input'
-        try:
-            in_field = WebDriverWait(driver, max_wait_time).until(ec.element_to_be_clickable((By.XPATH, in_xpath)))
-
-        except Exception:
+        # Enter the amount and wait for the quote in one driver round trip
+        start = perf_counter()
+        received = page.quote_amount(amount, max_wait_time)
+        latency = perf_counter() - start
+        quote_latency.observe(latency, route=f"{token_name}:{src_network_name}->{token_name}:{dest_network_name}")
+        for chain in {src_network_name, dest_network_name}:
+            chain_latency.observe(latency, chain=chain)
+        if received is None:
             log_error.warning(f"{src_network_name} -> {dest_network_name}, {token_name}. AmountIn Error")
             raise SynapseFrontEndExc
 
-        # Clear the entire field
-        in_field.send_keys(Keys.CONTROL + "a")
-        in_field.send_keys(Keys.DELETE)
-        in_field.send_keys(Keys.COMMAND + "a")
-        in_field.send_keys(Keys.DELETE)
-        # Fill in swap amount
-        in_field.send_keys(amount)
-
-        timeout = time.time() + 20
-        out_xpath = '//*[@id="__next"]/div/div[1]/div[3]/main/div/div[2]/div[1]/div[2]/div/div[2]/div[2]/div/div/input'
-        while True:
-            try:
-                out_field = WebDriverWait(driver, max_wait_time).until(ec.presence_of_element_located((By.XPATH, out_xpath)))
-            except Exception:
-                log_error.warning(f"{src_network_name} -> {dest_network_name}, {token_name}. AmountIn Error")
-                raise SynapseFrontEndExc
-
-            received = out_field.get_attribute("value")
-            if received != "" or time.time() > timeout:
-                break
-
         try:
             received = float(received.replace(",", ""))
         except ValueError:
@@ -173,20 +320,20 @@ def query_synapse(
     # Get highest arbitrage details
     message, ter_msg, amount_in = all_arbs[highest_arb]
 
-    log_arbitrage.debug(ter_msg)
+    extra = {"route": f"{token_name}:{src_network_name}->{dest_network_name}", "amount": amount_in}
+    log_arbitrage.debug(ter_msg, extra=extra)
 
     if highest_arb >= min_arbitrage:
 
-        telegram_send_msg(message, telegram_chat_id=CHAT_ID_ALERTS)
+        telegram_enqueue_msg(message, telegram_chat_id=get_env("CHAT_ID_ALERTS"))
 
         # If special chat required, send telegram msg to it
         if special_chat:
             if float(special_chat['max_swap_amount']) >= float(amount_in) and token_name.upper() in special_chat['coins']:
-                telegram_send_msg(message, telegram_chat_id=CHAT_ID_SPECIAL)
+                telegram_enqueue_msg(message, telegram_chat_id=get_env("CHAT_ID_SPECIAL"))
 
-        log_arbitrage.info(ter_msg)
+        log_arbitrage.info(ter_msg, extra=extra)
         timestamp = datetime.now().astimezone().strftime(time_format)
         print(f"{timestamp} - {ter_msg}")
 
-    else:
-        return None
+    return highest_arb
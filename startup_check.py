@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+
+import os
+import re
+import sys
+from subprocess import run
+from argparse import ArgumentParser
+
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules the API bot must never import on start
+forbidden_modules = ["selenium", "webdriver_manager"]
+
+
+# Create CLI interface
+parser = ArgumentParser(
+    usage="./%(prog)s [-b budget]\n",
+    description="Measures the import time of 'api.py' with 'python3 -X importtime' and fails if it exceeds "
+                "the budget or imports selenium.",
+)
+parser.add_argument(
+    "-b",
+    "--budget",
+    action="store",
+    default=0.5,
+    type=float,
+    help="Max secs all imports of 'api.py' may take. Default is 0.5 secs."
+)
+parser.add_argument(
+    "-t",
+    "--top",
+    action="store",
+    default=10,
+    type=int,
+    help="Number of slowest top level imports to print. Default is 10."
+)
+
+
+def import_times(script: str) -> list:
+    """
+    Imports a script's modules, without running it, and returns its import times.
+
+    :param script: Path of script that exits on '--version' before doing any work
+    :return: List of (module name, cumulative microsecs, is top level import)
+    """
+    process = run([sys.executable, "-X", "importtime", script, "--version"],
+                  capture_output=True, text=True, cwd=PROJECT_ROOT_DIR)
+
+    times = []
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            times.append((match.group(4), int(match.group(2)), len(match.group(3)) == 1))
+
+    return times
+
+
+args = parser.parse_args()
+times = import_times("api.py")
+
+top_level = sorted([(name, cumulative) for name, cumulative, top in times if top], key=lambda x: -x[1])
+total = sum(cumulative for _, cumulative in top_level) / 1_000_000
+imported = {name for name, _, _ in times}
+forbidden = [name for name in forbidden_modules if name in imported]
+
+for name, cumulative in top_level[:args.top]:
+    print(f"{cumulative / 1000:>10,.1f} ms  {name}")
+print(f"\nTotal import time: {total:,.3f} secs, budget: {args.budget:,.3f} secs.")
+
+if forbidden:
+    sys.exit(f"api.py imports {', '.join(forbidden)}.")
+if total > args.budget:
+    sys.exit(f"api.py import time is over budget.")
@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.api.backtest import (
+    ladder_arbs,
+    select_arbs,
+    count_alerts,
+)
+from src.api.rpc import select_arb
+
+nan = np.nan
+
+
+def test_ladder_arbs_without_ladder_end_at_first_failure_unless_searching():
+    amounts = np.array([[1000, 2000, 3000], [1000, 2000, 3000], [1000, 2000, nan]])
+    arbs = np.array([[1, nan, 3], [1, nan, 3], [1, 2, nan]])
+
+    result = ladder_arbs(amounts, arbs, search=np.array([False, True, False]))
+
+    np.testing.assert_array_equal(result, [[1, nan, nan], [1, 3, nan], [1, 2, nan]])
+    np.testing.assert_array_equal(ladder_arbs(amounts, arbs)[1], [1, nan, nan])
+
+
+def test_ladder_arbs_take_ladder_amounts_until_one_failed_or_missing():
+    amounts = np.array([[1000, 2000, 3000], [1000, 3000, nan], [1000, 2000, 3000]])
+    arbs = np.array([[1, 2, 3], [1, 3, nan], [nan, 2, 3]])
+
+    result = ladder_arbs(amounts, arbs, ladder=[3000, 1000])
+
+    np.testing.assert_array_equal(result, [[3, 1], [3, 1], [3, nan]])
+    np.testing.assert_array_equal(ladder_arbs(amounts, arbs, ladder=[2000, 3000])[1], [nan, nan])
+
+
+def test_select_arbs_matches_select_arb():
+    rng = np.random.default_rng(0)
+    arbs = np.round(rng.normal(0, 10, size=(200, 4)), 2)
+    arbs[rng.random(arbs.shape) < 0.2] = nan
+    arbs = ladder_arbs(np.zeros(arbs.shape), arbs)
+    stable = rng.random(len(arbs)) < 0.5
+
+    selected = select_arbs(arbs, stable)
+
+    for row, is_stable, arb in zip(arbs, stable, selected):
+        data = select_arb({value: None for value in row[~np.isnan(row)]}, is_stable)
+        assert (np.isnan(arb) and data is None) or arb == data[0]
+
+
+def test_count_alerts_applies_cooldown_per_materiality_bucket():
+    route = np.array([0, 0, 0, 0, 1, 0])
+    ts = np.array([0, 10, 20, 400, 10, 30])
+    arb = np.array([30, 31, 40, 31, 30, 29])
+
+    alerts = count_alerts(route, ts, arb, threshold=30, cooldown=300, materiality=0.2)
+
+    # 31 rounds to 30's bucket within the cooldown, 40 moved by more than 6, route 1 is alerted on its own
+    np.testing.assert_array_equal(alerts, [True, False, True, True, True, False])
+    np.testing.assert_array_equal(count_alerts(route, ts, arb, threshold=30, cooldown=0), arb >= 30)
@@ -0,0 +1,45 @@
+import os
+
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from src.bench.mock import (
+    MockSettings,
+    start_mock_servers,
+)
+from src.bench.runner import (
+    bench_decimals,
+    run_scales,
+)
+
+
+@pytest.fixture(scope="module")
+def mock_servers():
+    process, bridge_api, telegram_api = start_mock_servers(MockSettings(latency=0.01, jitter=0,
+                                                                        decimals=bench_decimals()))
+    previous = os.environ.get("TELEGRAM_API")
+    # Scans run in child processes, which read the Telegram api from the environment
+    os.environ["TELEGRAM_API"] = telegram_api
+    yield bridge_api
+    process.terminate()
+    if previous is None:
+        del os.environ["TELEGRAM_API"]
+    else:
+        os.environ["TELEGRAM_API"] = previous
+
+
+def test_throughput_is_not_capped_by_the_rate_limiter(mock_servers):
+    with TemporaryDirectory() as work_dir:
+        result, = run_scales([100], mock_servers, work_dir, loops=2)
+
+    assert result['failed'] == 0
+    # The client's default limit is 100 requests per sec per endpoint
+    assert result['rps'] > 200
+
+
+def test_max_rps_limits_throughput(mock_servers):
+    with TemporaryDirectory() as work_dir:
+        result, = run_scales([20], mock_servers, work_dir, loops=2, max_rps=20)
+
+    assert result['rps'] < 30
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+from src.api.engine import admit_batch
+from src.common.scheduler import RouteScheduler
+from src.common.breaker import (
+    CLOSED,
+    OPEN,
+    HALF_OPEN,
+    BreakerRegistry,
+)
+
+
+def test_opens_after_consecutive_failures():
+    registry = BreakerRegistry(failures=3, backoff=30)
+    for _ in range(2):
+        registry.record("a", False)
+    registry.record("a", True)
+    for _ in range(2):
+        registry.record("a", False)
+    assert registry.get("a").state == CLOSED
+
+    registry.record("a", False)
+    assert registry.get("a").state == OPEN
+    assert not registry.allow("a")
+    assert 29 < registry.get("a").retry_in() <= 30
+
+
+def test_lets_one_probe_through_after_backoff():
+    registry = BreakerRegistry(failures=1, backoff=0)
+    registry.record("a", False)
+
+    assert registry.allow("a")
+    assert registry.get("a").state == HALF_OPEN
+
+    registry.record("a", True)
+    assert registry.get("a").state == CLOSED
+
+
+def test_failed_probe_doubles_backoff_up_to_max():
+    registry = BreakerRegistry(failures=1, backoff=10, max_backoff=15)
+    breaker = registry.get("a")
+    registry.record("a", False)
+
+    for backoff in (15, 15):
+        breaker.open_until = 0
+        assert registry.allow("a")
+        registry.record("a", False)
+        assert breaker.state == OPEN
+        assert breaker.backoff == backoff
+
+    registry.record("a", True)
+    assert breaker.backoff == 10
+
+
+def test_notifies_when_opened_and_closed():
+    changes = []
+    registry = BreakerRegistry(failures=2, backoff=0, on_change=lambda key, breaker: changes.append(breaker.state))
+    registry.record("a", False)
+    registry.record("a", False)
+    registry.record("a", False)
+    registry.record("a", True)
+    registry.record("a", True)
+
+    assert changes == [OPEN, CLOSED]
+    assert registry.tripped() == {}
+
+
+def test_admit_batch_only_takes_probes_of_polled_routes():
+    routes = {"a": SimpleNamespace(chains=["1", "2"]), "b": SimpleNamespace(chains=["1", "3"])}
+    scheduler = RouteScheduler()
+    for key in routes:
+        scheduler.add(key, min_arb=10)
+    route_breakers = BreakerRegistry(failures=1, backoff=0)
+    chain_breakers = BreakerRegistry(failures=1, backoff=30)
+    # Route a may be probed, but its chain 2 is open
+    route_breakers.record("a", False)
+    chain_breakers.record("2", False)
+
+    assert admit_batch(scheduler.next_batch(), routes, scheduler, route_breakers, chain_breakers) == ["b"]
+    assert route_breakers.get("a").state == OPEN
+    assert scheduler.routes["a"].due is not None
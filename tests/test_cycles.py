@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+from src.api.cycles import (
+    QuoteGraph,
+    rotate_cycle,
+)
+
+
+def route(chain_in: str, chain_out: str, token: str = "USDC") -> SimpleNamespace:
+    return SimpleNamespace(name_in=chain_in, token_in=token, name_out=chain_out, token_out=token,
+                           min_arb=10, coin=token)
+
+
+def quote(graph: QuoteGraph, chain_in: str, chain_out: str, amount_out: float, amount_in: float = 1000) -> None:
+    graph.update(route(chain_in, chain_out), (amount_out - amount_in, (amount_in, amount_out)))
+
+
+def test_finds_profitable_cycle():
+    graph = QuoteGraph()
+    quote(graph, "Ethereum", "Optimism", 1001)
+    quote(graph, "Optimism", "Base", 1001)
+    quote(graph, "Base", "Ethereum", 1001)
+
+    cycles = graph.detect()
+    assert len(cycles) == 1
+    assert rotate_cycle(cycles[0]) == [("Base", "USDC"), ("Ethereum", "USDC"), ("Optimism", "USDC"),
+                                       ("Base", "USDC")]
+
+
+def test_ignores_losing_and_break_even_cycles():
+    graph = QuoteGraph()
+    quote(graph, "Ethereum", "Optimism", 1001)
+    quote(graph, "Optimism", "Ethereum", 998)
+    quote(graph, "Ethereum", "Base", 1000)
+    quote(graph, "Base", "Ethereum", 1000)
+
+    assert graph.detect() == []
+
+
+def test_only_searches_from_updated_edges():
+    graph = QuoteGraph()
+    quote(graph, "Ethereum", "Optimism", 1001)
+    quote(graph, "Optimism", "Ethereum", 1001)
+    assert len(graph.detect()) == 1
+
+    # Same quotes again, nothing got cheaper so there is nothing new to find
+    quote(graph, "Ethereum", "Optimism", 1001)
+    assert graph.detect() == []
+
+
+def test_failed_quote_drops_edge():
+    graph = QuoteGraph()
+    quote(graph, "Ethereum", "Optimism", 1001)
+    graph.update(route("Ethereum", "Optimism"), None)
+
+    assert len(graph) == 0
+
+
+def test_find_cycle_skips_excluded_edges():
+    graph = QuoteGraph()
+    quote(graph, "Ethereum", "Optimism", 1001)
+    quote(graph, "Optimism", "Ethereum", 1001)
+    sources = {("Ethereum", "USDC")}
+
+    assert graph.find_cycle(sources, set()) is not None
+    assert graph.find_cycle(sources, {(("Optimism", "USDC"), ("Ethereum", "USDC"))}) is None
+
+
+def test_trace_cycle_returns_nodes_in_trading_order():
+    previous = {"b": "a", "c": "b", "a": "c", "d": "c"}
+
+    assert QuoteGraph.trace_cycle("d", previous) == ["c", "a", "b", "c"]
+    assert QuoteGraph.trace_cycle("c", {"c": "b", "b": "a"}) is None
@@ -0,0 +1,43 @@
+from time import sleep
+
+from src.api.dedupe import AlertDeduplicator
+
+
+def test_arbitrages_within_a_materiality_step_share_an_id():
+    deduplicator = AlertDeduplicator(materiality=0.2)
+
+    # Steps of 0.2 * 50 = 10
+    first = deduplicator.arb_id("Ethereum", "Optimism", "USDC", 100, min_arb=50)
+    assert deduplicator.arb_id("Ethereum", "Optimism", "USDC", 104, min_arb=50) == first
+    assert deduplicator.arb_id("Ethereum", "Optimism", "USDC", 112, min_arb=50) != first
+    assert deduplicator.arb_id("Ethereum", "Arbitrum", "USDC", 100, min_arb=50) != first
+
+
+def test_suppresses_id_until_cooldown_passed():
+    deduplicator = AlertDeduplicator(cooldown=0.05)
+
+    assert deduplicator.should_alert("a")
+    assert not deduplicator.should_alert("a")
+    assert deduplicator.should_alert("b")
+    assert deduplicator.suppressed == 1
+
+    sleep(0.06)
+    assert deduplicator.should_alert("a")
+    assert set(deduplicator.sent) == {"a"}
+
+
+def test_zero_cooldown_disables_suppression():
+    deduplicator = AlertDeduplicator(cooldown=300)
+    deduplicator.configure(cooldown=0, materiality=0.2)
+
+    assert deduplicator.should_alert("a")
+    assert deduplicator.should_alert("a")
+
+
+def test_oldest_ids_are_evicted_over_max_size():
+    deduplicator = AlertDeduplicator(max_size=2)
+    for arb_id in "abc":
+        assert deduplicator.should_alert(arb_id)
+
+    assert list(deduplicator.sent) == ["b", "c"]
+    assert deduplicator.should_alert("a")
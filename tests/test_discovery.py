@@ -0,0 +1,73 @@
+import json
+
+from time import time
+
+import pytest
+
+from src.api import discovery
+from src.api.discovery import (
+    discover_routes,
+    load_route_index,
+    prune_args,
+)
+from src.api.helpers import parse_args
+from src.bench.runner import bench_config
+
+
+@pytest.fixture
+def routes():
+    return parse_args(bench_config(4, "http://127.0.0.1:1/estimate_bridge_output"))[:4]
+
+
+@pytest.fixture
+def probed(monkeypatch):
+    probes = []
+
+    def probe_route(route, timeout):
+        probes.append(route.key)
+        # Synapse supports routes to Optimism only, and could not be reached for BSC
+        return {10: True, 56: None}.get(route.chain_id_out, False)
+
+    # The token networks api is unavailable, so every unknown route is probed
+    monkeypatch.setattr(discovery, "get_token_networks", lambda coin: None)
+    monkeypatch.setattr(discovery, "probe_route", probe_route)
+    yield probes
+
+
+def test_routes_are_probed_once_within_ttl(tmp_path, routes, probed):
+    path = str(tmp_path / "routes.json")
+
+    index = discover_routes(routes, ttl=60, path=path)
+
+    assert index == {routes[0].discovery_key: True, routes[1].discovery_key: False,
+                     routes[3].discovery_key: False}
+    assert len(probed) == 4
+
+    # Only the route whose support is unknown is probed again
+    assert discover_routes(routes, ttl=60, path=path) == index
+    assert probed[4:] == [routes[2].key]
+
+
+def test_expired_or_other_api_index_is_ignored(tmp_path, routes):
+    path = str(tmp_path / "routes.json")
+    bridge_api = list(routes[0].bridge_api)
+    with open(path, 'w') as file:
+        file.write(json.dumps({'bridge_api': bridge_api, 'routes': {"a": [True, time() - 100], "b": [False, time()]}}))
+
+    assert load_route_index(bridge_api, ttl=60, path=path) == {"b": (False, pytest.approx(time(), abs=5))}
+    assert load_route_index(["http://other"], ttl=60, path=path) == {}
+
+
+def test_token_networks_decide_without_probing(tmp_path, monkeypatch, routes, probed):
+    monkeypatch.setattr(discovery, "get_token_networks", lambda coin: [{"chainId": 1}, {"chainId": "25"}])
+
+    index = discover_routes(routes, ttl=0, path=str(tmp_path / "routes.json"))
+
+    assert [index[route.discovery_key] for route in routes] == [False, True, False, False]
+    assert probed == []
+
+
+def test_prune_args_keeps_routes_of_unknown_support(routes):
+    index = {routes[0].discovery_key: True, routes[1].discovery_key: False}
+
+    assert prune_args(routes, index) == ([routes[0], routes[2], routes[3]], [routes[1]])
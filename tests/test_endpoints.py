@@ -0,0 +1,102 @@
+from time import (
+    sleep,
+    monotonic,
+)
+
+import pytest
+from requests import Response
+from requests.exceptions import ConnectionError
+
+from src.api.endpoints import BridgeClient
+
+
+def response_from(url: str) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.url = url
+    return response
+
+
+@pytest.fixture
+def client():
+    client = BridgeClient(min_samples=2, failures=2, eject_time=10, max_eject_time=30)
+    yield client
+    client.close()
+
+
+def warm(client: BridgeClient, url: str, latency: float) -> None:
+    endpoint = client.endpoint(url)
+    for _ in range(2):
+        endpoint.in_flight += 1
+        client.record(endpoint, latency, eject=True)
+
+
+def test_selects_lowest_latency_for_its_load(client):
+    warm(client, "a", 0.1)
+    warm(client, "b", 0.05)
+
+    assert client.select(("a", "b")).url == "b"
+    assert client.select(("a", "b"), exclude=client.endpoint("b")).url == "a"
+
+    client.endpoint("b").in_flight = 2
+    assert client.select(("a", "b")).url == "a"
+
+
+def test_slow_request_is_hedged_to_next_endpoint(monkeypatch, client):
+    warm(client, "a", 0.01)
+    warm(client, "b", 0.02)
+
+    def send(endpoint, params, timeout, eject=True):
+        # The fastest endpoint on record stalls
+        sleep(0.5 if endpoint.url == "a" else 0.01)
+        return response_from(endpoint.url)
+
+    monkeypatch.setattr(client, "send", send)
+
+    assert client.get(("a", "b"), {}, timeout=3).url == "b"
+
+
+def test_failed_request_fails_over_without_hedging(monkeypatch, client):
+    client.hedge = False
+    warm(client, "a", 0.01)
+    warm(client, "b", 0.02)
+
+    def send(endpoint, params, timeout, eject=True):
+        if endpoint.url == "a":
+            raise ConnectionError("refused")
+        return response_from(endpoint.url)
+
+    monkeypatch.setattr(client, "send", send)
+
+    assert client.get(("a", "b"), {}, timeout=3).url == "b"
+
+
+def test_failing_endpoint_is_ejected_with_backoff(client):
+    endpoint = client.endpoint("a")
+    client.endpoint("b")
+
+    for _ in range(2):
+        endpoint.in_flight += 1
+        client.record(endpoint, None, eject=True)
+    assert endpoint.ejected_until - monotonic() == pytest.approx(10, abs=1)
+    assert client.select(("a", "b")).url == "b"
+
+    # Failing again on return doubles the ejection, up to max_eject_time
+    for ejection in (20, 30):
+        endpoint.ejected_until = 0
+        endpoint.in_flight += 1
+        client.record(endpoint, None, eject=True)
+        assert endpoint.ejected_until - monotonic() == pytest.approx(ejection, abs=1)
+
+    # A success resets the backoff
+    endpoint.ejected_until = 0
+    warm(client, "a", 0.01)
+    assert (endpoint.failures, endpoint.ejections) == (0, 0)
+
+
+def test_all_ejected_still_uses_first_to_return(client):
+    client.endpoint("a").ejected_until = monotonic() + 20
+    client.endpoint("b").ejected_until = monotonic() + 10
+
+    assert client.select(("a", "b")).url == "b"
+    assert client.select(("a", "b"), exclude=client.endpoint("b")) is None
@@ -0,0 +1,42 @@
+from src.api.shard import HashRing
+
+
+keys = [f"USDC:Chain{index}->Chain{index + 1}" for index in range(1000)]
+
+
+def test_empty_ring_owns_nothing():
+    ring = HashRing()
+
+    assert ring.node("key") is None
+    assert len(ring) == 0
+
+
+def test_assigns_every_key_to_one_node():
+    ring = HashRing(nodes=[0, 1, 2])
+    assignment = ring.assign(keys)
+
+    assert sorted(key for node_keys in assignment.values() for key in node_keys) == sorted(keys)
+    assert set(assignment) == {0, 1, 2}
+    # Spread evenly enough that no node takes twice its share
+    assert max(len(node_keys) for node_keys in assignment.values()) < 2 * len(keys) / 3
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing(nodes=[0, 1, 2])
+    before = {key: ring.node(key) for key in keys}
+    ring.remove(1)
+    after = {key: ring.node(key) for key in keys}
+
+    assert 1 not in ring
+    assert len(ring) == 2
+    assert all(after[key] == node for key, node in before.items() if node != 1)
+    assert all(after[key] in (0, 2) for key in keys)
+
+
+def test_adding_a_node_back_restores_its_keys():
+    ring = HashRing(nodes=[0, 1, 2])
+    before = {key: ring.node(key) for key in keys}
+    ring.remove(2)
+    ring.add(2)
+
+    assert {key: ring.node(key) for key in keys} == before
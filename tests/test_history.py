@@ -0,0 +1,88 @@
+import sqlite3
+
+from time import sleep
+
+from src.common.history import (
+    QuoteHistory,
+    query_quotes,
+)
+
+
+def test_batch_locked_by_another_writer_is_retried(tmp_path):
+    path = str(tmp_path / "quotes.db")
+    history = QuoteHistory()
+    history.open(path, flush_interval=0.01, busy_timeout=0.05)
+
+    # Another shard's writer holds the database for longer than the busy timeout
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    history.record("USDC:Ethereum->USDC:Optimism", 1000, 1001, 0.1)
+    sleep(0.1)
+    other.execute("COMMIT")
+    other.close()
+    history.close()
+
+    assert len(query_quotes(path)) == 1
+    assert history.written == 1
+
+
+def test_open_creates_missing_directories(tmp_path):
+    path = str(tmp_path / "logs" / "history" / "quotes.db")
+    history = QuoteHistory()
+    history.open(path)
+    history.close()
+
+    assert query_quotes(path) == []
+
+
+def test_quotes_are_written_in_batches(tmp_path, monkeypatch):
+    path = str(tmp_path / "quotes.db")
+    history = QuoteHistory()
+    history.open(path, batch_size=3, flush_interval=10)
+    batches = []
+    write = history.write
+
+    def counted_write(connection, route_ids, batch):
+        batches.append(len(batch))
+        write(connection, route_ids, batch)
+
+    monkeypatch.setattr(history, "write", counted_write)
+
+    for amount in range(7):
+        history.record("USDC:Ethereum->USDC:Optimism", amount, amount + 1, 0.1)
+    history.close()
+
+    assert batches == [3, 3, 1]
+    assert history.written == 7
+
+
+def test_first_observation_of_a_quote_is_kept(tmp_path):
+    path = str(tmp_path / "quotes.db")
+    history = QuoteHistory()
+    history.open(path)
+    history.close()
+
+    connection = sqlite3.connect(path)
+    route_ids = {}
+    history.write(connection, route_ids, [("USDC:Ethereum->USDC:Optimism", 1.0, 1000, 1001, 0.1)])
+    history.write(connection, route_ids, [("USDC:Ethereum->USDC:Optimism", 1.0, 1000, 999, 0.2),
+                                          ("USDC:Ethereum->USDC:Optimism", 1.0, 2000, None, None)])
+    connection.close()
+
+    assert query_quotes(path) == [("USDC:Ethereum->USDC:Optimism", 1.0, 1000, 1001, 0.1),
+                                  ("USDC:Ethereum->USDC:Optimism", 1.0, 2000, None, None)]
+
+
+def test_query_quotes_orders_by_route_then_time(tmp_path):
+    path = str(tmp_path / "quotes.db")
+    history = QuoteHistory()
+    history.open(path)
+    history.close()
+
+    connection = sqlite3.connect(path)
+    history.write(connection, {}, [("b", 3.0, 1000, 1001, 0.1), ("a", 2.0, 1000, 1002, 0.1),
+                                   ("b", 1.0, 1000, 1003, 0.1), ("a", 4.0, 1000, 1004, 0.1)])
+    connection.close()
+
+    assert [quote[:2] for quote in query_quotes(path)] == [("a", 2.0), ("a", 4.0), ("b", 1.0), ("b", 3.0)]
+    assert [quote[:2] for quote in query_quotes(path, route="b", start=1.0, end=3.0)] == [("b", 1.0)]
@@ -0,0 +1,84 @@
+from time import (
+    sleep,
+    monotonic,
+)
+
+import pytest
+
+from src.common import message
+from src.common.message import (
+    TelegramDispatcher,
+    max_message_length,
+    merge_messages,
+)
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    sent = []
+    answers = []
+
+    def post_telegram_msg(message_text, telegram_token, telegram_chat_id, timeout):
+        sent.append((telegram_chat_id, message_text))
+        return answers.pop(0) if answers else (object(), None)
+
+    monkeypatch.setattr(message, "post_telegram_msg", post_telegram_msg)
+    yield sent, answers
+
+
+def test_merge_messages_fit_telegram_limit():
+    messages = ["a" * 2000, "b" * 2000, "c" * 2000]
+
+    digests = merge_messages(messages)
+
+    assert digests == [f"{messages[0]}\n\n{messages[1]}", messages[2]]
+    assert all(len(digest) <= max_message_length for digest in digests)
+    assert merge_messages(["a"]) == ["a"]
+
+
+def test_messages_of_a_chat_within_digest_window_are_sent_as_one(posts):
+    sent, _ = posts
+    dispatcher = TelegramDispatcher(telegram_token="token", digest_window=0.05)
+    for text in "abc":
+        dispatcher.enqueue(text, "1")
+    dispatcher.enqueue("d", "2")
+
+    sleep(0.2)
+    dispatcher.stop()
+
+    assert sorted(sent) == [("1", "a\n\nb\n\nc"), ("2", "d")]
+    assert dispatcher.depth() == 0
+
+
+def test_chat_is_paused_for_retry_after(posts):
+    sent, answers = posts
+    answers.append((None, 30))
+    dispatcher = TelegramDispatcher(telegram_token="token", digest_window=0)
+    dispatcher.enqueue("a", "1")
+
+    sleep(0.2)
+
+    assert sent == [("1", "a")]
+    assert dispatcher.bucket("1").paused_until - monotonic() > 29
+    assert dispatcher.depth() == 1
+    dispatcher.stop(timeout=0)
+
+
+def test_dispatcher_survives_a_failed_send(monkeypatch, posts):
+    sent, _ = posts
+    dispatcher = TelegramDispatcher(telegram_token="token", digest_window=0, sleep_time=0.01)
+    flush = dispatcher.flush
+    failures = [RuntimeError("bug")]
+
+    def failing_flush(force=False):
+        if failures:
+            raise failures.pop()
+        flush(force)
+
+    monkeypatch.setattr(dispatcher, "flush", failing_flush)
+    dispatcher.enqueue("a", "1")
+
+    sleep(0.2)
+    dispatcher.stop()
+
+    assert sent == [("1", "a")]
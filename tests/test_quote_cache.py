@@ -0,0 +1,117 @@
+from time import sleep
+from threading import (
+    Event,
+    Thread,
+)
+
+import pytest
+
+from src.api.rpc import QuoteCache
+
+
+def test_caches_quotes_until_ttl():
+    cache = QuoteCache(ttl=0.05)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return 100
+
+    assert cache.get("key", fetch) == 100
+    assert cache.get("key", fetch) == 100
+    assert len(calls) == 1
+
+    sleep(0.06)
+    assert cache.get("key", fetch) == 100
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_failed_quotes_are_not_cached():
+    cache = QuoteCache(ttl=10)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return None
+
+    assert cache.get("key", fetch) is None
+    assert cache.get("key", fetch) is None
+    assert len(calls) == 2
+
+
+def test_evicts_least_recently_used():
+    cache = QuoteCache(ttl=10, max_size=2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.get("a", lambda: 1)
+    cache.get("c", lambda: 3)
+
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_coalesces_concurrent_fetches():
+    cache = QuoteCache(ttl=0)
+    started = Event()
+    release = Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return 100
+
+    results = []
+    leader = Thread(target=lambda: results.append(cache.get("key", fetch)))
+    leader.start()
+    started.wait(1)
+
+    followers = [Thread(target=lambda: results.append(cache.get("key", fetch))) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    # Followers wait on the leader's request before it is released
+    while cache.stats()["coalesced"] < 4:
+        sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(1)
+
+    assert results == [100] * 5
+    assert len(calls) == 1
+    assert cache.stats() == {"hits": 0, "misses": 1, "coalesced": 4, "size": 0}
+
+
+def test_coalesced_callers_get_the_fetch_exception():
+    cache = QuoteCache()
+    started = Event()
+    release = Event()
+
+    def fetch():
+        started.set()
+        release.wait(1)
+        raise ValueError("failed")
+
+    errors = []
+
+    def get():
+        try:
+            cache.get("key", fetch)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = Thread(target=get)
+    leader.start()
+    started.wait(1)
+    follower = Thread(target=get)
+    follower.start()
+    while cache.stats()["coalesced"] < 1:
+        sleep(0.001)
+    release.set()
+    leader.join(1)
+    follower.join(1)
+
+    assert len(errors) == 2
+    assert cache.in_flight == {}
+    with pytest.raises(ValueError):
+        cache.get("key", fetch)
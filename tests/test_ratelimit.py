@@ -0,0 +1,113 @@
+from time import (
+    monotonic,
+    perf_counter,
+)
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+from requests import Response
+
+from src.api.engine import record_batch
+from src.api.endpoints import retry_after
+from src.api.rpc import throttled_routes
+from src.common.breaker import (
+    CLOSED,
+    BreakerRegistry,
+)
+from src.common.ratelimit import AdaptiveRateLimiter
+from src.common.scheduler import RouteScheduler
+
+
+def response_with(headers: dict) -> Response:
+    response = Response()
+    response.status_code = 429
+    response.headers.update(headers)
+    return response
+
+
+def test_retry_after():
+    assert retry_after(response_with({})) is None
+    assert retry_after(response_with({"Retry-After": "2.5"})) == 2.5
+    assert retry_after(response_with({"Retry-After": "-1"})) == 0
+    assert retry_after(response_with({"Retry-After": "soon"})) is None
+
+    date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 28 < retry_after(response_with({"Retry-After": date})) <= 30
+
+
+def test_acquire_paces_requests_after_burst():
+    limiter = AdaptiveRateLimiter(max_rate=100, burst=0.1)
+    start = perf_counter()
+    for _ in range(15):
+        assert limiter.acquire(timeout=1)
+
+    # 10 requests of burst, the other 5 at 100 per sec
+    assert 0.04 <= perf_counter() - start < 0.5
+
+
+def test_acquire_fails_if_no_slot_within_timeout():
+    limiter = AdaptiveRateLimiter(max_rate=10, burst=0.1)
+
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0.01)
+
+
+def test_throttling_cuts_rate_once_per_cooldown_and_pauses():
+    limiter = AdaptiveRateLimiter(max_rate=100, min_rate=30, decrease=0.5, cooldown=10)
+    limiter.record_throttled(retry_after=5)
+    limiter.record_throttled()
+
+    assert limiter.rate == 50
+    assert limiter.paused(monotonic())
+    assert not limiter.paused(monotonic() + 6)
+
+    limiter.decreased = 0
+    limiter.record_throttled()
+    assert limiter.rate == 30
+
+
+def test_success_raises_rate_up_to_max():
+    limiter = AdaptiveRateLimiter(max_rate=100, increase=50)
+    limiter.set_rate(10)
+    limiter.record_success()
+    assert limiter.rate == 15
+
+    for _ in range(100):
+        limiter.record_success()
+    assert limiter.rate == 100
+
+
+def test_configure_moves_unthrottled_limiter_to_new_max():
+    limiter = AdaptiveRateLimiter(max_rate=100)
+    limiter.configure(max_rate=500)
+    assert limiter.rate == 500
+
+    limiter.record_throttled()
+    limiter.configure(max_rate=1000)
+    assert limiter.rate == 250
+    limiter.configure(max_rate=100)
+    assert limiter.rate == 100
+
+
+def test_throttled_routes_are_deferred_without_breaker_outcome():
+    routes = {"a": SimpleNamespace(chains=["1"]), "b": SimpleNamespace(chains=["1"])}
+    scheduler = RouteScheduler()
+    for key in routes:
+        scheduler.add(key, min_arb=10)
+    route_breakers = BreakerRegistry(failures=1)
+    chain_breakers = BreakerRegistry(failures=2)
+    throttled_routes.add("a")
+
+    record_batch(scheduler.next_batch(), [(None, None), (None, None)], routes, scheduler, route_breakers,
+                 chain_breakers)
+
+    assert route_breakers.get("a").state == CLOSED
+    assert route_breakers.get("b").state != CLOSED
+    assert chain_breakers.get("1").failure_count == 1
+    assert scheduler.routes["a"].due is not None
+    assert throttled_routes == set()
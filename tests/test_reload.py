@@ -0,0 +1,66 @@
+from threading import Event
+from types import SimpleNamespace
+
+from src.common.scheduler import RouteScheduler
+from src.common.reload import (
+    BackgroundReload,
+    diff_routes,
+    apply_routes,
+    warn_restart_settings,
+)
+
+
+def test_diff_routes():
+    old = {"a": (10, 1), "b": (10, 1), "c": (10, 1)}
+    new = {"b": (10, 1), "c": (20, 1), "d": (10, 1)}
+
+    assert diff_routes(old, new) == (["d"], ["a"], ["c"])
+    assert diff_routes(old, dict(old)) == ([], [], [])
+
+
+def test_apply_routes_keeps_polling_state_of_changed_routes():
+    routes = {"a": SimpleNamespace(min_arb=10, cost=1), "b": SimpleNamespace(min_arb=10, cost=1)}
+    scheduler = RouteScheduler(smoothing=1)
+    for key, route in routes.items():
+        scheduler.add(key, min_arb=route.min_arb, cost=route.cost)
+    scheduler.next_batch()
+    scheduler.update("b", 10)
+
+    new_routes = {"b": SimpleNamespace(min_arb=20, cost=3), "c": SimpleNamespace(min_arb=10, cost=1)}
+    changes = apply_routes(routes, new_routes, scheduler)
+
+    assert changes == (["c"], ["a"], ["b"])
+    assert routes == new_routes
+    assert set(scheduler.routes) == {"b", "c"}
+    assert (scheduler.routes["b"].min_arb, scheduler.routes["b"].cost, scheduler.routes["b"].interval) == (20, 3, 1)
+    assert scheduler.next_batch() == ["c"]
+
+
+def test_warns_about_changed_settings_not_reloaded():
+    old = {"alerts": {"cooldown": 300}, "scheduler": {"max_rps": 100}, "cycles": {}}
+    new = {"alerts": {"cooldown": 60}, "scheduler": {"max_rps": 50}, "breaker": {}}
+
+    assert warn_restart_settings("api.json", old, new, reloaded=("alerts",)) == ["breaker", "cycles", "scheduler"]
+    assert warn_restart_settings("api.json", old, dict(old), reloaded=("alerts",)) == []
+
+
+def test_background_reload_returns_result_once_finished():
+    reload = BackgroundReload()
+    release = Event()
+    reload.submit(lambda: release.wait(1) and {"a": 1})
+
+    assert reload.busy()
+    assert reload.result() is None
+    # Only one reload runs at a time
+    reload.submit(lambda: {"b": 1})
+    release.set()
+    reload.future.result()
+
+    assert not reload.busy()
+    assert reload.result() == {"a": 1}
+    assert reload.result() is None
+
+    reload.submit(lambda: {}["missing"])
+    reload.future.exception()
+    assert reload.result() is None
+    reload.close()
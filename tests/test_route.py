@@ -0,0 +1,28 @@
+import pickle
+
+from src.api.helpers import parse_args
+from src.bench.runner import bench_config
+
+
+def routes():
+    return parse_args(bench_config(2, "http://127.0.0.1:1/estimate_bridge_output"))
+
+
+def test_routes_built_from_same_settings_are_equal_and_hash_alike():
+    first, second = routes(), routes()
+
+    assert first == second
+    assert {*first} == {*second}
+    assert first[0] != first[1]
+    assert pickle.loads(pickle.dumps(first[0])) == first[0]
+    assert isinstance(first[0].amounts, tuple)
+
+
+def test_query_amount_is_an_integer_in_token_units():
+    route = routes()[0]
+    payload, key = route.query(route.amounts[0])
+
+    assert payload['amountFrom'] == route.amounts[0] * route.scale_in
+    assert route.build_query(1.1)[0]['amountFrom'] == int(round(1.1 * route.scale_in))
+    assert type(route.build_query(1.1)[0]['amountFrom']) is int
+    assert key == route.query(route.amounts[0])[1]
@@ -0,0 +1,82 @@
+from time import sleep
+from datetime import timedelta
+
+import pytest
+from requests import Response
+
+from src.api import rpc
+from src.api.endpoints import (
+    RateLimited,
+    RateLimitTimeout,
+)
+from src.api.helpers import parse_args
+from src.bench.runner import bench_config
+
+
+@pytest.fixture
+def route():
+    return parse_args(bench_config(1, "http://127.0.0.1:1/estimate_bridge_output"))[0]
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    quotes = []
+    monkeypatch.setattr(rpc.quote_history, "record", lambda *quote: quotes.append(quote))
+    rpc.throttled_routes.clear()
+    yield quotes
+    rpc.throttled_routes.clear()
+
+
+def response_with(status: int, body: bytes, elapsed: float = 0.01) -> Response:
+    response = Response()
+    response.status_code = status
+    response._content = body
+    response.elapsed = timedelta(seconds=elapsed)
+    return response
+
+
+def test_latency_is_that_of_the_http_exchange(monkeypatch, route, recorded):
+    def get(urls, params, timeout):
+        # Time waiting for the rate limiter or a hedge is not part of the exchange
+        sleep(0.1)
+        return response_with(200, b'{"amountToReceive": "1000"}', elapsed=0.02)
+
+    monkeypatch.setattr(rpc.bridge_client, "get", get)
+
+    payload, _ = route.query(route.amounts[0])
+    assert rpc.request_bridge_quote(route, payload) == 1000
+    assert recorded[0][2:] == (1000 / route.scale_out, 0.02)
+
+
+def test_429_defers_route_without_recording(monkeypatch, route, recorded):
+    def get(urls, params, timeout):
+        raise RateLimited("answered 429", response=response_with(429, b"{}"))
+
+    monkeypatch.setattr(rpc.bridge_client, "get", get)
+
+    payload, _ = route.query(route.amounts[0])
+    assert rpc.request_bridge_quote(route, payload) is None
+    assert rpc.throttled_routes == {route.key}
+    assert recorded == []
+
+
+def test_own_rate_limit_timeout_is_a_failure(monkeypatch, route, recorded):
+    def get(urls, params, timeout):
+        raise RateLimitTimeout("limited to 1 requests per sec")
+
+    monkeypatch.setattr(rpc.bridge_client, "get", get)
+
+    payload, _ = route.query(route.amounts[0])
+    assert rpc.request_bridge_quote(route, payload) is None
+    assert rpc.throttled_routes == set()
+    assert recorded[0][2:] == (None, None)
+
+
+@pytest.mark.parametrize("body", [b'{"error": "no route"}', b'{"amountToReceive": null}',
+                                  b'{"amountToReceive": "n/a"}', b'["no route"]', b'"no route"', b"not json"])
+def test_malformed_responses_fail_the_quote(monkeypatch, route, recorded, body):
+    monkeypatch.setattr(rpc.bridge_client, "get", lambda urls, params, timeout: response_with(200, body))
+
+    payload, _ = route.query(route.amounts[0])
+    assert rpc.request_bridge_quote(route, payload) is None
+    assert recorded[0][2] is None
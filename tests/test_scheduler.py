@@ -0,0 +1,63 @@
+from src.common.scheduler import RouteScheduler
+
+
+def test_new_routes_are_due_immediately():
+    scheduler = RouteScheduler()
+    scheduler.add("a", min_arb=10)
+    scheduler.add("b", min_arb=10)
+
+    assert scheduler.next_batch() == ["a", "b"]
+    assert scheduler.next_batch() == []
+
+
+def test_hot_routes_are_polled_more_often_than_cold_ones():
+    scheduler = RouteScheduler(min_interval=1, max_interval=60, smoothing=1)
+    scheduler.add("hot", min_arb=10)
+    scheduler.add("cold", min_arb=10)
+    scheduler.next_batch()
+
+    assert scheduler.update("hot", 10) == 1
+    assert scheduler.update("cold", 0) == 60
+
+
+def test_failed_poll_keeps_interval():
+    scheduler = RouteScheduler(min_interval=1, max_interval=60, smoothing=1)
+    scheduler.add("a", min_arb=10)
+    scheduler.next_batch()
+    scheduler.update("a", 5)
+
+    assert scheduler.update("a", None) == 30.5
+    assert scheduler.update("a", None, delay=5) == 5
+
+
+def test_request_budget_holds_back_routes():
+    scheduler = RouteScheduler(max_rps=10)
+    scheduler.add("a", min_arb=10, cost=6)
+    scheduler.add("b", min_arb=10, cost=6)
+
+    assert scheduler.next_batch() == ["a"]
+    assert scheduler.next_batch() == []
+    assert 0 < scheduler.wait_time() <= 0.2
+
+
+def test_removed_and_rescheduled_routes_are_skipped():
+    scheduler = RouteScheduler()
+    scheduler.add("a", min_arb=10)
+    scheduler.add("b", min_arb=10)
+    scheduler.remove("a")
+    # Rescheduled before being polled, so its first queue entry is stale
+    scheduler.update("b", None, delay=0)
+
+    assert scheduler.next_batch() == ["b"]
+    assert len(scheduler) == 1
+
+
+def test_configure_route_keeps_polling_state():
+    scheduler = RouteScheduler(smoothing=1)
+    scheduler.add("a", min_arb=10)
+    scheduler.next_batch()
+    scheduler.update("a", 10)
+    scheduler.configure_route("a", min_arb=20, cost=3)
+
+    route = scheduler.routes["a"]
+    assert (route.min_arb, route.cost, route.interval) == (20, 3, 1)
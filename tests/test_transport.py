@@ -0,0 +1,53 @@
+from time import sleep
+from threading import Thread
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+
+from src.api.endpoints import pool_size
+from src.common.transport import (
+    get_session,
+    transport_stats,
+    warm_up,
+)
+
+
+class SlowHeadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self) -> None:
+        # Long enough for concurrent requests to each need their own connection
+        sleep(0.05)
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def test_warm_up_leaves_open_connections_in_the_pool():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHeadHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/estimate_bridge_output"
+
+    try:
+        connects = transport_stats.snapshot()["connects"]
+        warm_up([url, url], connections=4)
+        assert transport_stats.snapshot()["connects"] - connects == 4
+
+        # Requests after warm up reuse the open connections
+        for _ in range(4):
+            get_session().head(url, timeout=1)
+        assert transport_stats.snapshot()["connects"] - connects == 4
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_pool_fits_hedged_requests():
+    assert pool_size(("a",), routes=10, max_in_flight=32, hedge=True) == 10
+    assert pool_size(("a", "b"), routes=10, max_in_flight=32, hedge=False) == 10
+    # Up to 2 * max_in_flight hedge threads send on top of the requests sent directly
+    assert pool_size(("a", "b"), routes=100, max_in_flight=32, hedge=True) == 96
@@ -6,68 +6,173 @@ from pprint import pprint
 from time import sleep, perf_counter
 from datetime import datetime
 from atexit import register
+from signal import (
+    signal,
+    SIGUSR1,
+)
 
-from src.common.message import telegram_send_msg
+from src.common.logger import (
+    log_error,
+    setup_loggers,
+)
+from src.common.scheduler import RouteScheduler
+from src.common.reload import (
+    ConfigWatcher,
+    apply_routes,
+    warn_restart_settings,
+)
+from src.common.profiler import LoopProfiler
+from src.common.metrics import (
+    errors,
+    loop_duration,
+    loop_routes,
+    start_metrics_server,
+)
+from src.common.message import (
+    telegram_send_msg,
+    telegram_enqueue_msg,
+)
 from src.variables import time_format
 
-from src.driver.driver import chrome_driver
+from src.driver.pool import DriverPool
+from src.driver.driver import create_driver
 from src.web.exceptions import exit_handler_driver
 from src.web.price_query import (
+    SynapsePage,
     query_synapse,
     SynapseFrontEndExc,
     SynapseAmountOutExc,
 )
 from src.web.helpers import (
     parse_args_web,
+    route_key,
     print_start_message,
 )
 
 
-if len(sys.argv) != 2:
-    sys.exit(f"Usage: python3 {os.path.basename(__file__)} contracts.json\n")
-
-# Send telegram debug message if program terminates
-program_name = os.path.abspath(os.path.basename(__file__))
-register(exit_handler_driver, chrome_driver, program_name)
+# Sample stacks of every loop and save loops over budget, can also be toggled while running with SIGUSR1
+profile = "--profile" in sys.argv
+files = [arg for arg in sys.argv[1:] if arg != "--profile"]
+if len(files) != 1:
+    sys.exit(f"Usage: python3 {os.path.basename(__file__)} [--profile] contracts.json\n")
 
 # Fetch variables
-with open(sys.argv[-1], 'r') as file:
+with open(files[0], 'r') as file:
     info = json.loads(file.read())
+
+# Write logs from a background thread, set up before exit handlers so it is stopped after them
+setup_loggers(**info['settings'].get('logging', {}))
+
+# Query routes on several Chrome instances in parallel, each opened on first use.
+# Each keeps the dApp loaded between routes and only changes the fields that differ.
+persistent_page = info['settings'].get('persistent_page', True)
+drivers = DriverPool(size=info['settings'].get('drivers', 1),
+                     factory=lambda: SynapsePage(create_driver(), persistent=persistent_page))
+
+# Send telegram debug message if program terminates
+program_name = os.path.abspath(os.path.basename(__file__))
+register(exit_handler_driver, drivers, program_name)
 timestamp = datetime.now().astimezone().strftime(time_format)
 print(f"{timestamp} - Started screening:\n")
 pprint(info)
 
-sleep_time = info['settings']['sleep_time']
 max_wait_time = info['settings']['max_wait_time']
+scheduler_settings = info['settings'].get('scheduler', {})
+metrics_settings = info['settings'].get('metrics', {})
+profiling_settings = info['settings'].get('profiling', {})
+reload_settings = info['settings'].get('reload', {})
+
+# Serve page load and quote latency histograms, error counts and loop timing for Prometheus to scrape
+if metrics_settings.get('enabled', False):
+    start_metrics_server(port=metrics_settings.get('port', 9102), host=metrics_settings.get('host', '127.0.0.1'))
 
 arguments = parse_args_web(info)
 
 print(f"\nScreening {len(arguments)} different network configurations...\n")
 print_start_message(arguments)
 
+# Poll each route at an interval adapted to its recent arbitrage, within a global request budget
+scheduler = RouteScheduler(min_interval=scheduler_settings.get('min_interval', 1),
+                           max_interval=scheduler_settings.get('max_interval', 60),
+                           max_rps=scheduler_settings.get('max_rps', 10))
+profiler = LoopProfiler(budget=profiling_settings.get('budget', 60),
+                        interval=profiling_settings.get('interval', 0.01),
+                        enabled=profile or profiling_settings.get('enabled', False))
+signal(SIGUSR1, profiler.toggle)
+
+routes = {route_key(arg): arg for arg in arguments}
+for key, arg in routes.items():
+    scheduler.add(key, min_arb=arg.min_arb, cost=arg.cost)
+
+# Apply changes to the config file's routes between loops, keeping drivers and their pages open
+watcher = None
+if reload_settings.get('enabled', True):
+    watcher = ConfigWatcher(files[0], interval=reload_settings.get('interval', 2))
+
 telegram_send_msg(f"✅ SYNAPSE_WEB has started.")
 
 loop_counter = 1
 front_end_fails = 0
 while True:
+    new_info = watcher.poll() if watcher is not None else None
+    if new_info is not None:
+        try:
+            new_routes = {route_key(arg): arg for arg in parse_args_web(new_info)}
+            max_wait_time = new_info['settings']['max_wait_time']
+        except (KeyError, TypeError, AttributeError) as e:
+            log_error.warning(f"'ConfigError' - {files[0]} is not a valid config, keeping the running config: {e}")
+        else:
+            added, removed, changed = apply_routes(routes, new_routes, scheduler)
+            warn_restart_settings(files[0], info['settings'], new_info['settings'],
+                                  reloaded=('max_wait_time', 'special_chat'))
+            timestamp = datetime.now().astimezone().strftime(time_format)
+            print(f"{timestamp} - Reloaded {files[0]}: {len(added)} routes added, {len(removed)} removed, "
+                  f"{len(changed)} changed.")
+
+    batch = scheduler.next_batch()
+    if not batch:
+        # Wake up in time to check the config file
+        sleep(min(scheduler.wait_time(), watcher.interval) if watcher is not None else scheduler.wait_time())
+        continue
+
     start = perf_counter()
 
-    for arg in arguments:
+    # Group routes by token, so a page mostly switches the destination network only
+    batch.sort(key=lambda key: routes[key][4])
+    profiler.start_loop()
+    if profiler.enabled:
+        futures = [drivers.submit(profiler.timed(key, query_synapse), *routes[key], max_wait_time) for key in batch]
+    else:
+        futures = drivers.map(query_synapse, [routes[key] + [max_wait_time] for key in batch])
+    for key, future in zip(batch, futures):
+        arbitrage = None
         try:
-            query_synapse(*arg, max_wait_time)
+            arbitrage = future.result()
 
         except SynapseFrontEndExc as ex:
+            errors.inc(type="SynapseFrontEndExc")
             front_end_fails += 1
 
             if front_end_fails >= 100:
-                telegram_send_msg(f"SynapseFrontEndExc encountered more than {front_end_fails} times", debug=True)
+                telegram_enqueue_msg(f"SynapseFrontEndExc encountered more than {front_end_fails} times", debug=True)
                 front_end_fails = 0
 
         except SynapseAmountOutExc as ex:
-            pass
+            errors.inc(type="SynapseAmountOutExc")
+
+        scheduler.update(key, arbitrage)
+
+    duration = perf_counter() - start
+    loop_duration.observe(duration)
+    loop_routes.set(len(batch))
+
+    saved = profiler.end_loop(loop_counter, duration)
+    if saved:
+        print(f"Loop {loop_counter} took {duration:,.2f} secs, over its {profiler.budget:,} secs budget. "
+              f"Profile saved to {saved}")
 
-    # Sleep and print loop info
-    sleep(sleep_time)
+    # Print loop info
     timestamp = datetime.now().astimezone().strftime(time_format)
-    print(f"{timestamp} - Loop {loop_counter} executed in {perf_counter() - start} secs.")
+    print(f"{timestamp} - Loop {loop_counter} scanned {len(batch)} routes in {duration} secs "
+          f"on {drivers.size} drivers, {drivers.restarts} restarted so far.")
     loop_counter += 1